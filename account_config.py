@@ -0,0 +1,76 @@
+import os
+import json
+import logging
+from typing import List, Dict, Any
+from db_manager import DEFAULT_ACCOUNT
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_rss_urls(value: Any) -> List[str]:
+    """カンマ区切り文字列またはリストからRSSフィードURLのリストを作成する"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [url.strip() for url in (value or []) if url and url.strip()]
+
+
+def load_accounts() -> List[Dict[str, Any]]:
+    """
+    投稿先アカウントの設定を読み込む。
+    環境変数 ACCOUNTS_FILE が設定されている場合は、そのJSONファイルから複数アカウントを読み込む。
+    未設定の場合は、従来通り BLUESKY_HANDLE / BLUESKY_APP_PASSWORD / RSS_URLS から
+    単一アカウント（名前は "default"）を作成する。
+    ファイルのアカウントには環境変数の認証情報を使わず、bluesky_handle / bluesky_app_password が
+    設定されていないアカウントはスキップする。
+    各アカウントは name, handle, app_password, rss_urls を持つ辞書として返す。
+    """
+    accounts_file = os.getenv("ACCOUNTS_FILE")
+    if not accounts_file:
+        rss_urls = _parse_rss_urls(os.getenv("RSS_URLS"))
+        if not rss_urls:
+            logger.error("環境変数 RSS_URLS が設定されていません。")
+            return []
+        return [{
+            "name": DEFAULT_ACCOUNT,
+            "handle": os.getenv("BLUESKY_HANDLE"),
+            "app_password": os.getenv("BLUESKY_APP_PASSWORD"),
+            "rss_urls": rss_urls,
+        }]
+
+    try:
+        with open(accounts_file, encoding='utf-8') as f:
+            raw_accounts = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"アカウント設定ファイルの読み込みに失敗しました ({accounts_file}): {e}")
+        return []
+
+    if not isinstance(raw_accounts, list):
+        logger.error(f"アカウント設定ファイルの内容がアカウントのリストではありません ({accounts_file})。")
+        return []
+
+    accounts = []
+    seen_names = set()
+    for raw in raw_accounts:
+        if not isinstance(raw, dict):
+            logger.error(f"アカウントの設定がオブジェクトではないため、スキップします: {raw!r}")
+            continue
+        name = raw.get("name")
+        rss_urls = _parse_rss_urls(raw.get("rss_urls"))
+        if not name or name in seen_names:
+            logger.warning(f"アカウント名が未設定または重複しているため、設定をスキップします: {name}")
+            continue
+        if not rss_urls:
+            logger.warning(f"アカウント {name} に rss_urls が設定されていないため、スキップします。")
+            continue
+        if not raw.get("bluesky_handle") or not raw.get("bluesky_app_password"):
+            logger.warning(f"アカウント {name} に bluesky_handle または bluesky_app_password が"
+                           f"設定されていないため、スキップします。")
+            continue
+        seen_names.add(name)
+        accounts.append({
+            "name": name,
+            "handle": raw.get("bluesky_handle"),
+            "app_password": raw.get("bluesky_app_password"),
+            "rss_urls": rss_urls,
+        })
+    return accounts
@@ -0,0 +1,96 @@
+import sys
+import time
+import calendar
+import tempfile
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# 記事を辞書として扱う場合のキー
+ARTICLE_KEYS = ("title", "link", "summary", "content", "published_time", "metadata")
+
+
+class ContentStore:
+    """
+    記事の本文を一時ファイルに書き出し、メモリには参照（オフセットと長さ）だけを保持するストア。
+    一時ファイルはストアが不要になった時点（close、またはガベージコレクション時）に削除される。
+    """
+    __slots__ = ("_file",)
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+
+    def put(self, text: str) -> Tuple[int, int]:
+        """本文を書き出し、読み出し用の参照を返す"""
+        data = text.encode("utf-8")
+        self._file.seek(0, 2)
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset, len(data)
+
+    def get(self, ref: Tuple[int, int]) -> str:
+        """参照から本文を読み出す"""
+        offset, length = ref
+        self._file.seek(offset)
+        return self._file.read(length).decode("utf-8")
+
+    def close(self):
+        self._file.close()
+
+
+class Article:
+    """
+    パイプラインを流れる1件の記事を表す、コンパクトなレコード。
+    __slots__で属性を固定し、フィードURLなど多くの記事で共通する文字列はinternして共有する。
+    本文はContentStoreに書き出して参照だけを保持し、contentにアクセスした時点で読み込む。
+    metadataは記事ページのOpenGraph / Twitterカードの情報（title、description、image）で、ない場合はNone。
+    従来の辞書と同じく article['title'] のようにキーでもアクセスできる。
+    """
+    __slots__ = ("title", "link", "summary", "feed_url", "timestamp", "metadata", "_store", "_content")
+
+    def __init__(self, title: str, link: str, summary: str, content: str,
+                 published_time: Optional[time.struct_time] = None, feed_url: str = "",
+                 store: Optional[ContentStore] = None, metadata: Optional[Dict[str, str]] = None):
+        self.title = title
+        self.link = link
+        self.summary = summary
+        self.feed_url = sys.intern(feed_url)
+        # struct_timeより小さいUNIX時間（UTC）で保持する
+        self.timestamp = calendar.timegm(published_time) if published_time else None
+        self.metadata = metadata or None
+        self._store = store
+        self._content = store.put(content) if store is not None else content
+
+    @property
+    def content(self) -> str:
+        if self._store is None:
+            return self._content
+        return self._store.get(self._content)
+
+    @property
+    def published_time(self) -> Optional[time.struct_time]:
+        if self.timestamp is None:
+            return None
+        return time.gmtime(self.timestamp)
+
+    # 以下は従来の辞書形式の記事と互換にするためのメソッド
+    def __getitem__(self, key: str) -> Any:
+        if key not in ARTICLE_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in ARTICLE_KEYS
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(ARTICLE_KEYS)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> Tuple[str, ...]:
+        return ARTICLE_KEYS
+
+    def __repr__(self) -> str:
+        return f"Article(title={self.title!r}, link={self.link!r})"
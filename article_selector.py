@@ -0,0 +1,59 @@
+import heapq
+import calendar
+import itertools
+from typing import Any, List, Optional, Tuple
+
+
+class TopKSelector:
+    """
+    複数フィードのエントリを到着順に受け取り、発行日時が新しい上位K件だけを保持する選択器。
+    全件を集めてからソートする代わりに、大きさKのヒープで逐次的に選ぶため、
+    メモリ使用量と計算量は新着記事の総数ではなくKに比例する。
+
+    並び順のキーは (発行日時のUNIX時間, 到着順) で、エントリの追加時に一度だけ計算する。
+    発行日時が同じ場合は後から到着したものを新しいとみなすため、
+    安定ソートした結果の末尾K件と同じ記事が選ばれる。
+    発行日時のないエントリには、実行ごとに固定したrun_timestampを使う。
+    """
+
+    def __init__(self, k: Optional[int], run_timestamp: float):
+        if k is not None and k < 0:
+            raise ValueError("k には0以上の値を指定してください。")
+        self.k = k
+        self.run_timestamp = run_timestamp
+        self.seen = 0  # これまでに受け取ったエントリ数
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter = itertools.count()
+
+    def sort_key(self, published_time) -> float:
+        """発行日時（struct_time）から並び順のキーを計算する"""
+        if not published_time:
+            return self.run_timestamp
+        return calendar.timegm(published_time)
+
+    def push(self, item: Any, published_time) -> bool:
+        """エントリを追加する。上位K件に入った場合はTrueを返す"""
+        self.seen += 1
+        entry = (self.sort_key(published_time), next(self._counter), item)
+        if self.k is None or len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if self.k == 0 or entry <= self._heap[0]:
+            return False
+        heapq.heapreplace(self._heap, entry)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def results(self) -> List[Any]:
+        """選ばれたエントリを発行日時の昇順（古いものから新しいもの）で返す"""
+        return [item for _, _, item in sorted(self._heap)]
+
+
+def select_top_k(items_with_times, k: Optional[int], run_timestamp: float) -> List[Any]:
+    """(item, published_time) の列から、発行日時が新しい上位K件を昇順で返す"""
+    selector = TopKSelector(k, run_timestamp)
+    for item, published_time in items_with_times:
+        selector.push(item, published_time)
+    return selector.results()
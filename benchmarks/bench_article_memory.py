@@ -0,0 +1,66 @@
+"""
+記事を辞書で保持する従来の方式と、Articleレコード（本文は一時ファイルに書き出す）の方式で、
+数千件の新着記事を保持したときのピークメモリを比較するベンチマーク。
+
+    python benchmarks/bench_article_memory.py [記事数]
+
+それぞれの方式を別プロセスで実行し、tracemallocのピークとプロセスの最大RSSを表示する。
+"""
+import os
+import sys
+import time
+import resource
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from article_record import Article, ContentStore
+
+CONTENT_SIZE = 20_000  # 1記事あたりの本文の文字数
+FEEDS = 10
+
+
+def _entries(count):
+    for i in range(count):
+        yield {
+            "title": f"記事タイトル {i}",
+            "link": f"https://example.com/articles/{i}",
+            "summary": f"記事 {i} の概要です。" * 5,
+            "content": (f"本文{i} " * (CONTENT_SIZE // 5))[:CONTENT_SIZE],
+            "published_time": time.gmtime(1704067200 + i),
+            "feed_url": f"https://example.com/feed{i % FEEDS}.xml",
+        }
+
+
+def run(mode, count):
+    tracemalloc.start()
+    store = ContentStore()
+    articles = []
+    for entry in _entries(count):
+        if mode == "dict":
+            entry.pop("feed_url")
+            articles.append(entry)
+        else:
+            articles.append(Article(store=store, **entry))
+    articles.sort(key=lambda x: x["published_time"])
+    selected = articles[-20:]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 絞り込んだ記事の本文だけを読み込む
+    total = sum(len(a["content"]) for a in selected)
+    maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{mode:6s} count={count} tracemalloc_peak={peak / 1e6:.1f}MB max_rss={maxrss_kb / 1e3:.1f}MB (selected_chars={total})")
+
+
+def main():
+    if len(sys.argv) > 2:
+        run(sys.argv[1], int(sys.argv[2]))
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for mode in ("dict", "record"):
+        subprocess.run([sys.executable, __file__, mode, str(count)], check=True)
+
+
+if __name__ == "__main__":
+    main()
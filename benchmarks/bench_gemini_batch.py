@@ -0,0 +1,90 @@
+"""
+多数の記事の要約を、対話的な呼び出しで1件ずつ行う方式と、1つのバッチジョブ（Gemini Batch API）で
+まとめて行う方式で、処理にかかる時間とスループットを比較するベンチマーク。
+
+    python benchmarks/bench_gemini_batch.py [記事数] [1回の呼び出しの待ち時間(秒)] [バッチジョブの完了までの時間(秒)]
+
+Gemini APIの代わりに、待ち時間だけを再現するローカルの代役を使う。
+対話的な呼び出しは1件ごとに待ち時間がかかり、バッチジョブは件数によらず完了までの時間がかかる
+（実際のBatch APIでは完了までに数分から最大24時間かかる一方、料金は対話的な呼び出しの半額になる）。
+"""
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("GEMINI_API_KEY", "dummy_key_for_benchmark")
+
+from google.genai import types
+import gemini_processor
+
+SUMMARY = "これは要約の一文目です。二文目で内容を補足します。三文目で締めくくります。"
+# Batch APIの料金は対話的な呼び出しに対してこの割合になる
+BATCH_PRICE_RATIO = 0.5
+
+
+class LocalBatches:
+    """client.batches の代役。ジョブは作成から turnaround 秒後に完了し、すべてのリクエストに応答する"""
+
+    def __init__(self, turnaround):
+        self.turnaround = turnaround
+        self.jobs = {}
+
+    def create(self, model, src, config=None):
+        name = f"batches/{len(self.jobs) + 1}"
+        self.jobs[name] = (time.monotonic() + self.turnaround, src)
+        return types.BatchJob(name=name, state=types.JobState.JOB_STATE_PENDING)
+
+    def get(self, name):
+        done_at, src = self.jobs[name]
+        if time.monotonic() < done_at:
+            return types.BatchJob(name=name, state=types.JobState.JOB_STATE_RUNNING)
+        responses = [
+            types.InlinedResponse(
+                response=types.GenerateContentResponse(candidates=[types.Candidate(
+                    content=types.Content(role="model", parts=[types.Part(text=SUMMARY)])
+                )]),
+                metadata=request["metadata"],
+            )
+            for request in src
+        ]
+        return types.BatchJob(name=name, state=types.JobState.JOB_STATE_SUCCEEDED,
+                              dest=types.BatchJobDestination(inlined_responses=responses))
+
+    def cancel(self, name):
+        pass
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    turnaround = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    contents = [f"記事{i}の本文です。" * 50 for i in range(count)]
+
+    def slow_generate(model, contents, config=None):
+        time.sleep(latency)
+        response = MagicMock()
+        response.text = SUMMARY
+        return response
+
+    with patch.object(gemini_processor.client.models, "generate_content", side_effect=slow_generate):
+        start = time.perf_counter()
+        interactive = [gemini_processor.summarize_article(content) for content in contents]
+        interactive_elapsed = time.perf_counter() - start
+
+    gemini_processor.BATCH_POLL_INTERVAL = min(turnaround / 10, 1.0)
+    start = time.perf_counter()
+    batched = gemini_processor.summarize_articles_batch(contents, batches=LocalBatches(turnaround))
+    batch_elapsed = time.perf_counter() - start
+
+    assert interactive == batched
+    print(f"interactive {count} summaries: {interactive_elapsed:.2f}s ({count / interactive_elapsed:.1f}/s)")
+    print(f"batch       {count} summaries: {batch_elapsed:.2f}s ({count / batch_elapsed:.1f}/s), "
+          f"price x{BATCH_PRICE_RATIO}")
+    # 件数が増えても、バッチジョブの完了までの時間はほぼ一定
+    print(f"break-even: {turnaround / latency:.0f} summaries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+1万件の投稿の埋め込みベクトルをSQLiteに保存した状態で、候補記事との類似度判定にかかる時間を計測するベンチマーク。
+
+    python benchmarks/bench_novelty_index.py [保存するベクトル数] [次元数]
+
+NumPyでまとめて計算するNoveltyIndexと、Pythonのループで1件ずつ計算する方法を比較する。
+"""
+import os
+import sys
+import math
+import time
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db_manager
+import novelty
+
+CANDIDATES = 20
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 768
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_NAME = os.path.join(tmp, "bench.db")
+        novelty.init_novelty()
+
+        stored = rng.standard_normal((count, dim)).astype(np.float32)
+        articles = [{"title": f"posted {i}", "link": f"https://example.com/{i}", "content": ""} for i in range(count)]
+        start = time.perf_counter()
+        novelty.get_embeddings(articles, lambda texts: stored)
+        for i, article in enumerate(articles):
+            novelty.record_posted("bench", article, lambda texts: [], posted_at=i)
+        print(f"store   {count} vectors (dim={dim}, {stored.nbytes / 1e6:.1f}MB): {time.perf_counter() - start:.2f}s")
+
+        candidates = rng.standard_normal((CANDIDATES, dim)).astype(np.float32)
+
+        start = time.perf_counter()
+        index = novelty.NoveltyIndex.load("bench", recent_posts=count)
+        load_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        sims = index.max_similarity(candidates)
+        numpy_elapsed = time.perf_counter() - start
+        print(f"numpy   load={load_elapsed * 1e3:.1f}ms query({CANDIDATES} candidates)={numpy_elapsed * 1e3:.2f}ms")
+
+        posted = [row.tolist() for row in stored]
+        start = time.perf_counter()
+        loop_sims = []
+        for cand in candidates.tolist():
+            cand_norm = math.sqrt(sum(x * x for x in cand))
+            best = -1.0
+            for vec in posted:
+                dot = sum(a * b for a, b in zip(cand, vec))
+                best = max(best, dot / (cand_norm * math.sqrt(sum(x * x for x in vec))))
+            loop_sims.append(best)
+        loop_elapsed = time.perf_counter() - start
+        print(f"python  query({CANDIDATES} candidates)={loop_elapsed * 1e3:.0f}ms (x{loop_elapsed / numpy_elapsed:.0f})")
+        assert np.allclose(sims, loop_sims, atol=1e-4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+長い日本語のテキストを投稿の上限に切り詰める処理について、従来の main.truncate_graphemes と
+post_composer.truncate（上限に達した時点で走査をやめる）の処理時間を比較するベンチマーク。
+
+    python benchmarks/bench_post_composer.py [候補の数] [1候補あたりの文字数]
+
+従来の関数は全体の書記素数を数えてから、全書記素をリストにして切り出す。
+ファセットの生成を含む post_composer.compose_post の処理時間もあわせて表示する。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import grapheme
+import post_composer
+
+SENTENCE = "生成AIの新しいモデルが公開され、日本語の長文の要約性能が大きく向上したと発表された。"
+REPEAT = 3
+
+
+def legacy_truncate_graphemes(text: str, length: int, placeholder: str = "...") -> str:
+    """main.truncate_graphemes の従来の実装"""
+    if grapheme.length(text) <= length:
+        return text
+
+    placeholder_len = grapheme.length(placeholder)
+    keep_len = length - placeholder_len
+    if keep_len < 0:
+        keep_len = 0
+
+    graphemes = list(grapheme.graphemes(text))
+    return "".join(graphemes[:keep_len]) + placeholder
+
+
+def _measure(fn, texts):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    body = (SENTENCE * (size // len(SENTENCE) + 1))[:size]
+    texts = [f"【要約】記事{i} #AI https://example.com/articles/{i}\n\n{body}" for i in range(count)]
+    limit = post_composer.MAX_GRAPHEMES
+
+    legacy = _measure(lambda text: legacy_truncate_graphemes(text, limit), texts)
+    fast = _measure(lambda text: post_composer.truncate(text, limit), texts)
+    composed = _measure(post_composer.compose_post, texts)
+
+    print(f"legacy truncate_graphemes   {count} x {size} chars: {legacy * 1e3:.0f}ms")
+    print(f"post_composer.truncate      {count} x {size} chars: {fast * 1e3:.1f}ms (x{legacy / fast:.0f})")
+    print(f"post_composer.compose_post  {count} x {size} chars: {composed * 1e3:.1f}ms (facets included)")
+
+    short = [f"【要約】記事{i}\n\n{SENTENCE}" for i in range(count)]
+    print(f"short posts legacy={_measure(lambda t: legacy_truncate_graphemes(t, limit), short) * 1e3:.1f}ms "
+          f"truncate={_measure(lambda t: post_composer.truncate(t, limit), short) * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
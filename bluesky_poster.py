@@ -1,83 +1,115 @@
 import os
 import logging
 from atproto import Client, models
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
-def post_thread(posts: List[Dict[str, Any]]) -> bool:
+def post_thread(posts: List[Dict[str, Any]], handle: Optional[str] = None, app_password: Optional[str] = None) -> bool:
     """
     Blueskyにスレッドを投稿する。
     最初の投稿が親投稿となり、以降はリプライとして連結される。
     投稿はテキストとオプションのembedを持つ辞書のリストとして渡される。
+    handle / app_password を省略した場合は環境変数 BLUESKY_HANDLE / BLUESKY_APP_PASSWORD を使う。
     """
     if not posts:
         return False
 
     try:
-        client = Client()
-        client.login(
-            os.getenv("BLUESKY_HANDLE"),
-            os.getenv("BLUESKY_APP_PASSWORD")
+        return bool(send_thread(posts, handle, app_password))
+    except Exception as e:
+        logger.error(f"Blueskyへの投稿中にエラーが発生しました: {e}")
+        return False
+
+
+def create_client(handle: Optional[str] = None, app_password: Optional[str] = None) -> Client:
+    """
+    ログイン済みのクライアントを作成する。
+    handle / app_password を省略した場合は環境変数 BLUESKY_HANDLE / BLUESKY_APP_PASSWORD を使う。
+    """
+    client = Client()
+    client.login(
+        handle or os.getenv("BLUESKY_HANDLE"),
+        app_password or os.getenv("BLUESKY_APP_PASSWORD")
+    )
+    return client
+
+
+def send_post(client: Client, text: str, embed: Any = None,
+              root: Optional[models.ComAtprotoRepoStrongRef.Main] = None,
+              parent: Optional[models.ComAtprotoRepoStrongRef.Main] = None,
+              facets: Optional[List[models.AppBskyRichtextFacet.Main]] = None) -> models.ComAtprotoRepoStrongRef.Main:
+    """
+    1件のポストを投稿し、その参照（URIとCID）を返す。
+    parentを指定した場合はリプライとして投稿する（rootを省略した場合はparentをスレッドのルートとする）。
+    facetsを指定した場合は、リンクやハッシュタグのファセットを付けて投稿する。
+    """
+    if parent is None:
+        post_ref = client.send_post(text=text, embed=embed, facets=facets)
+    else:
+        post_ref = client.send_post(
+            text=text,
+            embed=embed,
+            reply_to=models.AppBskyFeedPost.ReplyRef(parent=parent, root=root or parent),
+            facets=facets
         )
+    return models.ComAtprotoRepoStrongRef.Main(uri=post_ref.uri, cid=post_ref.cid)
+
+
+def send_thread(posts: List[Dict[str, Any]], handle: Optional[str] = None, app_password: Optional[str] = None) -> List[models.ComAtprotoRepoStrongRef.Main]:
+    """
+    post_threadと同様にスレッドを投稿し、投稿した各ポストの参照（URIとCID）のリストを返す。
+    投稿する有効なテキストがない場合は空のリストを返す。
+    エラーは呼び出し元で扱えるよう、例外としてそのまま送出する。
+    """
+    if not posts:
+        return []
+
+    client = create_client(handle, app_password)
 
-        # 親投稿のデータを取得
+    # 親投稿のデータを取得
+    parent_post_data = posts[0]
+    parent_post_text = parent_post_data.get('text', '')
+
+    # 親投稿が空の場合、最初の有効な投稿を親とする
+    if not parent_post_text.strip():
+        logger.warning("親投稿のテキストが空です。投稿をスキップします。")
+        first_valid_post_index = -1
+        for i, post_data in enumerate(posts):
+            if post_data.get('text', '').strip():
+                first_valid_post_index = i
+                break
+        
+        if first_valid_post_index == -1:
+            logger.warning("投稿する有効なテキストがありません。")
+            return []
+
+        # 有効な投稿を先頭に移動
+        posts.insert(0, posts.pop(first_valid_post_index))
         parent_post_data = posts[0]
         parent_post_text = parent_post_data.get('text', '')
 
-        # 親投稿が空の場合、最初の有効な投稿を親とする
-        if not parent_post_text.strip():
-            logger.warning("親投稿のテキストが空です。投稿をスキップします。")
-            first_valid_post_index = -1
-            for i, post_data in enumerate(posts):
-                if post_data.get('text', '').strip():
-                    first_valid_post_index = i
-                    break
-            
-            if first_valid_post_index == -1:
-                logger.warning("投稿する有効なテキストがありません。")
-                return False
-
-            # 有効な投稿を先頭に移動
-            posts.insert(0, posts.pop(first_valid_post_index))
-            parent_post_data = posts[0]
-            parent_post_text = parent_post_data.get('text', '')
-
-        parent_embed = parent_post_data.get('embed')
-        post_ref = client.send_post(text=parent_post_text, embed=parent_embed)
-        logger.info(f"親投稿を投稿しました: {post_ref.uri}")
-
-        # 親投稿の参照を保存
-        parent_ref = models.ComAtprotoRepoStrongRef.Main(uri=post_ref.uri, cid=post_ref.cid)
-        root_ref = parent_ref # スレッドのルートは常に最初の投稿
-
-        # リプライ投稿
-        for i in range(1, len(posts)):
-            reply_data = posts[i]
-            reply_text = reply_data.get('text', '')
-            reply_embed = reply_data.get('embed')
-
-            if not reply_text.strip():
-                continue # 空の投稿はスキップ
-
-            post_ref = client.send_post(
-                text=reply_text,
-                embed=reply_embed,
-                reply_to=models.AppBskyFeedPost.ReplyRef(
-                    parent=parent_ref,
-                    root=root_ref # rootは常に最初の投稿を指す
-                )
-            )
-            logger.info(f"リプライを投稿しました: {post_ref.uri}")
-            # 次のリプライのために、今投稿したものを親とする
-            parent_ref = models.ComAtprotoRepoStrongRef.Main(
-                uri=post_ref.uri,
-                cid=post_ref.cid
-            )
-
-        logger.info("Blueskyへのスレッド投稿に成功しました。")
-        return True
+    parent_embed = parent_post_data.get('embed')
+    parent_ref = send_post(client, parent_post_text, parent_embed)
+    logger.info(f"親投稿を投稿しました: {parent_ref.uri}")
 
-    except Exception as e:
-        logger.error(f"Blueskyへの投稿中にエラーが発生しました: {e}")
-        return False
+    # 親投稿の参照を保存
+    root_ref = parent_ref # スレッドのルートは常に最初の投稿
+    refs = [parent_ref]
+
+    # リプライ投稿
+    for i in range(1, len(posts)):
+        reply_data = posts[i]
+        reply_text = reply_data.get('text', '')
+        reply_embed = reply_data.get('embed')
+
+        if not reply_text.strip():
+            continue # 空の投稿はスキップ
+
+        # rootは常に最初の投稿を指し、次のリプライのために今投稿したものを親とする
+        parent_ref = send_post(client, reply_text, reply_embed, root=root_ref, parent=parent_ref)
+        logger.info(f"リプライを投稿しました: {parent_ref.uri}")
+        refs.append(parent_ref)
+
+    logger.info("Blueskyへのスレッド投稿に成功しました。")
+    return refs
@@ -0,0 +1,131 @@
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from run_control import Deadline
+
+logger = logging.getLogger(__name__)
+
+# 1回のランク付けに渡す記事数のデフォルト値（環境変数 CATCHUP_BATCH_SIZE で変更可能）
+DEFAULT_BATCH_SIZE = 20
+# キャッチアップで投稿する記事数の上限のデフォルト値（環境変数 CATCHUP_MAX_POSTS で変更可能）
+DEFAULT_MAX_POSTS = 3
+
+# 記事のリストを受け取り、重要度順に並べた記事のリストを返す関数（失敗した場合は空のリスト）
+RankFunction = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+def select_finalists(entries: Iterable[Dict[str, Any]], rank_fn: RankFunction,
+                     batch_size: int = DEFAULT_BATCH_SIZE, max_posts: int = DEFAULT_MAX_POSTS,
+                     deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    大量の未処理のエントリから、投稿する上位 max_posts 件を勝ち抜き方式で選ぶ。
+    エントリを先頭から読みながら、前のバッチまでの勝者と合わせて batch_size 件ずつランク付けし、
+    上位 max_posts 件を次のバッチに持ち越す。同時に保持するエントリは batch_size 件までのため、
+    未処理のエントリがいくら多くてもメモリ使用量は一定になる。
+
+    (勝ち残ったエントリ, 敗退したエントリのURL, すべてのエントリを読み終えたかどうか) のタプルを返す。
+    deadline を過ぎた場合は、以降のランク付けを行わずに、その時点の勝者で打ち切る
+    （読んでいないエントリと、ランク付けしていないバッチのエントリは未処理のまま残る）。
+    ランク付けに失敗した場合も、その時点の勝者で打ち切る。失敗したバッチのエントリは敗退として扱わず、
+    未処理のまま残す（一時的な障害で、判定していないエントリを処理済みにしないようにする）。
+    """
+    if max_posts < 1:
+        raise ValueError("max_posts には1以上の値を指定してください。")
+    batch_size = max(batch_size, max_posts + 1)
+
+    finalists: List[Dict[str, Any]] = []
+    eliminated: List[str] = []
+    batch: List[Dict[str, Any]] = []
+    rounds = 0
+
+    def expired():
+        return deadline is not None and deadline.expired()
+
+    def play() -> bool:
+        nonlocal finalists, batch, rounds
+        candidates = finalists + batch
+        ranked = rank_fn(candidates)
+        if not ranked:
+            return False
+        finalists = ranked[:max_posts]
+        kept = {entry["link"] for entry in finalists}
+        eliminated.extend(entry["link"] for entry in candidates if entry["link"] not in kept)
+        batch = []
+        rounds += 1
+        return True
+
+    failed = False
+    for entry in entries:
+        if expired():
+            break
+        batch.append(entry)
+        if len(finalists) + len(batch) >= batch_size and not expired():
+            if not play():
+                failed = True
+                break
+    if batch and not failed and not expired():
+        failed = not play()
+    if failed:
+        logger.warning(f"{rounds + 1}回目のランク付けに失敗したため打ち切りました。"
+                       f"ランク付けしていない{len(batch)}件は未処理のまま残します。")
+        return finalists, eliminated, False
+    if expired():
+        logger.warning(f"締め切りを過ぎたため、{rounds}回目のランク付けまでで打ち切りました。")
+        return finalists, eliminated, False
+    logger.info(f"{rounds}回のランク付けで{len(finalists) + len(eliminated)}件から{len(finalists)}件を選びました。")
+    return finalists, eliminated, True
+
+
+# 記事のリストのリストを受け取り、リストごとに重要度順に並べた記事のリストを返す関数（Gemini のバッチジョブ）
+BatchRankFunction = Callable[[List[List[Dict[str, Any]]]], List[List[Dict[str, Any]]]]
+
+
+def select_finalists_batched(entries: Iterable[Dict[str, Any]], rank_many_fn: BatchRankFunction,
+                             batch_size: int = DEFAULT_BATCH_SIZE, max_posts: int = DEFAULT_MAX_POSTS,
+                             deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    select_finalists をバッチジョブ向けにした版。戻り値は select_finalists と同じ。
+    読んだエントリを batch_size 件ずつの組に分け、すべての組のランク付けを1回の rank_many_fn の呼び出し
+    （1つのバッチジョブ）でまとめて行い、各組の上位 max_posts 件で同じことを1組になるまで繰り返す。
+    バッチジョブの回数はエントリ数の対数で済むが、読んだエントリはすべてメモリに保持する。
+    ランク付けに失敗した組がある場合は、その段で打ち切り、勝者を返さない。判定できた組の敗者だけを敗退とし、
+    失敗した組のエントリと、まだ最後まで勝ち残っていない勝者は未処理のまま残す。
+    """
+    if max_posts < 1:
+        raise ValueError("max_posts には1以上の値を指定してください。")
+    batch_size = max(batch_size, max_posts + 1)
+
+    candidates: List[Dict[str, Any]] = []
+    complete = True
+    for entry in entries:
+        if deadline is not None and deadline.expired():
+            logger.warning(f"締め切りを過ぎたため、読んだ{len(candidates)}件のエントリで打ち切ります。")
+            complete = False
+            break
+        candidates.append(entry)
+    read = len(candidates)
+
+    eliminated: List[str] = []
+    rounds = 0
+    while candidates:
+        groups = [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
+        rankings = list(rank_many_fn(groups) or [])
+        rankings += [[]] * (len(groups) - len(rankings))
+        candidates = []
+        failed = 0
+        for group, ranked in zip(groups, rankings):
+            if not ranked:
+                failed += 1
+                continue
+            winners = ranked[:max_posts]
+            kept = {entry["link"] for entry in winners}
+            eliminated.extend(entry["link"] for entry in group if entry["link"] not in kept)
+            candidates.extend(winners)
+        rounds += 1
+        if failed:
+            logger.warning(f"{rounds}回目のバッチでのランク付けで{len(groups)}組中{failed}組に失敗したため打ち切りました。"
+                           f"判定していない記事は未処理のまま残します。")
+            return [], eliminated, False
+        if len(groups) == 1:
+            break
+    logger.info(f"{rounds}回のバッチでのランク付けで{read}件から{len(candidates)}件を選びました。")
+    return candidates, eliminated, complete
@@ -1,28 +1,70 @@
 import sqlite3
+from typing import Iterable, List
 
 DB_NAME = "rss_cache.db"
 
+# 単一アカウント運用時、およびアカウント指定を省略した場合に使うアカウント名
+DEFAULT_ACCOUNT = "default"
+
+# 一括で存在を確認するURLの最大数（SQLiteのプレースホルダ数の上限を超えないようにする）
+LOOKUP_CHUNK_SIZE = 500
+
 def init_db():
     """データベースを初期化し、テーブルが存在しない場合は作成する"""
     with sqlite3.connect(DB_NAME) as conn:
         cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(articles)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if columns and "account" not in columns:
+            # 旧スキーマ（urlのみ）のテーブルを、アカウントごとに重複管理できる形に移行する
+            cursor.execute("ALTER TABLE articles RENAME TO articles_old")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS articles (
-                url TEXT PRIMARY KEY
+                account TEXT NOT NULL DEFAULT 'default',
+                url TEXT NOT NULL,
+                PRIMARY KEY (account, url)
             )
         """)
+        if columns and "account" not in columns:
+            cursor.execute(
+                "INSERT OR IGNORE INTO articles (account, url) SELECT ?, url FROM articles_old",
+                (DEFAULT_ACCOUNT,)
+            )
+            cursor.execute("DROP TABLE articles_old")
         conn.commit()
 
-def url_exists(url: str) -> bool:
-    """指定されたURLがデータベースに存在するかどうかを確認する"""
+def url_exists(url: str, account: str = DEFAULT_ACCOUNT) -> bool:
+    """指定されたURLがアカウントの処理済み記事としてデータベースに存在するかどうかを確認する"""
     with sqlite3.connect(DB_NAME) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT url FROM articles WHERE url = ?", (url,))
+        cursor.execute("SELECT url FROM articles WHERE account = ? AND url = ?", (account, url))
         return cursor.fetchone() is not None
 
-def add_url(url: str):
-    """新しい記事のURLをデータベースに追加する"""
+def add_url(url: str, account: str = DEFAULT_ACCOUNT):
+    """新しい記事のURLをアカウントの処理済み記事としてデータベースに追加する"""
+    with sqlite3.connect(DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO articles (account, url) VALUES (?, ?)", (account, url))
+        conn.commit()
+
+def add_urls(urls: Iterable[str], account: str = DEFAULT_ACCOUNT):
+    """複数の記事のURLを、1回のトランザクションでアカウントの処理済み記事として追加する"""
     with sqlite3.connect(DB_NAME) as conn:
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO articles (url) VALUES (?)", (url,))
+        cursor.executemany(
+            "INSERT OR IGNORE INTO articles (account, url) VALUES (?, ?)",
+            ((account, url) for url in urls)
+        )
         conn.commit()
+
+def unseen_urls(urls: List[str], account: str = DEFAULT_ACCOUNT) -> List[str]:
+    """URLのリストのうち、アカウントの処理済み記事としてデータベースに存在しないものを元の順序で返す"""
+    seen = set()
+    with sqlite3.connect(DB_NAME) as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(urls), LOOKUP_CHUNK_SIZE):
+            chunk = urls[i:i + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT url FROM articles WHERE account = ? AND url IN ({placeholders})", (account, *chunk))
+            seen.update(row[0] for row in cursor.fetchall())
+    return [url for url in urls if url not in seen]
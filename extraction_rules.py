@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 記事コンテナを探す際に順に試すセレクタ
+CASCADE_SELECTORS = ["article", "main", ".post-content", "#content"]
+# 学習したルールがこの回数連続で失敗したら破棄する
+MAX_CONSECUTIVE_FAILURES = 3
+
+# データベースのパス -> (ドメイン -> 学習したセレクタ)（プロセス内のキャッシュ）
+_rules: Dict[str, Dict[str, str]] = {}
+
+# 今回の実行での統計
+stats = {
+    "rule_hits": 0,        # 学習したルール（または設定のセレクタ）で本文を取得できた回数
+    "rule_failures": 0,    # ルールで本文を取得できず、通常の探索に戻った回数
+    "cascade": 0,          # 通常の探索（CASCADE_SELECTORS）を行った回数
+    "rule_seconds": 0.0,   # ルールで取得できた場合の抽出時間の合計
+    "cascade_seconds": 0.0,  # 通常の探索の抽出時間の合計
+}
+
+
+def init_rules():
+    """ドメインごとの本文抽出ルールのテーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_rules (
+                domain TEXT PRIMARY KEY,
+                selector TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                consecutive_failures INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+
+def _load_rules() -> Dict[str, str]:
+    """使用中のデータベースのルールを返す。データベースごとに初回だけ読み込む"""
+    rules = _rules.get(db_manager.DB_NAME)
+    if rules is None:
+        init_rules()
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT domain, selector FROM extraction_rules")
+            rules = _rules[db_manager.DB_NAME] = dict(cursor.fetchall())
+    return rules
+
+
+def clear_cache():
+    """プロセス内のルールのキャッシュと統計を破棄する（次回の参照時にデータベースから読み直す）"""
+    _rules.clear()
+    reset_stats()
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0.0 if key.endswith("_seconds") else 0
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def override_selector(url: str, feed_url: Optional[str] = None) -> Optional[str]:
+    """
+    環境変数 CONTENT_SELECTORS（JSON）で設定されたセレクタを返す。
+    キーにはフィードURLまたは記事のドメインを指定でき、フィードURLの設定を優先する。
+    """
+    raw = os.getenv("CONTENT_SELECTORS")
+    if not raw:
+        return None
+    try:
+        overrides = json.loads(raw)
+    except ValueError:
+        logger.error("環境変数 CONTENT_SELECTORS のJSONが不正です。")
+        return None
+    return (feed_url and overrides.get(feed_url)) or overrides.get(domain_of(url))
+
+
+def learned_selector(url: str) -> Optional[str]:
+    """記事のドメインについて学習したセレクタを返す"""
+    return _load_rules().get(domain_of(url))
+
+
+def record_hit(url: str, selector: str, elapsed: float):
+    """ルールで本文を取得できたことを記録する"""
+    stats["rule_hits"] += 1
+    stats["rule_seconds"] += elapsed
+    domain = domain_of(url)
+    if _load_rules().get(domain) != selector:
+        return  # 設定のセレクタによる取得は学習の対象外
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE extraction_rules SET hits = hits + 1, consecutive_failures = 0, updated_at = ? WHERE domain = ?",
+            (time.time(), domain)
+        )
+        conn.commit()
+
+
+def record_failure(url: str, selector: str):
+    """ルールで本文を取得できなかったことを記録し、連続して失敗しているルールは破棄する"""
+    stats["rule_failures"] += 1
+    domain = domain_of(url)
+    rules = _load_rules()
+    if rules.get(domain) != selector:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE extraction_rules SET consecutive_failures = consecutive_failures + 1, updated_at = ? WHERE domain = ?",
+            (time.time(), domain)
+        )
+        cursor.execute("SELECT consecutive_failures FROM extraction_rules WHERE domain = ?", (domain,))
+        row = cursor.fetchone()
+        if row and row[0] >= MAX_CONSECUTIVE_FAILURES:
+            cursor.execute("DELETE FROM extraction_rules WHERE domain = ?", (domain,))
+            rules.pop(domain, None)
+            logger.info(f"本文抽出ルールが{row[0]}回連続で失敗したため破棄します: {domain} ({selector})")
+        conn.commit()
+
+
+def record_cascade(url: str, selector: Optional[str], elapsed: float):
+    """
+    通常の探索の結果を記録する。
+    本文を取得できたセレクタがあり、ドメインのルールがまだなければ、そのセレクタをルールとして学習する。
+    既存のルールは、連続して失敗して破棄されるまで置き換えない。
+    """
+    stats["cascade"] += 1
+    stats["cascade_seconds"] += elapsed
+    if not selector:
+        return
+    domain = domain_of(url)
+    rules = _load_rules()
+    if domain in rules:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO extraction_rules (domain, selector, hits, consecutive_failures, updated_at) VALUES (?, ?, 0, 0, ?)",
+            (domain, selector, time.time())
+        )
+        conn.commit()
+    rules[domain] = selector
+    logger.info(f"本文抽出ルールを学習しました: {domain} -> {selector}")
+
+
+def log_stats():
+    """今回の実行でのルールのヒット率と、短縮できた抽出時間の推定値をログに出力する"""
+    lookups = stats["rule_hits"] + stats["rule_failures"]
+    if not lookups and not stats["cascade"]:
+        return
+    hit_rate = stats["rule_hits"] / lookups if lookups else 0.0
+    saved = 0.0
+    if stats["rule_hits"] and stats["cascade"]:
+        cascade_avg = stats["cascade_seconds"] / stats["cascade"]
+        rule_avg = stats["rule_seconds"] / stats["rule_hits"]
+        saved = max(cascade_avg - rule_avg, 0.0) * stats["rule_hits"]
+    logger.info(
+        f"本文抽出ルール: ヒット {stats['rule_hits']}/{lookups}件（{hit_rate:.0%}）, "
+        f"通常の探索 {stats['cascade']}件, 短縮した時間（推定） {saved * 1000:.1f}ms"
+    )
@@ -1,8 +1,13 @@
 import os
+import time
 import logging
 from dotenv import load_dotenv
 from google import genai
-from typing import List, Dict
+from google.genai import types
+import grapheme
+from typing import Any, List, Dict, Optional
+import text_truncation
+import run_control
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -17,32 +22,74 @@ if not os.getenv("GEMINI_API_KEY"):
 # 使用するGeminiのモデル名を取得 (デフォルトは gemma-3-27b-it)
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemma-3-27b-it")
 
+# 記事の類似度計算に使う埋め込みモデル名
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "gemini-embedding-001")
+
+# ランク付け・要約のリクエストのタイムアウト（秒）の上限
+REQUEST_TIMEOUT = 120
+# バッチジョブの完了を確認する間隔（秒）
+BATCH_POLL_INTERVAL = 30
+# バッチジョブの完了を待つ時間の上限（秒）のデフォルト値（環境変数 GEMINI_BATCH_TIMEOUT で変更可能）
+DEFAULT_BATCH_TIMEOUT = 1800
+# バッチジョブの完了を待てる時間がこの秒数未満の場合は、バッチジョブを作成しない
+MIN_BATCH_TIMEOUT = 2 * BATCH_POLL_INTERVAL
+# Batch APIに対応していないモデル名の接頭辞（Gemmaのモデルは対話的な呼び出しだけに対応する）
+BATCH_UNSUPPORTED_MODEL_PREFIXES = ("gemma-",)
+# バッチジョブが終了した（これ以上状態が変わらない）ことを表す状態
+BATCH_DONE_STATES = {
+    types.JobState.JOB_STATE_SUCCEEDED,
+    types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+    types.JobState.JOB_STATE_FAILED,
+    types.JobState.JOB_STATE_CANCELLED,
+    types.JobState.JOB_STATE_EXPIRED,
+}
+
 # クライアントをモジュールレベルで初期化
 # APIキーは環境変数 `GEMINI_API_KEY` から自動的に読み込まれる
 client = genai.Client()
 
-def rank_articles(articles: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    """Gemini APIを使用して記事を重要度順にランク付けする"""
-    if not articles:
-        return []
-
-    # プロンプトの作成
+def _ranking_prompt(articles: List[Dict[str, str]]) -> str:
     prompt_parts = ["以下の記事を重要度が高い順に、番号を付けてリスト化してください。タイトルとURLのみを出力してください。\n"]
     for i, article in enumerate(articles):
         prompt_parts.append(f"{i+1}. {article['title']}\n{article['link']}\n")
+    return "".join(prompt_parts)
+
+
+def _summary_prompt(article_content: str) -> str:
+    return f"以下の文章を、300書記素（約150文字）程度で、日本語3文で簡潔に要約してください。\n\n---\n{article_content}\n---"
 
-    prompt = "".join(prompt_parts)
+
+def _request_config(timeout: Optional[float]) -> Optional[types.GenerateContentConfig]:
+    """timeout（秒）を指定した場合は、リクエストのタイムアウトを設定した生成の設定を返す"""
+    if timeout is None:
+        return None
+    return types.GenerateContentConfig(http_options=types.HttpOptions(timeout=int(timeout * 1000)))
+
+
+def rank_articles(articles: List[Dict[str, str]], timeout: Optional[float] = None) -> List[Dict[str, str]]:
+    """
+    Gemini APIを使用して記事を重要度順にランク付けする。
+    timeout（秒）を指定した場合は、その時間内に応答がなければ失敗として空のリストを返す。
+    """
+    if not articles:
+        return []
 
     try:
         response = client.models.generate_content(
             model=GEMINI_MODEL,
-            contents=prompt
+            contents=_ranking_prompt(articles),
+            config=_request_config(timeout)
         )
         ranked_text = response.text
     except Exception as e:
         logger.error(f"Gemini APIでのランク付け中にエラーが発生しました: {e}")
         return []  # エラー時は空のリストを返す
 
+    return _parse_ranking(ranked_text, articles)
+
+
+def _parse_ranking(ranked_text: str, articles: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """ランク付けの出力を解析し、順序付けられた記事リストを返す"""
     # AIの出力（テキスト）を解析して、順序付けられた記事リストを再構築
     ranked_articles = []
     lines = ranked_text.strip().split('\n')
@@ -74,19 +121,208 @@ def rank_articles(articles: List[Dict[str, str]]) -> List[Dict[str, str]]:
     return ranked_articles
 
 
-def summarize_article(article_content: str) -> str:
-    """Gemini APIを使用して記事を3文で要約する"""
+def summarize_article(article_content: str, max_graphemes: Optional[int] = None,
+                      timeout: Optional[float] = None) -> str:
+    """
+    Gemini APIを使用して記事を3文で要約する。
+    max_graphemes を指定した場合はストリーミングで生成し、書記素数がその値に達した時点で
+    生成を打ち切って、上限内の最後の文末で切り詰めた要約を返す。
+    timeout（秒）を指定した場合は、その時間内に応答がなければ失敗として空文字を返す。
+    """
     if not article_content:
         return ""
 
-    prompt = f"以下の文章を、300書記素（約150文字）程度で、日本語3文で簡潔に要約してください。\n\n---\n{article_content}\n---"
+    prompt = _summary_prompt(article_content)
+
+    if max_graphemes is not None and max_graphemes > 0:
+        return _summarize_streaming(prompt, max_graphemes, timeout)
 
     try:
         response = client.models.generate_content(
             model=GEMINI_MODEL,
-            contents=prompt
+            contents=prompt,
+            config=_request_config(timeout)
         )
         return response.text.strip()
     except Exception as e:
         logger.error(f"Gemini APIでの要約中にエラーが発生しました: {e}")
         return "" # エラー時は空文字を返す
+
+
+def _summarize_streaming(prompt: str, max_graphemes: int, timeout: Optional[float] = None) -> str:
+    """要約をストリーミングで生成し、書記素数が上限に達した時点で生成を打ち切る"""
+    text = ""
+    stream = None
+    try:
+        stream = client.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=_request_config(timeout)
+        )
+        for chunk in stream:
+            text += chunk.text or ""
+            # 上限+1書記素まで数えれば超過を判定できるため、全体は数えない
+            if grapheme.length(text.lstrip(), until=max_graphemes + 1) > max_graphemes:
+                logger.info(f"要約が{max_graphemes}書記素に達したため、生成を打ち切ります。")
+                break
+    except Exception as e:
+        logger.error(f"Gemini APIでの要約中にエラーが発生しました: {e}")
+        return "" # エラー時は空文字を返す
+    finally:
+        # 打ち切った場合にストリーム（HTTP接続）を閉じ、以降のトークンを受信しない
+        close = getattr(stream, "close", None)
+        if callable(close):
+            close()
+
+    return cut_at_sentence_boundary(text.strip(), max_graphemes)
+
+
+def cut_at_sentence_boundary(text: str, max_graphemes: int) -> str:
+    """
+    テキストを max_graphemes 書記素以内に収める。
+    上限を超える場合は上限内の最後の文末（。！？など）で切り、文末がなければ上限で切る。
+    """
+    return text_truncation.truncate(text, max_graphemes)
+
+
+def supports_batch(model: Optional[str] = None) -> bool:
+    """モデル（省略時は GEMINI_MODEL）がBatch APIに対応しているかどうかを返す"""
+    return not (model or GEMINI_MODEL).startswith(BATCH_UNSUPPORTED_MODEL_PREFIXES)
+
+
+def batch_timeout() -> float:
+    """環境変数 GEMINI_BATCH_TIMEOUT から、バッチジョブの完了を待つ時間の上限（秒）を返す"""
+    return float(os.getenv("GEMINI_BATCH_TIMEOUT", DEFAULT_BATCH_TIMEOUT))
+
+
+def generate_batch(prompts: List[str], timeout: Optional[float] = None,
+                   poll_interval: Optional[float] = None, batches: Any = None) -> List[Optional[str]]:
+    """
+    複数のプロンプトを1つのバッチジョブ（Gemini Batch API）で生成し、プロンプトと同じ順序で出力のテキストを返す。
+    各リクエストにはプロンプトの位置をメタデータとして付け、応答の順序に関係なく元のプロンプトに対応付ける。
+    ジョブの完了は poll_interval 秒（省略時は BATCH_POLL_INTERVAL）ごとに確認し、timeout 秒（省略時は batch_timeout()）を過ぎた場合はジョブを取り消す。
+    生成できなかったプロンプトの位置はNoneになる（呼び出し元が対話的な呼び出しで補う）。
+    batches には client.batches と同じ create / get / cancel を持つオブジェクトを指定できる（テスト用）。
+    """
+    results: List[Optional[str]] = [None] * len(prompts)
+    if not prompts:
+        return results
+    batches = batches or client.batches
+    timeout = batch_timeout() if timeout is None else timeout
+    poll_interval = BATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+
+    try:
+        job = batches.create(
+            model=GEMINI_MODEL,
+            src=[{"contents": prompt, "metadata": {"key": str(i)}} for i, prompt in enumerate(prompts)],
+        )
+        logger.info(f"バッチジョブを作成しました（{len(prompts)}件）: {job.name}")
+        give_up_at = time.monotonic() + timeout
+        while job.state not in BATCH_DONE_STATES:
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"バッチジョブが{timeout:.0f}秒以内に完了しなかったため取り消します: {job.name}")
+                batches.cancel(name=job.name)
+                return results
+            time.sleep(min(poll_interval, remaining))
+            job = batches.get(name=job.name)
+    except Exception as e:
+        logger.error(f"Gemini APIのバッチジョブの実行中にエラーが発生しました: {e}")
+        return results
+
+    if job.state != types.JobState.JOB_STATE_SUCCEEDED:
+        logger.warning(f"バッチジョブが{job.state}で終了しました: {job.name}")
+    responses = (job.dest.inlined_responses if job.dest else None) or []
+    for position, item in enumerate(responses):
+        key = (item.metadata or {}).get("key", position)
+        try:
+            index = int(key)
+            if item.error or item.response is None or not (0 <= index < len(prompts)):
+                continue
+            results[index] = item.response.text
+        except Exception as e:
+            logger.warning(f"バッチジョブの応答（{key}）を読み取れませんでした: {e}")
+    done = sum(text is not None for text in results)
+    logger.info(f"バッチジョブで{len(prompts)}件中{done}件を生成しました: {job.name}")
+    return results
+
+
+def _fallback_timeout(deadline: Optional[run_control.Deadline]) -> float:
+    """バッチジョブで処理できなかったものを対話的に処理する際の、リクエストのタイムアウト（秒）を返す"""
+    return REQUEST_TIMEOUT if deadline is None else deadline.timeout(REQUEST_TIMEOUT)
+
+
+def summarize_articles_batch(contents: List[str], max_graphemes: Optional[List[Optional[int]]] = None,
+                             timeout: Optional[float] = None, batches: Any = None,
+                             deadline: Optional[run_control.Deadline] = None) -> List[str]:
+    """
+    複数の記事の要約を1つのバッチジョブでまとめて生成し、contents と同じ順序で返す。
+    max_graphemes には記事ごとの要約の書記素数の上限を指定でき、上限内の最後の文末で切り詰める。
+    バッチジョブで生成できなかった記事は summarize_article で対話的に要約する。失敗した記事や、
+    deadline を過ぎたため対話的に要約しなかった記事は空文字になる。
+    """
+    limits = max_graphemes or [None] * len(contents)
+    targets = [i for i, content in enumerate(contents) if content]
+    outputs = generate_batch([_summary_prompt(contents[i]) for i in targets], timeout, batches=batches)
+
+    summaries = [""] * len(contents)
+    stragglers = skipped = 0
+    for i, text in zip(targets, outputs):
+        if text and text.strip():
+            summary = text.strip()
+            summaries[i] = cut_at_sentence_boundary(summary, limits[i]) if limits[i] else summary
+        elif deadline is not None and deadline.expired():
+            skipped += 1
+        else:
+            stragglers += 1
+            summaries[i] = summarize_article(contents[i], max_graphemes=limits[i],
+                                             timeout=_fallback_timeout(deadline))
+    if stragglers:
+        logger.info(f"バッチジョブで要約できなかった{stragglers}件を個別に要約しました。")
+    if skipped:
+        logger.warning(f"締め切りを過ぎたため、バッチジョブで要約できなかった{skipped}件は要約しませんでした。")
+    return summaries
+
+
+def rank_articles_batch(article_lists: List[List[Dict[str, str]]], timeout: Optional[float] = None,
+                        batches: Any = None,
+                        deadline: Optional[run_control.Deadline] = None) -> List[List[Dict[str, str]]]:
+    """
+    複数の記事リストのランク付けを1つのバッチジョブでまとめて行い、article_lists と同じ順序で返す。
+    バッチジョブでランク付けできなかったリストは rank_articles で対話的にランク付けする
+    （失敗した場合や、deadline を過ぎたため対話的にランク付けしなかった場合は空のリスト）。
+    """
+    targets = [i for i, articles in enumerate(article_lists) if articles]
+    outputs = generate_batch([_ranking_prompt(article_lists[i]) for i in targets], timeout, batches=batches)
+
+    rankings: List[List[Dict[str, str]]] = [[] for _ in article_lists]
+    stragglers = skipped = 0
+    for i, text in zip(targets, outputs):
+        if text:
+            rankings[i] = _parse_ranking(text, article_lists[i])
+        elif deadline is not None and deadline.expired():
+            skipped += 1
+        else:
+            stragglers += 1
+            rankings[i] = rank_articles(article_lists[i], timeout=_fallback_timeout(deadline))
+    if stragglers:
+        logger.info(f"バッチジョブでランク付けできなかった{stragglers}件を個別にランク付けしました。")
+    if skipped:
+        logger.warning(f"締め切りを過ぎたため、バッチジョブでランク付けできなかった{skipped}件はランク付けしませんでした。")
+    return rankings
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Gemini APIを使用して、テキストごとの埋め込みベクトルを1回の呼び出しで取得する"""
+    if not texts:
+        return []
+
+    try:
+        response = client.models.embed_content(
+            model=GEMINI_EMBEDDING_MODEL,
+            contents=texts
+        )
+        return [embedding.values for embedding in response.embeddings]
+    except Exception as e:
+        logger.error(f"Gemini APIでの埋め込み取得中にエラーが発生しました: {e}")
+        return [] # エラー時は空のリストを返す
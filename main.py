@@ -1,74 +1,194 @@
 import os
+import time
 import logging
+import argparse
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
+import account_config
+import catch_up
 import db_manager
 import rss_fetcher
 import gemini_processor
-import bluesky_poster
+import post_composer
+import post_outbox
+import thumbnails
+import run_ledger
+import novelty
+import websub
+import profiling
+import run_control
 import grapheme
-from atproto import models
 from logger_config import setup_logging
 
 # 要約する記事の最大数
 MAX_SUMMARIES = 1
 
+# Blueskyの投稿の最大書記素数
+POST_MAX_GRAPHEMES = post_composer.MAX_GRAPHEMES
+
+# ランク付けの対象とする新着記事の最大数のデフォルト値（環境変数 MAX_CANDIDATES で変更可能）
+DEFAULT_MAX_CANDIDATES = 20
+
+# 途中で失敗した実行を再開する最大回数（超えた場合は記事を処理済みにして断念する）
+MAX_RESUME_ATTEMPTS = 3
+
+# 送信待ちの投稿を実行中に送信する時間の上限（秒）のデフォルト値（環境変数 OUTBOX_DRAIN_SECONDS で変更可能、0で送信しない）
+DEFAULT_OUTBOX_DRAIN_SECONDS = 30
+
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
 def truncate_graphemes(text: str, length: int, placeholder: str = "...") -> str:
     """Truncates a string to a maximum number of graphemes."""
-    if grapheme.length(text) <= length:
-        return text
+    return post_composer.truncate(text, length, max_bytes=None, placeholder=placeholder, prefer_sentence=False)
 
-    placeholder_len = grapheme.length(placeholder)
-    keep_len = length - placeholder_len
-    if keep_len < 0:
-        keep_len = 0
+def _env_flag(name: str) -> bool:
+    """環境変数が有効（true/1/yes）に設定されているかどうかを返す"""
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
 
-    graphemes = list(grapheme.graphemes(text))
-    return "".join(graphemes[:keep_len]) + placeholder
 
-def main():
-    """メインの処理フロー"""
-    # 環境変数を読み込む
-    load_dotenv()
-    # ロギングを設定
-    setup_logging()
+def _give_up_if_exhausted(name: str, error: str, link: Optional[str] = None):
+    """失敗を記録し、再開の試行回数が上限に達した場合は実行を断念して台帳を破棄する"""
+    attempts = run_ledger.record_failure(name, error)
+    if attempts < MAX_RESUME_ATTEMPTS:
+        logger.info(f"[{name}] 次回の実行で途中から再開します（失敗{attempts}回目）。")
+        return
+    logger.error(f"[{name}] {attempts}回失敗したため、この実行を断念します。")
+    if link:
+        # 同じ記事で失敗し続けないよう、処理済みとして登録する
+        db_manager.add_url(link, name)
+    run_ledger.clear(name)
 
-    logger.info("処理を開始します...")
 
-    # 1. データベースの初期化
-    db_manager.init_db()
+def _post_prefix(article: Dict[str, Any]) -> str:
+    return f"【要約】{article['title']}\n\n"
 
-    # 2. RSSフィードのURLを環境変数から取得
-    rss_urls_str = os.getenv("RSS_URLS")
-    if not rss_urls_str:
-        logger.error("環境変数 RSS_URLS が設定されていません。")
-        return
-    rss_urls = [url.strip() for url in rss_urls_str.split(',')]
 
-    # 3. 新しい記事の取得
-    logger.info("新しい記事を取得中...")
-    all_new_articles = rss_fetcher.fetch_new_articles(rss_urls)
+def _gemini_timeout(deadline: Optional[run_control.Deadline]) -> Optional[float]:
+    """Gemini APIのリクエストのタイムアウトを、締め切りまでの残り時間に合わせる"""
+    return None if deadline is None else deadline.timeout(gemini_processor.REQUEST_TIMEOUT)
 
-    if not all_new_articles:
-        logger.info("新しい記事はありませんでした。")
-        return
 
-    # 処理対象の記事を決定（最新20件に絞り込む）
-    articles_to_process = all_new_articles
-    if len(all_new_articles) > 20:
-        logger.info(f"新着記事が{len(all_new_articles)}件見つかりました。最新20件に絞り込みます。")
-        articles_to_process = all_new_articles[-20:]
+def summarize(name: str, article: Dict[str, Any], summaries: Dict[str, str],
+              deadline: Optional[run_control.Deadline] = None) -> str:
+    """
+    記事を要約する。他のアカウントで要約済みの記事は、summariesに保存した要約を再利用する。
+    要約はタイトル部分を除いた残りの書記素数に収まった時点で生成を打ち切る。失敗した場合は空文字を返す。
+    deadline を指定した場合は、要約のリクエストを締め切りまでの残り時間で打ち切る。
+    """
+    summary = summaries.get(article['link'])
+    if summary:
+        logger.info(f"[{name}] 要約済みの記事のため、要約を再利用します。")
+        return summary
+    logger.info(f"[{name}] 記事の要約を生成中: {article['title']}")
+    summary_budget = POST_MAX_GRAPHEMES - grapheme.length(_post_prefix(article))
+    with profiling.stage("summary"):
+        summary = gemini_processor.summarize_article(
+            article['content'], max_graphemes=summary_budget, timeout=_gemini_timeout(deadline)
+        )
+    if summary:
+        summaries[article['link']] = summary
+    return summary
+
+
+def build_posts(article: Dict[str, Any], summary: str) -> List[Dict[str, Any]]:
+    """記事と要約から、アウトボックスに追加する投稿を作成する"""
+    # 投稿テキストを作成し、Blueskyの上限（300書記素・3000バイト）に収めてリンクとハッシュタグのファセットを付ける
+    post = post_composer.compose_post(f"{_post_prefix(article)}{summary}", POST_MAX_GRAPHEMES)
+
+    # 外部リンクの埋め込み（要約をdescriptionとして使用）
+    # 記事の取得時に読んだOpenGraph / Twitterカードの情報があれば、カードのタイトルとサムネイルに使う
+    card = article.get('metadata') or {}
+    embed_external = {
+        'uri': article['link'],
+        'title': card.get('title') or article['title'],
+        'description': summary,
+        'thumb_url': card.get('image'),
+    }
+    post['embed'] = embed_external
+    return [post]
+
+
+def enqueue_posts(name: str, article: Dict[str, Any], posts: List[Dict[str, Any]]):
+    """投稿をアウトボックスに追加する（記事ごとに1回だけ追加され、送信はdrainで行う）"""
+    if post_outbox.enqueue(name, article['link'], posts):
+        logger.info(f"[{name}] 投稿を送信待ちに追加しました。")
+        if _env_flag("NOVELTY_FILTER"):
+            novelty.record_posted(name, article, gemini_processor.embed_texts)
+    else:
+        logger.info(f"[{name}] この記事は送信待ちに追加済みのため、スキップします。")
 
-    logger.info(f"{len(articles_to_process)}件の新しい記事を処理します。")
+
+def _deadline_passed(name: str, deadline: Optional[run_control.Deadline]) -> bool:
+    """締め切りを過ぎていれば True を返す。処理は実行台帳に記録済みの段階から次回の実行で再開する（失敗としては数えない）"""
+    if deadline is None or not deadline.expired():
+        return False
+    logger.warning(f"[{name}] 締め切りを過ぎたため、残りの処理は次回の実行で再開します。")
+    return True
+
+
+def process_account(account: Dict[str, Any], all_new_articles: List[Dict[str, Any]], summaries: Dict[str, str],
+                    deadline: Optional[run_control.Deadline] = None):
+    """
+    1アカウント分のランク付け・要約・投稿を行う。
+    summaries は記事URLをキーとした要約のキャッシュで、複数アカウントで同じ記事を
+    投稿する場合に要約を使い回すために使う。
+    各段階の出力は実行台帳（run_ledger）に記録し、途中で失敗した場合は
+    次回の実行で最後に完了した段階から再開する。
+    deadline を過ぎた場合は、Gemini APIを呼び出す前に処理を打ち切り、次回の実行で続きから再開する。
+    """
+    name = account['name']
+    stages = run_ledger.load_stages(name)
+
+    # 処理対象の記事を決定
+    if run_ledger.STAGE_CANDIDATES in stages:
+        articles_to_process = stages[run_ledger.STAGE_CANDIDATES]
+        logger.info(f"[{name}] 前回の実行を途中から再開します（完了済み: {', '.join(stages)}）。")
+    else:
+        if not all_new_articles:
+            logger.info(f"[{name}] 新しい記事はありませんでした。")
+            return
+
+        # 最新MAX_CANDIDATES件への絞り込みは記事の取得時に済んでいる
+        articles_to_process = all_new_articles
+
+        # 直近の投稿と同じ話題の記事をランク付けの前に除外する
+        if _env_flag("NOVELTY_FILTER"):
+            with profiling.stage("novelty"):
+                articles_to_process, similar_articles = novelty.filter_novel(
+                    name, articles_to_process, gemini_processor.embed_texts,
+                    threshold=float(os.getenv("NOVELTY_THRESHOLD", novelty.DEFAULT_THRESHOLD)),
+                    recent_posts=int(os.getenv("NOVELTY_RECENT_POSTS", novelty.DEFAULT_RECENT_POSTS)),
+                )
+            # 除外した記事は次回以降も候補にしない
+            for article in similar_articles:
+                db_manager.add_url(article['link'], name)
+            if not articles_to_process:
+                logger.info(f"[{name}] 直近の投稿と類似しない新しい記事はありませんでした。")
+                return
+
+        run_ledger.save_stage(name, run_ledger.STAGE_CANDIDATES, [dict(article) for article in articles_to_process])
+
+    logger.info(f"[{name}] {len(articles_to_process)}件の新しい記事を処理します。")
 
     # 4. 記事の重要度評価
-    logger.info("記事をランク付け中...")
-    ranked_articles = gemini_processor.rank_articles(articles_to_process)
-    if not ranked_articles:
-        logger.warning("記事のランク付けに失敗しました。")
-        return
+    if run_ledger.STAGE_RANKING in stages:
+        ranked_links = stages[run_ledger.STAGE_RANKING]
+        articles_by_link = {article['link']: article for article in articles_to_process}
+        ranked_articles = [articles_by_link[link] for link in ranked_links if link in articles_by_link]
+    else:
+        if _deadline_passed(name, deadline):
+            return
+        logger.info(f"[{name}] 記事をランク付け中...")
+        with profiling.stage("ranking"):
+            ranked_articles = gemini_processor.rank_articles(articles_to_process, timeout=_gemini_timeout(deadline))
+        if not ranked_articles:
+            if _deadline_passed(name, deadline):
+                return
+            logger.warning(f"[{name}] 記事のランク付けに失敗しました。")
+            _give_up_if_exhausted(name, "ranking")
+            return
+        run_ledger.save_stage(name, run_ledger.STAGE_RANKING, [article['link'] for article in ranked_articles])
 
     # 5. Blueskyへの投稿準備
     posts = []
@@ -77,49 +197,296 @@ def main():
     top_article = ranked_articles[0] if ranked_articles else None
 
     if not top_article:
-        logger.info("投稿対象の記事がありません。")
+        logger.info(f"[{name}] 投稿対象の記事がありません。")
+        run_ledger.clear(name)
         return
 
-    # 6. 投稿対象の記事をDBに追加して、再投稿を防ぐ
-    logger.info(f"投稿対象の記事をデータベースに登録します: {top_article['link']}")
-    db_manager.add_url(top_article['link'])
-
-    # 7. 上位記事の要約と投稿準備
-    logger.info("上位記事の要約を生成中...")
-    summary = gemini_processor.summarize_article(top_article['content'])
+    # 6. 上位記事の要約と投稿準備（他のアカウントで要約済みなら再利用する）
+    summary = stages.get(run_ledger.STAGE_SUMMARY)
+    if not summary and top_article['link'] not in summaries and _deadline_passed(name, deadline):
+        return
+    summary = summary or summarize(name, top_article, summaries, deadline)
     if not summary:
-        logger.warning("要約の生成に失敗しました。この記事の処理を中断します。")
+        if _deadline_passed(name, deadline):
+            return
+        logger.warning(f"[{name}] 要約の生成に失敗しました。この記事の処理を中断します。")
+        _give_up_if_exhausted(name, "summary", top_article['link'])
         return
+    summaries[top_article['link']] = summary
+    run_ledger.save_stage(name, run_ledger.STAGE_SUMMARY, summary)
+    posts.extend(build_posts(top_article, summary))
+
+    # 7. 投稿をアウトボックスに追加する（記事ごとに1回だけ追加され、送信はdrainで行う）
+    enqueue_posts(name, top_article, posts)
+
+    # 8. 投稿する記事をDBに追加して再投稿を防ぎ、実行台帳を片付ける
+    logger.info(f"[{name}] 投稿する記事をデータベースに登録します: {top_article['link']}")
+    db_manager.add_url(top_article['link'], name)
+    run_ledger.clear(name)
+
+
+def _batch_timeout(deadline: run_control.Deadline) -> float:
+    """バッチジョブの完了を待つ時間を、GEMINI_BATCH_TIMEOUT と締め切りまでの残り時間の小さい方にする"""
+    return min(gemini_processor.batch_timeout(), deadline.remaining())
+
+
+def _has_batch_time(deadline: run_control.Deadline) -> bool:
+    """バッチジョブの完了を待てる時間が残っているかどうかを返す（残っていなければ対話的な呼び出しで処理する）"""
+    if _batch_timeout(deadline) >= gemini_processor.MIN_BATCH_TIMEOUT:
+        return True
+    logger.info("バッチジョブの完了を待つ時間が残っていません。")
+    return False
 
-    # 投稿テキストを作成
-    post_text = f"【要約】{top_article['title']}\n\n{summary}"
-    # Blueskyの文字数制限（300書記素）を超えないようにテキストを切り詰める
-    post_text = truncate_graphemes(post_text, 300)
-
-    # 外部リンクの埋め込みを作成
-    embed_external = models.AppBskyEmbedExternal.Main(
-        external=models.AppBskyEmbedExternal.External(
-            uri=top_article['link'],
-            title=top_article['title'],
-            description=summary,  # 要約をdescriptionとして使用
+
+def summarize_in_batch(articles: List[Dict[str, Any]], summaries: Dict[str, str], deadline: run_control.Deadline):
+    """
+    要約していない記事を1つのバッチジョブ（Gemini Batch API）でまとめて要約し、summaries に保存する。
+    保存した要約は summarize で再利用される。バッチジョブで要約できなかった記事は個別に要約する。
+    ジョブの完了を待つ時間が残っていない場合は、ジョブを作成せずに何もしない（summarize で個別に要約する）。
+    """
+    pending = {}
+    for article in articles:
+        if article['link'] not in summaries:
+            pending.setdefault(article['link'], article)
+    if not pending or not _has_batch_time(deadline):
+        return
+    pending_articles = list(pending.values())
+    logger.info(f"{len(pending_articles)}件の記事の要約をバッチジョブで生成中...")
+    limits = [POST_MAX_GRAPHEMES - grapheme.length(_post_prefix(article)) for article in pending_articles]
+    with profiling.stage("summary"):
+        results = gemini_processor.summarize_articles_batch(
+            [article['content'] for article in pending_articles], limits, timeout=_batch_timeout(deadline),
+            deadline=deadline
         )
-    )
-    posts.append({'text': post_text, 'embed': embed_external})
-
-    # 8. Blueskyへの投稿
-    if posts:
-        logger.info("Blueskyへ投稿中...")
-        success = bluesky_poster.post_thread(posts)
-        if success:
-            logger.info("Blueskyへの投稿に成功しました。")
+    for article, summary in zip(pending_articles, results):
+        if summary:
+            summaries[article['link']] = summary
+
+
+def catch_up_account(account: Dict[str, Any], feeds: Dict[str, Any], pushed_ids: List[int],
+                     deadline: run_control.Deadline, batch_size: int, max_posts: int,
+                     batch_mode: bool = False) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    1アカウント分の未処理の記事から、投稿する記事を選んで本文を取得する。
+    未処理のエントリを本文を取得せずに読みながらバッチごとにランク付けし（catch_up.select_finalists）、
+    勝ち残った最大 max_posts 件だけ本文を取得する。
+    batch_mode の場合は、各段のランク付けを1つのバッチジョブでまとめて行う（catch_up.select_finalists_batched）。
+    ただし、ジョブの完了を待つ時間が残っていない場合は対話的な呼び出しでランク付けし、
+    2段目以降で残っていない場合はその段でランク付けを打ち切る。
+    (本文を取得した記事, 処理済みにする記事のURL, すべての未処理の記事を読み終えたかどうか) のタプルを返す。
+    """
+    name = account['name']
+    logger.info(f"[{name}] 未処理の記事をキャッチアップします（バッチ{batch_size}件、投稿は最大{max_posts}件）。")
+    entries = rss_fetcher.iter_unseen_entries(account, feeds, pushed_ids, deadline)
+    with profiling.stage("ranking"):
+        if batch_mode and _has_batch_time(deadline):
+            def rank_many(groups: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+                # 段ごとに待てる時間を確認し、残っていなければランク付けせずに打ち切る
+                if not _has_batch_time(deadline):
+                    return [[] for _ in groups]
+                return gemini_processor.rank_articles_batch(groups, timeout=_batch_timeout(deadline),
+                                                            deadline=deadline)
+
+            finalists, eliminated, complete = catch_up.select_finalists_batched(
+                entries, rank_many, batch_size, max_posts, deadline
+            )
         else:
-            logger.error("Blueskyへの投稿に失敗しました。")
+            finalists, eliminated, complete = catch_up.select_finalists(
+                entries,
+                lambda articles: gemini_processor.rank_articles(articles, timeout=_gemini_timeout(deadline)),
+                batch_size, max_posts, deadline
+            )
+
+    articles = []
+    for entry in finalists:
+        content, metadata = rss_fetcher.fetch_article(
+            entry['link'], entry['feed_url'], timeout=deadline.timeout(rss_fetcher.FETCH_TIMEOUT)
+        )
+        articles.append(dict(entry, content=content or entry['summary'] or metadata.get('description', ''),
+                             metadata=metadata))
+
+    seen = eliminated + [entry['link'] for entry in finalists]
+    if not complete:
+        logger.info(f"[{name}] 未処理の記事が残っています。次回のキャッチアップで続きから処理します。")
+    return articles, seen, complete
+
+
+def run_catch_up(accounts: List[Dict[str, Any]], deadline: run_control.Deadline):
+    """
+    全アカウントの未処理の記事をキャッチアップする。フィードの取得と要約はアカウント間で共有する。
+    バッチの大きさと投稿数の上限は、環境変数 CATCHUP_BATCH_SIZE / CATCHUP_MAX_POSTS で変更できる。
+    GEMINI_BATCH_MODE が有効な場合は、ランク付けと全アカウント分の要約を Gemini のバッチジョブで行う。
+    """
+    batch_size = int(os.getenv("CATCHUP_BATCH_SIZE", catch_up.DEFAULT_BATCH_SIZE))
+    max_posts = int(os.getenv("CATCHUP_MAX_POSTS", catch_up.DEFAULT_MAX_POSTS))
+    batch_mode = _env_flag("GEMINI_BATCH_MODE")
+    if batch_mode and not gemini_processor.supports_batch():
+        logger.warning(f"{gemini_processor.GEMINI_MODEL} はBatch APIに対応していないため、対話的な呼び出しで処理します。")
+        batch_mode = False
+    feeds, pushed_ids, summaries = {}, [], {}
+    process_deadline = deadline.for_stage("process")
+    complete = True
+    selected = []
+    for account in accounts:
+        articles, seen, account_complete = catch_up_account(
+            account, feeds, pushed_ids, process_deadline, batch_size, max_posts, batch_mode
+        )
+        selected.append((account['name'], articles, seen))
+        complete = complete and account_complete
+
+    if batch_mode:
+        summarize_in_batch([article for _, articles, _ in selected for article in articles], summaries, process_deadline)
+
+    for name, articles, seen in selected:
+        unposted = set()
+        for article in articles:
+            if process_deadline.expired() and article['link'] not in summaries:
+                # 締め切りを過ぎた後は要約せず、次回のキャッチアップに回す
+                summary = ""
+            else:
+                summary = summarize(name, article, summaries, process_deadline)
+            if not summary:
+                unposted.add(article['link'])
+                continue
+            enqueue_posts(name, article, build_posts(article, summary))
+        if unposted:
+            complete = False
+            logger.warning(f"[{name}] 要約できなかった記事は処理済みにせず、次回のキャッチアップで処理します: "
+                           f"{', '.join(sorted(unposted))}")
+        # 読んだ記事は、敗退して投稿しなかったものも含めて1回の書き込みで処理済みにする
+        processed = [link for link in seen if link not in unposted]
+        db_manager.add_urls(processed, name)
+        logger.info(f"[{name}] {len(processed)}件の記事を処理済みとして登録しました。")
+
+    # 読み終えていないフィードや処理済みにしなかった記事がある場合、WebSubの配信キューは次回も読み直す
+    if complete:
+        websub.mark_processed(pushed_ids)
+
+
+def run(catch_up_mode: bool = False):
+    """
+    メインの処理フロー。
+    実行全体の締め切り（RUN_DEADLINE_SECONDS）を段階ごとに配分し、締め切りを過ぎた段階は
+    それまでの結果で先に進む（取得できた記事だけでランク付けし、残りは次回の実行に回す）。
+    catch_up_mode を指定した場合は、最新の記事の代わりに未処理の記事をまとめて処理する（run_catch_up）。
+    """
+    logger.info("処理を開始します...")
+    deadline = run_control.run_deadline()
+
+    # 1. データベースの初期化
+    with profiling.stage("init"):
+        db_manager.init_db()
+        run_ledger.init_ledger()
+        novelty.init_novelty()
+        websub.init_websub()
+        post_outbox.init_outbox()
+        thumbnails.init_thumbnails()
+
+        # WebSubの購読のうち、期限切れが近いものを更新する
+        websub_callback = os.getenv("WEBSUB_CALLBACK_URL")
+        if websub_callback:
+            websub.renew_expiring(websub_callback)
+
+    # 2. 投稿先アカウントとRSSフィードのURLを読み込む
+    accounts = account_config.load_accounts()
+    if not accounts:
+        logger.error("投稿先アカウントが設定されていません。")
+        return
+
+    if catch_up_mode:
+        # 3〜8. 未処理の記事をまとめて処理するキャッチアップ
+        run_catch_up(accounts, deadline)
     else:
-        # このケースはロジック上発生し得ないが、念のため残す
-        logger.warning("投稿するコンテンツがありません。")
+        # 3. 新しい記事の取得（フィードの取得と本文のスクレイピングは全アカウントで共有）
+        # 前回の実行が途中で終わったアカウントは、記録済みの候補から再開するため取得しない
+        accounts_to_fetch = [a for a in accounts if not run_ledger.has_pending_run(a['name'])]
+        new_articles_by_account = {}
+        handled_pushes = {}  # アカウント名 -> 記事を永続化すれば処理し終えるWebSubの配信のID
+        if accounts_to_fetch:
+            logger.info("新しい記事を取得中...")
+            max_candidates = int(os.getenv("MAX_CANDIDATES", DEFAULT_MAX_CANDIDATES))
+            with profiling.stage("fetch"):
+                new_articles_by_account = rss_fetcher.fetch_new_articles_for_accounts(
+                    accounts_to_fetch, max_candidates, deadline=deadline.for_stage("fetch"),
+                    handled=handled_pushes
+                )
+
+        # 4〜8. アカウントごとにランク付け・要約・投稿を行う
+        summaries = {}
+        process_deadline = deadline.for_stage("process")
+        for i, account in enumerate(accounts):
+            if process_deadline.expired():
+                skipped = ", ".join(a['name'] for a in accounts[i:])
+                logger.warning(f"締め切りを過ぎたため、残りのアカウントの処理は次回に回します: {skipped}")
+                break
+            process_account(account, new_articles_by_account.get(account['name'], []), summaries, process_deadline)
+            # 候補は実行台帳に記録されるか処理済みとして登録されたため、配信をこのアカウントでは処理し終えた
+            websub.mark_handled(account['name'], handled_pushes.get(account['name'], []))
+
+        # 全アカウントが処理し終えた配信だけを処理済みにする
+        websub.release_handled(accounts)
+
+    # 9. 送信待ちの投稿を、レート制限の範囲で時間の上限まで送信する
+    # 送信できなかった投稿は、次回の実行または post_outbox.py の送信プロセスが送信する
+    drain_seconds = float(os.getenv("OUTBOX_DRAIN_SECONDS", DEFAULT_OUTBOX_DRAIN_SECONDS))
+    drain_deadline = deadline.for_stage("drain")
+    if drain_seconds > 0 and not drain_deadline.expired():
+        with profiling.stage("drain"):
+            sent = post_outbox.drain(accounts, deadline=time.time() + min(drain_seconds, drain_deadline.remaining()))
+        logger.info(f"{sent}件の投稿を送信しました。")
 
     logger.info("処理が完了しました。")
 
 
+def main(profile: bool = False, profile_sample_interval: Optional[float] = None,
+         profile_top_n: int = profiling.DEFAULT_TOP_N, catch_up_mode: bool = False):
+    """
+    環境変数とロギングを設定して処理を実行する。
+    同じデータベースを使う実行が重ならないよう、実行ロックを取得してから処理する。
+    ロックを RUN_LOCK_WAIT_SECONDS 秒（デフォルトは0秒）待っても取得できない場合は、何もせずに終了する。
+    profileを指定した場合は、段階ごとのプロファイルを取得して log/ ディレクトリに書き出す。
+    catch_up_mode を指定した場合は、未処理の記事をまとめて処理するキャッチアップを行う。
+    """
+    # 環境変数を読み込む
+    load_dotenv()
+    # ロギングを設定
+    setup_logging()
+
+    lock = run_control.RunLock(wait_seconds=float(os.getenv("RUN_LOCK_WAIT_SECONDS", 0)))
+    if not lock.acquire():
+        logger.warning("別の実行が進行中のため、処理を開始せずに終了します。")
+        return
+
+    try:
+        if not profile:
+            run(catch_up_mode)
+            return
+
+        profiler = profiling.Profiler(top_n=profile_top_n, sample_interval=profile_sample_interval)
+        profiling.activate(profiler)
+        try:
+            run(catch_up_mode)
+        finally:
+            profiling.activate(None)
+            profiler.write_report()
+    finally:
+        lock.release()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="RSSフィードの新着記事を要約してBlueskyに投稿する")
+    parser.add_argument("--profile", action="store_true",
+                        help="段階ごとのプロファイル（cProfile、tracemalloc）を取得して log/ に書き出す")
+    parser.add_argument("--profile-sample-interval", type=float, default=None, metavar="SECONDS",
+                        help="プロファイル時に、指定した間隔（秒）でスタックのサンプリングも行う")
+    parser.add_argument("--profile-top", type=int, default=profiling.DEFAULT_TOP_N, metavar="N",
+                        help="プロファイルのレポートに出力する上位の件数")
+    parser.add_argument("--catch-up", action="store_true",
+                        help="停止期間後や新しいフィードの追加後に、未処理の記事をまとめて処理する")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(profile=args.profile, profile_sample_interval=args.profile_sample_interval, profile_top_n=args.profile_top,
+         catch_up_mode=args.catch_up)
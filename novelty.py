@@ -0,0 +1,188 @@
+import sqlite3
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 過去の投稿とのコサイン類似度がこの値以上の候補は、同じ話題とみなして除外する
+DEFAULT_THRESHOLD = 0.9
+# 類似度を比較する直近の投稿数
+DEFAULT_RECENT_POSTS = 50
+# 埋め込みに使う本文の最大文字数
+EMBEDDING_TEXT_LENGTH = 1000
+
+# テキストのリストを受け取り、埋め込みベクトルのリストを返す関数
+EmbedFunction = Callable[[List[str]], List[Sequence[float]]]
+
+
+def init_novelty():
+    """埋め込みベクトルのキャッシュと、投稿済み記事の記録テーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                url TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS posted_embeddings (
+                account TEXT NOT NULL,
+                url TEXT NOT NULL,
+                posted_at REAL NOT NULL,
+                PRIMARY KEY (account, url)
+            )
+        """)
+        conn.commit()
+
+
+def _embedding_text(article: Any) -> str:
+    """記事の埋め込みに使うテキスト（タイトルと本文の冒頭）を作成する"""
+    return f"{article['title']}\n{article['content'][:EMBEDDING_TEXT_LENGTH]}"
+
+
+def _to_blob(vector: Sequence[float]) -> Tuple[int, bytes]:
+    array = np.asarray(vector, dtype=np.float32)
+    return array.shape[0], array.tobytes()
+
+
+def _from_blob(dim: int, blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32, count=dim)
+
+
+def get_embeddings(articles: List[Any], embed_fn: EmbedFunction) -> Dict[str, np.ndarray]:
+    """
+    記事URLをキーとした埋め込みベクトルの辞書を返す。
+    キャッシュ済みのベクトルはデータベースから読み込み、未計算の記事だけを
+    embed_fnでまとめて計算してキャッシュに保存する（記事ごとに計算は1回だけ）。
+    計算に失敗した記事は辞書に含まれない。
+    """
+    if not articles:
+        return {}
+
+    urls = [article['link'] for article in articles]
+    vectors = {}
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(urls))
+        cursor.execute(f"SELECT url, dim, vector FROM embeddings WHERE url IN ({placeholders})", urls)
+        for url, dim, blob in cursor.fetchall():
+            vectors[url] = _from_blob(dim, blob)
+
+    missing = [article for article in articles if article['link'] not in vectors]
+    if not missing:
+        return vectors
+
+    logger.info(f"{len(missing)}件の記事の埋め込みを計算します。")
+    computed = embed_fn([_embedding_text(article) for article in missing])
+    if len(computed) != len(missing):
+        logger.warning("埋め込みの計算に失敗したため、未計算の記事は類似度の判定から除外します。")
+        return vectors
+
+    now = time.time()
+    rows = []
+    for article, vector in zip(missing, computed):
+        dim, blob = _to_blob(vector)
+        vectors[article['link']] = _from_blob(dim, blob)
+        rows.append((article['link'], dim, blob, now))
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO embeddings (url, dim, vector, created_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+    return vectors
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NoveltyIndex:
+    """直近の投稿の埋め込みベクトルを正規化した行列として保持し、候補との最大コサイン類似度を計算する"""
+
+    def __init__(self, vectors: np.ndarray):
+        self._matrix = _normalize(vectors.astype(np.float32, copy=False)) if len(vectors) else vectors
+
+    def __len__(self) -> int:
+        return len(self._matrix)
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1] if len(self._matrix) else 0
+
+    @classmethod
+    def load(cls, account: str, recent_posts: int = DEFAULT_RECENT_POSTS) -> "NoveltyIndex":
+        """アカウントの直近 recent_posts 件の投稿から索引を作成する"""
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT e.dim, e.vector FROM posted_embeddings p
+                JOIN embeddings e ON e.url = p.url
+                WHERE p.account = ?
+                ORDER BY p.posted_at DESC
+                LIMIT ?
+            """, (account, recent_posts))
+            rows = cursor.fetchall()
+        if not rows:
+            return cls(np.empty((0, 0), dtype=np.float32))
+        dim = rows[0][0]
+        blobs = b"".join(blob for row_dim, blob in rows if row_dim == dim)
+        return cls(np.frombuffer(blobs, dtype=np.float32).reshape(-1, dim))
+
+    def max_similarity(self, vectors: np.ndarray) -> np.ndarray:
+        """各候補ベクトルについて、索引内のベクトルとの最大コサイン類似度を返す"""
+        if not len(self._matrix) or not len(vectors):
+            return np.zeros(len(vectors), dtype=np.float32)
+        return (_normalize(vectors.astype(np.float32, copy=False)) @ self._matrix.T).max(axis=1)
+
+
+def filter_novel(account: str, articles: List[Any], embed_fn: EmbedFunction,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 recent_posts: int = DEFAULT_RECENT_POSTS) -> Tuple[List[Any], List[Any]]:
+    """
+    直近の投稿と類似度が threshold 以上の候補を除外する。
+    (残った候補, 除外した候補) のタプルを返す。埋め込みを計算できなかった候補は残す。
+    """
+    index = NoveltyIndex.load(account, recent_posts)
+    if not len(index) or not articles:
+        return articles, []
+
+    vectors = get_embeddings(articles, embed_fn)
+    # 埋め込みモデルの変更などで次元が異なるベクトルは比較できないため判定しない
+    embedded = [article for article in articles
+                if article['link'] in vectors and vectors[article['link']].shape[0] == index.dim]
+    if not embedded:
+        return articles, []
+
+    similarities = index.max_similarity(np.stack([vectors[article['link']] for article in embedded]))
+    similar = set()
+    for article, sim in zip(embedded, similarities):
+        if sim >= threshold:
+            logger.info(f"[{account}] 直近の投稿と類似しているため除外します（類似度 {sim:.3f}）: {article['title']}")
+            similar.add(article['link'])
+
+    novel = [article for article in articles if article['link'] not in similar]
+    excluded = [article for article in articles if article['link'] in similar]
+    return novel, excluded
+
+
+def record_posted(account: str, article: Any, embed_fn: EmbedFunction, posted_at: Optional[float] = None):
+    """投稿した記事を、以降の類似度判定の対象として記録する"""
+    if article['link'] not in get_embeddings([article], embed_fn):
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO posted_embeddings (account, url, posted_at) VALUES (?, ?, ?)",
+            (account, article['link'], posted_at if posted_at is not None else time.time())
+        )
+        conn.commit()
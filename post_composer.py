@@ -0,0 +1,101 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+import grapheme
+import text_truncation
+
+# Blueskyの投稿の最大書記素数
+MAX_GRAPHEMES = 300
+# Blueskyの投稿テキストの最大バイト数（UTF-8）
+MAX_BYTES = 3000
+# 文の途中で切り詰めた場合に末尾に付ける文字列
+PLACEHOLDER = "..."
+
+# 文末で切った結果が、文の途中で切る場合に残る書記素数に対してこの割合を下回る場合は文の途中で切る
+MIN_SENTENCE_SHARE = 0.5
+
+# ハッシュタグの最大書記素数
+MAX_TAG_GRAPHEMES = 64
+
+# リンクとハッシュタグ。リンクはURLに使えるASCII文字（RFC 3986の非予約文字・予約文字と%）だけで構成し、
+# 日本語の文中のURLが直後の文字を取り込まないようにする
+_TOKEN_PATTERN = re.compile(
+    r"(?P<link>https?://[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]+)"
+    r"|(?:^|(?<=\s))[#＃](?P<tag>\S+)"
+)
+# リンクの末尾に付いていても、リンクに含めない文字
+_LINK_TRAILING = ".,;:!?'\")]}"
+
+LINK_FEATURE = "app.bsky.richtext.facet#link"
+TAG_FEATURE = "app.bsky.richtext.facet#tag"
+
+
+def truncate(text: str, max_graphemes: int = MAX_GRAPHEMES, max_bytes: Optional[int] = MAX_BYTES,
+             placeholder: str = PLACEHOLDER, prefer_sentence: bool = True) -> str:
+    """
+    テキストを max_graphemes 書記素以内かつ max_bytes バイト（UTF-8）以内に収める。
+    上限を超える場合は、上限内の最後の文末で切る（prefer_sentence）。
+    適切な文末がなければ placeholder を付けて収まる位置で切る。ただし、リンクやハッシュタグの途中では切らない
+    （その前で切ると何も残らない場合を除く）。
+    max_bytes にNoneを指定した場合は、バイト数を制限しない。
+    """
+    return text_truncation.truncate(text, max_graphemes, max_bytes, placeholder, prefer_sentence,
+                                    min_sentence_share=MIN_SENTENCE_SHARE, unbreakable=_TOKEN_PATTERN)
+
+
+def _trim_link(link: str) -> str:
+    """リンクの末尾の句読点や閉じ括弧を取り除く（対応する開き括弧がリンク内にある閉じ括弧は残す）"""
+    while link and link[-1] in _LINK_TRAILING:
+        if link[-1] == ")" and link.count("(") >= link.count(")"):
+            break
+        link = link[:-1]
+    return link
+
+
+def _trim_tag(tag: str) -> Optional[str]:
+    """ハッシュタグの末尾の句読点を取り除き、有効なタグでなければNoneを返す"""
+    end = len(tag)
+    while end and unicodedata.category(tag[end - 1]).startswith("P"):
+        end -= 1
+    tag = tag[:end]
+    if not tag or tag.isdigit() or grapheme.length(tag, until=MAX_TAG_GRAPHEMES + 1) > MAX_TAG_GRAPHEMES:
+        return None
+    return tag
+
+
+def build_facets(text: str) -> List[Dict[str, Any]]:
+    """
+    テキスト中のリンクとハッシュタグの、リッチテキストのファセット（app.bsky.richtext.facet）を返す。
+    ファセットの位置はUTF-8のバイトオフセットで、直前のファセットからの差分だけをエンコードして求める。
+    ファセットは atproto のレキシコンのJSON形式の辞書で、アウトボックスにそのまま保存できる。
+    """
+    facets = []
+    char_pos = byte_pos = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        if match.group("link"):
+            start = match.start("link")
+            value = _trim_link(match.group("link"))
+            token = value
+            feature = {"$type": LINK_FEATURE, "uri": value}
+        else:
+            start = match.start()
+            value = _trim_tag(match.group("tag"))
+            if value is None:
+                continue
+            token = text[start] + value
+            feature = {"$type": TAG_FEATURE, "tag": value}
+        byte_pos += len(text[char_pos:start].encode("utf-8"))
+        char_pos = start
+        byte_end = byte_pos + len(token.encode("utf-8"))
+        facets.append({"index": {"byteStart": byte_pos, "byteEnd": byte_end}, "features": [feature]})
+    return facets
+
+
+def compose_post(text: str, max_graphemes: int = MAX_GRAPHEMES, max_bytes: Optional[int] = MAX_BYTES,
+                 placeholder: str = PLACEHOLDER) -> Dict[str, Any]:
+    """
+    テキストを投稿の上限に収めて、リンクとハッシュタグのファセットを付けた投稿を返す。
+    戻り値は {'text': 投稿テキスト, 'facets': ファセットのリスト} の辞書。
+    """
+    text = truncate(text, max_graphemes, max_bytes, placeholder)
+    return {'text': text, 'facets': build_facets(text)}
@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from atproto import models
+import account_config
+import bluesky_poster
+import db_manager
+import run_control
+import thumbnails
+from logger_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# 送信待ちの投稿の状態
+STATE_PENDING = "pending"
+STATE_SENT = "sent"
+STATE_FAILED = "failed"
+
+# Blueskyの書き込みのレート制限（レコードの作成は1件3ポイント、1時間に5000ポイント、1日に35000ポイント）
+# から求めた、アカウントごとの投稿数の上限
+HOURLY_POST_LIMIT = 5000 // 3
+DAILY_POST_LIMIT = 35000 // 3
+# 投稿の送信間隔の最小値（秒）のデフォルト値（環境変数 OUTBOX_MIN_INTERVAL で変更可能）
+DEFAULT_MIN_INTERVAL = 60
+# 送信に失敗した投稿を再試行する最大回数（超えた場合は failed として断念する）
+MAX_ATTEMPTS = 8
+# 再試行の待ち時間（秒）。失敗するたびに倍にする
+BACKOFF_BASE = 60
+BACKOFF_MAX = 6 * 3600
+# レート制限の応答に待ち時間が含まれていない場合の待ち時間（秒）
+DEFAULT_RATE_LIMIT_WAIT = 300
+# 独立した送信プロセスで、次の送信を確認するまでの最大の待ち時間（秒）
+DRAINER_POLL_INTERVAL = 60
+
+
+def init_outbox():
+    """送信待ちの投稿（アウトボックス）と、送信履歴のテーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account TEXT NOT NULL,
+                article_url TEXT NOT NULL,
+                posts TEXT NOT NULL,
+                sent_refs TEXT NOT NULL DEFAULT '[]',
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                uri TEXT,
+                cid TEXT,
+                last_error TEXT,
+                UNIQUE (account, article_url)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (state, next_attempt_at)")
+        # レート制限の計算に使う、アカウントごとのレコード作成の履歴
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox_sends (
+                account TEXT NOT NULL,
+                sent_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS outbox_sends_account ON outbox_sends (account, sent_at)")
+        conn.commit()
+
+
+def enqueue(account: str, article_url: str, posts: List[Dict[str, Any]]) -> bool:
+    """
+    投稿するスレッドをアウトボックスに追加する。同じアカウントと記事の組は1回だけ追加される。
+    postsは次の形式の辞書のリストで、JSONとして保存する。
+      text: 投稿のテキスト
+      embed: 外部リンクの埋め込み {'uri', 'title', 'description', 'thumb_url'}（任意）
+             thumb_url（og:imageなど）を指定した場合は、送信時にサムネイルを作成して添付する
+      facets: リンクやハッシュタグのファセット（app.bsky.richtext.facet のJSON形式、post_composer.build_facets）（任意）
+      reply_to: 最初の投稿をリプライにする場合の {'root': {'uri', 'cid'}, 'parent': {'uri', 'cid'}}（任意）
+    新しく追加した場合はTrueを返す。
+    """
+    now = time.time()
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR IGNORE INTO outbox (account, article_url, posts, state, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (account, article_url, json.dumps(posts, ensure_ascii=False), STATE_PENDING, now, now)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+
+def get_item(account: str, article_url: str) -> Optional[Dict[str, Any]]:
+    """アカウントと記事に対応するアウトボックスの項目を返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM outbox WHERE account = ? AND article_url = ?", (account, article_url))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def _ready_items(now: float, accounts: List[str]) -> List[Dict[str, Any]]:
+    placeholders = ",".join("?" * len(accounts))
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT * FROM outbox WHERE state = ? AND next_attempt_at <= ? AND account IN ({placeholders}) "
+            "ORDER BY next_attempt_at, id",
+            (STATE_PENDING, now, *accounts)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def next_attempt_at() -> Optional[float]:
+    """送信待ちの投稿のうち、最も早く送信できる時刻を返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE state = ?", (STATE_PENDING,))
+        return cursor.fetchone()[0]
+
+
+def _rate_limit_wait(account: str, now: float, min_interval: float) -> float:
+    """アカウントの送信履歴から、次に送信できるまでの待ち時間（秒）を返す。0なら今すぐ送信できる"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        # 1日より古い履歴はレート制限の計算に使わないため削除する
+        cursor.execute("DELETE FROM outbox_sends WHERE sent_at < ?", (now - 86400,))
+        conn.commit()
+        waits = [0.0]
+        cursor.execute("SELECT MAX(sent_at) FROM outbox_sends WHERE account = ?", (account,))
+        last_sent = cursor.fetchone()[0]
+        if last_sent is not None:
+            waits.append(last_sent + min_interval - now)
+        for window, limit in ((3600, HOURLY_POST_LIMIT), (86400, DAILY_POST_LIMIT)):
+            # 上限に達している場合は、窓の中で最も古い送信が窓から外れるまで待つ
+            cursor.execute(
+                "SELECT sent_at FROM outbox_sends WHERE account = ? AND sent_at >= ? ORDER BY sent_at LIMIT 1 OFFSET ?",
+                (account, now - window, limit - 1)
+            )
+            if cursor.fetchone() is not None:
+                cursor.execute(
+                    "SELECT MIN(sent_at) FROM outbox_sends WHERE account = ? AND sent_at >= ?",
+                    (account, now - window)
+                )
+                waits.append(cursor.fetchone()[0] + window - now)
+        return max(waits)
+
+
+def _defer_account(account: str, until: float):
+    """アカウントの送信待ちの投稿を、指定した時刻まで送信しないようにする"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE outbox SET next_attempt_at = ? WHERE account = ? AND state = ? AND next_attempt_at < ?",
+            (until, account, STATE_PENDING, until)
+        )
+        conn.commit()
+
+
+def rate_limit_delay(error: Exception, now: float) -> Optional[float]:
+    """
+    例外がレート制限（HTTP 429）によるものであれば、再送信までの待ち時間（秒）を返す。
+    Retry-After、またはRateLimit-Resetヘッダーの値を使う。レート制限でなければNoneを返す。
+    """
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) != 429:
+        return None
+    headers = {key.lower(): value for key, value in dict(getattr(response, "headers", None) or {}).items()}
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - now, 0.0)
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("ratelimit-reset")
+    if reset:
+        try:
+            return max(float(reset) - now, 0.0)
+        except ValueError:
+            pass
+    return DEFAULT_RATE_LIMIT_WAIT
+
+
+def _is_permanent(error: Exception) -> bool:
+    """再試行しても成功しない失敗（リクエストの内容が不正）かどうかを返す"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 400
+
+
+def _is_blob_error(error: Exception) -> bool:
+    """添付したblobが見つからないなど、blobが原因でリクエストが不正とされた失敗かどうかを返す"""
+    return _is_permanent(error) and "blob" in str(error).lower()
+
+
+def _strong_ref(data: Dict[str, str]) -> models.ComAtprotoRepoStrongRef.Main:
+    return models.ComAtprotoRepoStrongRef.Main(uri=data["uri"], cid=data["cid"])
+
+
+def _build_embed(data: Optional[Dict[str, Any]], client: Any, account: str) -> Optional[models.AppBskyEmbedExternal.Main]:
+    """
+    保存した外部リンクの埋め込みから、atprotoのモデルを作成する。
+    サムネイルの画像URLがあればアップロード済みのblob（なければアップロードしたもの）を添付し、
+    サムネイルを作成できない場合はサムネイルなしにする。
+    """
+    if not data:
+        return None
+    thumb = thumbnails.get_thumb_blob(client, account, data["thumb_url"]) if data.get("thumb_url") else None
+    return models.AppBskyEmbedExternal.Main(
+        external=models.AppBskyEmbedExternal.External(
+            uri=data["uri"],
+            title=data.get("title", ""),
+            description=data.get("description", ""),
+            thumb=thumb,
+        )
+    )
+
+
+def _build_facets(data: Optional[List[Dict[str, Any]]]) -> Optional[List[models.AppBskyRichtextFacet.Main]]:
+    """保存したファセットから、atprotoのモデルを作成する"""
+    if not data:
+        return None
+    return [models.AppBskyRichtextFacet.Main.model_validate(facet) for facet in data]
+
+
+def _send_post(client: Any, account: str, post: Dict[str, Any],
+               root: Optional[models.ComAtprotoRepoStrongRef.Main],
+               parent: Optional[models.ComAtprotoRepoStrongRef.Main]) -> models.ComAtprotoRepoStrongRef.Main:
+    """
+    ポストを1件投稿する。サムネイルを添付して投稿できた場合は、そのblobを以降の投稿のためにキャッシュする。
+    添付したblobが原因で拒否された場合は、blobのキャッシュを破棄してサムネイルなしで1回だけ再送する。
+    """
+    data = post.get("embed")
+    embed = _build_embed(data, client, account)
+    facets = _build_facets(post.get("facets"))
+    thumb = embed.external.thumb if embed else None
+    try:
+        ref = bluesky_poster.send_post(client, post["text"], embed, root=root, parent=parent, facets=facets)
+    except Exception as e:
+        if thumb is None or not _is_blob_error(e):
+            raise
+        logger.warning(f"[{account}] サムネイルのblobが拒否されたため、サムネイルなしで再送します: {e}")
+        thumbnails.forget_blob(account, data["thumb_url"])
+        embed = _build_embed({**data, "thumb_url": None}, client, account)
+        return bluesky_poster.send_post(client, post["text"], embed, root=root, parent=parent, facets=facets)
+    if thumb is not None:
+        thumbnails.remember_blob(account, data["thumb_url"], thumb)
+    return ref
+
+
+def _send_item(client: Any, item: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    項目のスレッドを投稿し、投稿した各ポストの参照のリストを返す。
+    ポストを投稿するたびに参照を保存するため、途中で失敗した場合も次回は続きから投稿する。
+    """
+    posts = [post for post in json.loads(item["posts"]) if post.get("text", "").strip()]
+    sent = json.loads(item["sent_refs"])
+    reply_to = posts[0].get("reply_to") if posts else None
+
+    for post in posts[len(sent):]:
+        if sent:
+            root, parent = _strong_ref(sent[0]), _strong_ref(sent[-1])
+        elif reply_to:
+            root, parent = _strong_ref(reply_to["root"]), _strong_ref(reply_to["parent"])
+        else:
+            root = parent = None
+        ref = _send_post(client, item["account"], post, root, parent)
+        sent.append({"uri": ref.uri, "cid": ref.cid})
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE outbox SET sent_refs = ? WHERE id = ?", (json.dumps(sent), item["id"]))
+            cursor.execute("INSERT INTO outbox_sends (account, sent_at) VALUES (?, ?)", (item["account"], time.time()))
+            conn.commit()
+    return sent
+
+
+def _mark_sent(item: Dict[str, Any], refs: List[Dict[str, str]]):
+    root = refs[0] if refs else {}
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE outbox SET state = ?, sent_at = ?, uri = ?, cid = ?, last_error = NULL WHERE id = ?",
+            (STATE_SENT, time.time(), root.get("uri"), root.get("cid"), item["id"])
+        )
+        conn.commit()
+
+
+def _record_failure(item: Dict[str, Any], error: Exception, now: float, permanent: bool = False):
+    """送信の失敗を記録し、指数バックオフで再試行を予定する。上限に達した場合や不正な内容の場合は断念する"""
+    attempts = item["attempts"] + 1
+    if permanent or _is_permanent(error) or attempts >= MAX_ATTEMPTS:
+        state, next_at = STATE_FAILED, now
+        logger.error(f"[{item['account']}] 投稿の送信を断念します（{attempts}回目の失敗）: {item['article_url']}: {error}")
+    else:
+        state, next_at = STATE_PENDING, now + min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+        logger.warning(
+            f"[{item['account']}] 投稿の送信に失敗しました（{attempts}回目）。"
+            f"{next_at - now:.0f}秒後に再試行します: {item['article_url']}: {error}"
+        )
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE outbox SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (state, attempts, next_at, str(error), item["id"])
+        )
+        conn.commit()
+
+
+def drain(accounts: List[Dict[str, Any]], deadline: Optional[float] = None,
+          min_interval: Optional[float] = None) -> int:
+    """
+    送信できる状態の投稿を、アカウントごとのレート制限の範囲で送信し、送信した件数を返す。
+    投稿の間隔は min_interval（省略時は環境変数 OUTBOX_MIN_INTERVAL）秒以上空け、
+    まだ送信できない投稿は待たずに次回の送信に回す。deadline（UNIX時間）を過ぎたら送信を打ち切る。
+    accountsは account_config.load_accounts の形式で、認証情報の取得に使う。
+    """
+    if min_interval is None:
+        min_interval = float(os.getenv("OUTBOX_MIN_INTERVAL", DEFAULT_MIN_INTERVAL))
+    credentials = {account["name"]: account for account in accounts}
+    if not credentials:
+        return 0
+
+    clients: Dict[str, Any] = {}
+    deferred: Set[str] = set()
+    sent_count = 0
+    for item in _ready_items(time.time(), list(credentials)):
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            logger.info("送信の時間の上限に達したため、残りの投稿は次回に送信します。")
+            break
+        name = item["account"]
+        if name in deferred:
+            continue
+
+        wait = _rate_limit_wait(name, now, min_interval)
+        if wait > 0:
+            _defer_account(name, now + wait)
+            deferred.add(name)
+            continue
+
+        try:
+            if name not in clients:
+                account = credentials[name]
+                clients[name] = bluesky_poster.create_client(account.get("handle"), account.get("app_password"))
+            refs = _send_item(clients[name], item)
+        except Exception as e:
+            delay = rate_limit_delay(e, now)
+            if delay is None:
+                _record_failure(item, e, now)
+            else:
+                # レート制限はアカウント単位のため、アカウントの投稿をまとめて延期する
+                logger.warning(f"[{name}] レート制限に達したため、{delay:.0f}秒後まで送信を延期します。")
+                _defer_account(name, now + delay)
+                deferred.add(name)
+            continue
+
+        if not refs:
+            _record_failure(item, ValueError("投稿する有効なテキストがありません"), now, permanent=True)
+            continue
+        _mark_sent(item, refs)
+        sent_count += 1
+        logger.info(f"[{name}] 投稿を送信しました: {refs[0]['uri']}")
+    return sent_count
+
+
+def main():
+    """
+    送信待ちの投稿を、レート制限の範囲で送信し続ける。
+    main.py と同じ投稿を同時に送信しないよう、実行ロックを取得できた間だけ送信する。
+    """
+    load_dotenv()
+    setup_logging()
+    init_outbox()
+    thumbnails.init_thumbnails()
+    logger.info("投稿の送信を開始します...")
+    while True:
+        with run_control.RunLock() as acquired:
+            if acquired:
+                drain(account_config.load_accounts())
+        next_at = next_attempt_at()
+        wait = DRAINER_POLL_INTERVAL if next_at is None else min(max(next_at - time.time(), 1.0), DRAINER_POLL_INTERVAL)
+        time.sleep(wait)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+from logger_config import LOG_DIR
+
+logger = logging.getLogger(__name__)
+
+# レポートに出力する関数・割り当て箇所の件数のデフォルト値
+DEFAULT_TOP_N = 30
+
+# 実行中のプロファイラ（プロファイルモードでない場合はNone）
+_active: Optional["Profiler"] = None
+
+
+class StageProfile:
+    """1つの段階のプロファイル結果。同じ名前の段階に複数回入った場合は合算する"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.peak_bytes = 0
+        self.stats: Optional[pstats.Stats] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.samples: Counter = Counter()
+
+
+class _Frame:
+    """実行中の段階（入れ子になった段階に入っている間は一時停止する）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.peak_bytes = 0
+
+
+class _Sampler(threading.Thread):
+    """一定間隔でメインスレッドのスタックを記録するサンプリングプロファイラ"""
+
+    def __init__(self, profiler: "Profiler", interval: float):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.profiler = profiler
+        self.interval = interval
+        self.target_id = threading.main_thread().ident
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_id)
+            stack = self.profiler.current_stage()
+            if frame is None or stack is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.profiler.add_sample(stack, ";".join(reversed(names)))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """
+    パイプラインの段階ごとに、cProfileの統計とtracemallocによるメモリ割り当てのピークを記録する。
+    sample_intervalを指定した場合は、サンプリングでスタックも記録する（flamegraph用のfolded形式で出力）。
+    段階は入れ子にでき、内側の段階を実行している間は外側の段階の計測を止める。
+    """
+
+    def __init__(self, output_dir: str = LOG_DIR, top_n: int = DEFAULT_TOP_N,
+                 sample_interval: Optional[float] = None):
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+        self.stages: Dict[str, StageProfile] = {}
+        self._stack: List[_Frame] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[_Sampler] = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.sample_interval:
+            self._sampler = _Sampler(self, self.sample_interval)
+            self._sampler.start()
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def current_stage(self) -> Optional[str]:
+        with self._lock:
+            return self._stack[-1].name if self._stack else None
+
+    def add_sample(self, stage: str, stack: str):
+        with self._lock:
+            self.stages[stage].samples[stack] += 1
+
+    def _pause(self, frame: _Frame):
+        frame.profile.disable()
+        frame.peak_bytes = max(frame.peak_bytes, tracemalloc.get_traced_memory()[1])
+
+    def _resume(self, frame: _Frame):
+        tracemalloc.reset_peak()
+        frame.profile.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        """段階の処理を計測するコンテキストマネージャ"""
+        with self._lock:
+            if self._stack:
+                self._pause(self._stack[-1])
+            self.stages.setdefault(name, StageProfile(name))
+            frame = _Frame(name)
+            self._stack.append(frame)
+        self._resume(frame)
+        try:
+            yield
+        finally:
+            self._pause(frame)
+            snapshot = tracemalloc.take_snapshot()
+            with self._lock:
+                self._stack.pop()
+                self._record(frame, snapshot)
+                if self._stack:
+                    self._resume(self._stack[-1])
+
+    def _record(self, frame: _Frame, snapshot: tracemalloc.Snapshot):
+        result = self.stages[frame.name]
+        result.calls += 1
+        result.wall_seconds += time.perf_counter() - frame.started
+        result.peak_bytes = max(result.peak_bytes, frame.peak_bytes)
+        stats = pstats.Stats(frame.profile)
+        if result.stats is None:
+            result.stats = stats
+        else:
+            result.stats.add(stats)
+        # 割り当ての内訳は、ピークが最大だった回のスナップショットを残す
+        if result.snapshot is None or frame.peak_bytes >= result.peak_bytes:
+            result.snapshot = snapshot
+
+    def write_report(self) -> str:
+        """
+        段階ごとの成果物（.prof、サンプリングした場合は .folded）と、
+        上位N件をまとめたテキストのレポートを出力ディレクトリに書き出し、レポートのパスを返す。
+        """
+        run_dir = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        os.makedirs(run_dir, exist_ok=True)
+
+        report = io.StringIO()
+        report.write("段階ごとのプロファイル\n\n")
+        report.write(f"{'段階':<20}{'回数':>6}{'経過時間(秒)':>14}{'ピークメモリ(KiB)':>18}\n")
+        for result in self.stages.values():
+            report.write(
+                f"{result.name:<20}{result.calls:>6}{result.wall_seconds:>14.3f}{result.peak_bytes / 1024:>18.1f}\n"
+            )
+
+        for result in self.stages.values():
+            file_stem = os.path.join(run_dir, result.name.replace(os.sep, "_"))
+            report.write(f"\n===== {result.name} =====\n")
+            if result.stats is not None:
+                result.stats.dump_stats(f"{file_stem}.prof")
+                result.stats.stream = report
+                report.write(f"\n-- 累積時間の上位{self.top_n}件 --\n")
+                result.stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+                report.write(f"\n-- 関数内の時間の上位{self.top_n}件 --\n")
+                result.stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top_n)
+            if result.snapshot is not None:
+                report.write(f"\n-- メモリ割り当ての上位{self.top_n}件 --\n")
+                for stat in result.snapshot.statistics("lineno")[:self.top_n]:
+                    report.write(f"{stat}\n")
+            if result.samples:
+                with open(f"{file_stem}.folded", "w", encoding="utf-8") as f:
+                    for stack, count in result.samples.most_common():
+                        f.write(f"{stack} {count}\n")
+                report.write(f"\n-- サンプリング（{sum(result.samples.values())}件）の上位{self.top_n}件 --\n")
+                for stack, count in result.samples.most_common(self.top_n):
+                    report.write(f"{count:>6} {stack.rsplit(';', 1)[-1]}\n")
+
+        report_path = os.path.join(run_dir, "report.txt")
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        logger.info(f"プロファイルの結果を書き出しました: {report_path}")
+        return report_path
+
+
+def activate(profiler: Optional[Profiler]):
+    """実行中のプロファイラを設定する（Noneで解除）"""
+    global _active
+    if _active is not None:
+        _active.stop()
+    _active = profiler
+    if profiler is not None:
+        profiler.start()
+
+
+def stage(name: str):
+    """
+    段階を計測するコンテキストマネージャを返す。
+    プロファイルモードでない場合は何もしない。
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.stage(name)
@@ -1,6 +1,14 @@
+import os
+import copy
 import feedparser
-from typing import List, Dict
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from urllib.parse import urljoin
 import db_manager
+import websub
+import extraction_rules
+from run_control import Deadline
+from article_record import Article, ContentStore
+from article_selector import TopKSelector
 import time
 import requests
 from bs4 import BeautifulSoup
@@ -8,62 +16,282 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def get_article_content(url: str) -> str:
-    """URLから記事の本文を取得する"""
+# 記事コンテナから削除する不要な要素（ヘッダー、フッター、サイドバーなど）
+STRIP_SELECTORS = ['header', 'footer', 'nav', 'aside', '.sidebar', '.related-posts']
+# 本文として扱う最小の文字数
+MIN_CONTENT_LENGTH = 100
+# 記事の取得のタイムアウト（秒）
+FETCH_TIMEOUT = 10
+# 埋め込みカードのメタデータとして読むmetaタグ（キーごとに、OpenGraph、Twitterカードの順に探す）
+CARD_META_PROPERTIES = {
+    "title": ("og:title", "twitter:title"),
+    "description": ("og:description", "twitter:description"),
+    "image": ("og:image:secure_url", "og:image", "twitter:image", "twitter:image:src"),
+}
+
+
+def _extract_text(article_body) -> str:
+    """
+    記事コンテナから不要な要素を削除し、段落のテキストを抽出する。
+    要素の削除はコンテナの複製に対して行い、抽出に失敗した後の探索が元の解析結果を使えるようにする。
+    """
+    article_body = copy.copy(article_body)
+    for selector in STRIP_SELECTORS:
+        for s in article_body.select(selector):
+            s.decompose()
+    return ' '.join(p.get_text() for p in article_body.find_all('p'))
+
+
+def extract_card_metadata(soup: BeautifulSoup, url: str) -> Dict[str, str]:
+    """
+    解析済みのHTMLから、OpenGraph / Twitterカードのタイトル・説明・画像URLを取り出す。
+    画像URLは記事のURLを基準に絶対URLにする。見つからない項目は含めない。
+    """
+    metadata = {}
+    for key, properties in CARD_META_PROPERTIES.items():
+        for prop in properties:
+            tag = soup.find("meta", attrs={"property": prop}) or soup.find("meta", attrs={"name": prop})
+            value = (tag.get("content") or "").strip() if tag else ""
+            if value:
+                metadata[key] = urljoin(url, value) if key == "image" else value
+                break
+    return metadata
+
+
+def get_article_content(url: str, feed_url: Optional[str] = None, timeout: float = FETCH_TIMEOUT) -> str:
+    """
+    URLから記事の本文を取得する。
+    設定（CONTENT_SELECTORS）のセレクタ、またはドメインごとに学習したセレクタがあればそれを最初に試し、
+    本文が取れた場合は一般的な記事コンテナの探索を省略する。
+    """
+    return fetch_article(url, feed_url, timeout)[0]
+
+
+def fetch_article(url: str, feed_url: Optional[str] = None,
+                  timeout: float = FETCH_TIMEOUT) -> Tuple[str, Dict[str, str]]:
+    """
+    get_article_contentと同様に記事の本文を取得し、(本文, 埋め込みカードのメタデータ) を返す。
+    メタデータは本文の抽出と同じ解析結果から取り出すため、ページを再度取得することはない。
+    取得に失敗した場合は ("", {}) を返す。
+    """
     try:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=timeout)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'html.parser')
+        metadata = extract_card_metadata(soup, url)
+
+        # 設定または学習済みのセレクタを試す
+        selector = extraction_rules.override_selector(url, feed_url) or extraction_rules.learned_selector(url)
+        if selector:
+            start = time.perf_counter()
+            article_body = soup.select_one(selector)
+            text = _extract_text(article_body) if article_body else ""
+            if len(text) > MIN_CONTENT_LENGTH:
+                extraction_rules.record_hit(url, selector, time.perf_counter() - start)
+                return text, metadata
+            extraction_rules.record_failure(url, selector)
 
         # 一般的な記事コンテナを試す
-        article_body = soup.find('article') or soup.find('main') or soup.find(class_='post-content') or soup.find(id='content')
+        start = time.perf_counter()
+        matched, article_body = None, None
+        for candidate in extraction_rules.CASCADE_SELECTORS:
+            article_body = soup.select_one(candidate)
+            if article_body:
+                matched = candidate
+                break
 
         if article_body:
-            # 不要な要素（ヘッダー、フッター、サイドバーなど）を削除
-            for selector in ['header', 'footer', 'nav', 'aside', '.sidebar', '.related-posts']:
-                for s in article_body.select(selector):
-                    s.decompose()
-            
-            # テキストを抽出
-            text = ' '.join(p.get_text() for p in article_body.find_all('p'))
-            if len(text) > 100: # ある程度の長さがあるか確認
-                return text
+            text = _extract_text(article_body)
+            if len(text) > MIN_CONTENT_LENGTH: # ある程度の長さがあるか確認
+                extraction_rules.record_cascade(url, matched, time.perf_counter() - start)
+                return text, metadata
 
         # フォールバックとして、すべての<p>タグからテキストを抽出
-        return ' '.join(p.get_text() for p in soup.find_all('p'))
+        text = ' '.join(p.get_text() for p in soup.find_all('p'))
+        extraction_rules.record_cascade(url, None, time.perf_counter() - start)
+        return text, metadata
 
     except requests.exceptions.RequestException as e:
         logger.error(f"記事の取得中にエラーが発生しました ({url}): {e}")
-        return ""
+        return "", {}
 
 
-def fetch_new_articles(rss_urls: List[str]) -> List[Dict[str, str]]:
+def fetch_feed(url: str, timeout: float = FETCH_TIMEOUT) -> Any:
+    """
+    フィードを timeout（秒）を指定して取得し、feedparserで解析した結果を返す。
+    取得に失敗した場合は、エントリのない解析結果を返す。
+    """
+    try:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"フィードの取得中にエラーが発生しました: {url}, {e}")
+        return feedparser.FeedParserDict(entries=[], bozo=True, bozo_exception=e)
+    # 相対URLや文字コードは、URLから取得した場合と同じく応答のヘッダーをもとに解決する
+    headers = {key.lower(): value for key, value in response.headers.items()}
+    headers.setdefault("content-location", response.url)
+    return feedparser.parse(response.content, response_headers=headers)
+
+
+def load_feed(url: str, feeds: Dict[str, Any], pushed_ids: List[int],
+              deadline: Optional[Deadline] = None) -> Optional[Any]:
+    """
+    フィードを読み込んで feeds（フィードURL -> 取得結果）に保存し、取得結果を返す。
+    取得済みのフィードは再利用する。
+    環境変数 WEBSUB_CALLBACK_URL が設定されている場合、ハブで購読中のフィードはポーリングせず配信キューから読み、
+    読んだ配信のIDを pushed_ids に追加する（各エントリの websub_queue_id にも配信のIDが入る）。
+    締め切りを過ぎたためにポーリングを省略した場合はNoneを返す。
+    """
+    if url in feeds:
+        logger.info(f"取得済みのフィードを再利用します: {url}")
+        return feeds[url]
+
+    websub_callback = os.getenv("WEBSUB_CALLBACK_URL")
+    if websub_callback and websub.is_active(url):
+        logger.info(f"WebSubで配信されたフィードを読み込み中: {url}")
+        ids, feeds[url] = websub.take_pushed(url)
+        pushed_ids.extend(ids)
+    elif deadline is not None and deadline.expired():
+        logger.warning(f"締め切りを過ぎたため、フィードの取得を省略します: {url}")
+        return None
+    else:
+        logger.info(f"フィードを取得中: {url}")
+        feeds[url] = fetch_feed(url, FETCH_TIMEOUT if deadline is None else deadline.timeout(FETCH_TIMEOUT))
+        if websub_callback:
+            websub.ensure_subscribed(feeds[url], url, websub_callback)
+    return feeds[url]
+
+
+def iter_unseen_entries(account: Dict[str, Any], feeds: Dict[str, Any], pushed_ids: List[int],
+                        deadline: Optional[Deadline] = None) -> Iterator[Dict[str, Any]]:
+    """
+    アカウントが購読するフィードの未処理のエントリを、本文を取得せずに1件ずつ返す。
+    処理済みかどうかはフィードごとにまとめてデータベースに問い合わせる。
+    各エントリは title / link / summary / feed_url / published_time を持つ辞書で、
+    ランク付け（タイトルとURLだけを使う）にはそのまま渡せる。
+    """
+    name = account["name"]
+    seen_links = set()
+    for url in account["rss_urls"]:
+        feed = load_feed(url, feeds, pushed_ids, deadline)
+        if feed is None:
+            continue
+        links = [entry.link for entry in feed.entries if entry.link not in seen_links]
+        unseen = set(db_manager.unseen_urls(links, name))
+        for entry in feed.entries:
+            if entry.link not in unseen or entry.link in seen_links:
+                continue
+            seen_links.add(entry.link)
+            yield {
+                "title": entry.title,
+                "link": entry.link,
+                "summary": entry.get("summary", ""),
+                "feed_url": url,
+                "published_time": entry.get('published_parsed') or entry.get('updated_parsed'),
+            }
+
+
+def fetch_new_articles(rss_urls: List[str], account: str = db_manager.DEFAULT_ACCOUNT,
+                       max_articles: Optional[int] = None) -> List[Dict[str, str]]:
     """
     指定されたRSSフィードURLのリストから新しい記事を取得する。
     データベースに既に存在する記事は除外する。
+    max_articles を指定した場合は、発行日時が新しい記事を最大その件数だけ返す。
     記事は発行日時の昇順（古いものから新しいもの）でソートされる。
     """
-    new_articles = []
-    for url in rss_urls:
-        logger.info(f"フィードを取得中: {url}")
-        feed = feedparser.parse(url)
-        for entry in feed.entries:
+    accounts = [{"name": account, "rss_urls": rss_urls}]
+    return fetch_new_articles_for_accounts(accounts, max_articles)[account]
+
+
+def fetch_new_articles_for_accounts(accounts: List[Dict[str, Any]],
+                                    max_articles: Optional[int] = None,
+                                    deadline: Optional[Deadline] = None,
+                                    handled: Optional[Dict[str, List[int]]] = None) -> Dict[str, List[Dict[str, str]]]:
+    """
+    複数アカウントの新しい記事をまとめて取得する。
+    複数のアカウントが同じフィードを購読していても、フィードの取得は1回だけ行い、
+    同じ記事が複数のアカウントで新着となっても、本文のスクレイピングは1回だけ行う。
+    記事はArticleレコードとして返し、本文は一時ファイルに書き出して必要になった時点で読み込む。
+    重複チェックはアカウントごとに行い、アカウント名をキーとした記事リストの辞書を返す。
+
+    各フィードのエントリはTopKSelectorで逐次的に選別し、アカウントごとに発行日時が新しい
+    max_articles 件（Noneの場合は全件）だけを残す。本文のスクレイピングは選ばれた記事に対してだけ行う。
+    環境変数 WEBSUB_CALLBACK_URL が設定されている場合、ハブに対応したフィードはWebSubで購読し、
+    購読が有効な間はポーリングの代わりに配信キューに届いた内容を読む。
+    handled を指定した場合、アカウントごとに、全エントリが処理済みか返す記事に含まれる配信のIDを格納する。
+    呼び出し元は記事を永続化（実行台帳への記録や処理済みとしての登録）した後で websub.mark_handled に渡す。
+    配信キューはここでは処理済みにしない（上位K件に入らなかった記事などを次回も読めるようにする）。
+    各リストは発行日時の昇順（古いものから新しいもの）でソートされる。
+
+    deadline を指定した場合、締め切りを過ぎた後はフィードのポーリングと本文のスクレイピングを打ち切り、
+    それまでに本文を取得できた記事だけを返す（残りの記事は処理済みにならないため、次回の実行で取得される）。
+    本文の取得のタイムアウトも残り時間に合わせて短くする。
+    """
+    deadline = deadline or Deadline()
+    # 発行日時のないエントリは、この実行の開始時刻に発行されたものとして扱う
+    run_timestamp = time.time()
+    extraction_rules.reset_stats()
+    pushed_ids = []  # 今回読んだWebSub配信キューのID
+    feeds = {}  # フィードURL -> 取得結果
+    articles = {}  # 記事URL -> 記事レコード（本文はcontent_storeに書き出す）
+    content_store = ContentStore()
+    new_articles_by_account = {}
+
+    for account in accounts:
+        name = account["name"]
+        selector = TopKSelector(max_articles, run_timestamp)
+        seen_links = set()
+        queue_links = {}  # 配信のID -> 未処理のエントリのURL
+        for url in account["rss_urls"]:
+            feed = load_feed(url, feeds, pushed_ids, deadline)
+            if feed is None:
+                continue
+
+            for entry in feed.entries:
+                article_url = entry.link
+                duplicate = article_url in seen_links
+                is_new = duplicate or not db_manager.url_exists(article_url, name)
+                queue_id = entry.get("websub_queue_id")
+                if queue_id is not None:
+                    pending = queue_links.setdefault(queue_id, set())
+                    if is_new:
+                        pending.add(article_url)
+                if duplicate or not is_new:
+                    continue
+                seen_links.add(article_url)
+                published_time = entry.get('published_parsed') or entry.get('updated_parsed')
+                selector.push((url, entry), published_time)
+
+        if max_articles is not None and selector.seen > max_articles:
+            logger.info(f"[{name}] 新着記事が{selector.seen}件見つかりました。最新{max_articles}件に絞り込みます。")
+
+        new_articles = []
+        for url, entry in selector.results():
             article_url = entry.link
-            if not db_manager.url_exists(article_url):
+            if article_url not in articles:
+                if deadline.expired():
+                    logger.warning(f"[{name}] 締め切りを過ぎたため、本文の取得を打ち切ります: {entry.title}")
+                    continue
                 logger.info(f"新しい記事が見つかりました: {entry.title}")
                 # 記事の全文を取得
-                content = get_article_content(article_url)
-                
-                published_time = entry.get('published_parsed') or entry.get('updated_parsed')
-                new_articles.append({
-                    "title": entry.title,
-                    "link": article_url,
-                    "summary": entry.summary,
-                    "content": content or entry.summary, # コンテンツが取れなければサマリーを使う
-                    "published_time": published_time
-                })
-
-    # 記事を発行日時でソートする（古いものが先頭）
-    new_articles.sort(key=lambda x: x['published_time'] or time.gmtime())
-
-    return new_articles
+                content, metadata = fetch_article(article_url, url, timeout=deadline.timeout(FETCH_TIMEOUT))
+                articles[article_url] = Article(
+                    title=entry.title,
+                    link=article_url,
+                    summary=entry.summary,
+                    # 本文が取れなければフィードのサマリー、それもなければog:descriptionを使う
+                    content=content or entry.summary or metadata.get('description', ''),
+                    published_time=entry.get('published_parsed') or entry.get('updated_parsed'),
+                    feed_url=url,
+                    store=content_store,
+                    metadata=metadata,
+                )
+            new_articles.append(articles[article_url])
+
+        new_articles_by_account[name] = new_articles
+        if handled is not None:
+            returned = {article["link"] for article in new_articles}
+            handled[name] = [queue_id for queue_id, links in queue_links.items() if links <= returned]
+
+    extraction_rules.log_stats()
+    return new_articles_by_account
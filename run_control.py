@@ -0,0 +1,114 @@
+import os
+import time
+import fcntl
+import logging
+from typing import Callable, Optional
+import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 実行全体の締め切り（秒）のデフォルト値（環境変数 RUN_DEADLINE_SECONDS で変更可能、0で締め切りなし）
+DEFAULT_RUN_DEADLINE_SECONDS = 1200
+# 各段階が使える時間の、その時点で残っている時間に対する割合
+STAGE_SHARES = {
+    "fetch": 0.5,    # フィードの取得と本文のスクレイピング
+    "process": 0.8,  # ランク付け・要約・アウトボックスへの追加
+    "drain": 1.0,    # アウトボックスの送信
+}
+# 締め切り間際でも、リクエストに最低限与えるタイムアウト（秒）
+MIN_TIMEOUT = 1.0
+# 実行ロックの取得を待つ間隔（秒）
+LOCK_POLL_INTERVAL = 0.5
+
+
+class Deadline:
+    """
+    締め切りまでの残り時間を管理する。secondsにNoneを指定した場合は締め切りなしとして扱う。
+    split で、残り時間の一部を締め切りとする段階ごとの締め切りを作る。
+    処理側は expired で打ち切りを判断し（協調的なキャンセル）、timeout でリクエストのタイムアウトを残り時間に合わせる。
+    """
+
+    def __init__(self, seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.expires_at = None if seconds is None else clock() + seconds
+
+    def remaining(self) -> float:
+        """締め切りまでの残り時間（秒）を返す。締め切りがない場合は無限大"""
+        if self.expires_at is None:
+            return float("inf")
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, limit: float) -> float:
+        """limit と残り時間の小さい方を、リクエストのタイムアウトとして返す"""
+        return max(min(limit, self.remaining()), MIN_TIMEOUT)
+
+    def split(self, share: float) -> "Deadline":
+        """残り時間のうち share の割合を使う、段階の締め切りを返す"""
+        child = Deadline(None, self._clock)
+        if self.expires_at is not None:
+            child.expires_at = self._clock() + self.remaining() * share
+        return child
+
+    def for_stage(self, stage: str) -> "Deadline":
+        """STAGE_SHARES の割合で段階の締め切りを返す"""
+        return self.split(STAGE_SHARES[stage])
+
+
+def run_deadline() -> Deadline:
+    """環境変数 RUN_DEADLINE_SECONDS から実行全体の締め切りを作る"""
+    seconds = float(os.getenv("RUN_DEADLINE_SECONDS", DEFAULT_RUN_DEADLINE_SECONDS))
+    return Deadline(seconds if seconds > 0 else None)
+
+
+def lock_path() -> str:
+    """データベースと同じ場所に置く、実行ロックのファイルのパスを返す"""
+    return f"{db_manager.DB_NAME}.lock"
+
+
+class RunLock:
+    """
+    ファイルロック（flock）による排他ロック。同じデータベースを使うプロセスが同時に実行されるのを防ぐ。
+    ロックはプロセスが終了すると（異常終了した場合も）OSによって解放される。
+    """
+
+    def __init__(self, path: Optional[str] = None, wait_seconds: float = 0):
+        self.path = path or lock_path()
+        self.wait_seconds = wait_seconds
+        self._file = None
+
+    def acquire(self) -> bool:
+        """ロックを取得する。wait_seconds 秒まで待っても取得できなければFalseを返す"""
+        lock_file = open(self.path, "a+")
+        give_up_at = time.monotonic() + self.wait_seconds
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= give_up_at:
+                    lock_file.close()
+                    return False
+                time.sleep(min(LOCK_POLL_INTERVAL, max(give_up_at - time.monotonic(), 0)))
+        # 調査用に、ロックを持っているプロセスのIDを書き込む
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
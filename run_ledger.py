@@ -0,0 +1,82 @@
+import sqlite3
+import json
+import time
+from typing import Any, Dict
+import db_manager
+
+# パイプラインの段階（この順に進む）
+STAGE_CANDIDATES = "candidates"
+STAGE_RANKING = "ranking"
+STAGE_SUMMARY = "summary"
+
+STATE_DONE = "done"
+
+def init_ledger():
+    """実行台帳（段階ごとの途中結果）と失敗回数のテーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS run_ledger (
+                account TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                state TEXT NOT NULL,
+                payload TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (account, stage)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS run_failures (
+                account TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+def load_stages(account: str) -> Dict[str, Any]:
+    """前回の実行で完了した段階の出力を、段階名をキーとした辞書で返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT stage, payload FROM run_ledger WHERE account = ? AND state = ?",
+            (account, STATE_DONE)
+        )
+        return {stage: json.loads(payload) for stage, payload in cursor.fetchall()}
+
+def has_pending_run(account: str) -> bool:
+    """再開待ちの実行があるかどうかを確認する"""
+    return STAGE_CANDIDATES in load_stages(account)
+
+def save_stage(account: str, stage: str, payload: Any):
+    """段階の出力を完了状態として記録する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO run_ledger (account, stage, state, payload, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (account, stage, STATE_DONE, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        conn.commit()
+
+def record_failure(account: str, error: str) -> int:
+    """実行の失敗を記録し、これまでの連続失敗回数を返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO run_failures (account, attempts, last_error, updated_at) VALUES (?, 1, ?, ?)
+            ON CONFLICT(account) DO UPDATE SET
+                attempts = attempts + 1, last_error = excluded.last_error, updated_at = excluded.updated_at
+        """, (account, error, time.time()))
+        cursor.execute("SELECT attempts FROM run_failures WHERE account = ?", (account,))
+        attempts = cursor.fetchone()[0]
+        conn.commit()
+        return attempts
+
+def clear(account: str):
+    """実行が完了（または断念）したため、アカウントの実行台帳と失敗回数を削除する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM run_ledger WHERE account = ?", (account,))
+        cursor.execute("DELETE FROM run_failures WHERE account = ?", (account,))
+        conn.commit()
@@ -1,5 +1,14 @@
 import sys
 import os
+import pytest
 
 # プロジェクトのルートディレクトリをPythonの検索パスに追加
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def temp_db(mocker, tmp_path):
+    """テストごとの一時データベースを db_manager.DB_NAME に設定し、そのパスを返すフィクスチャ"""
+    path = str(tmp_path / "test.db")
+    mocker.patch("db_manager.DB_NAME", path)
+    return path
@@ -0,0 +1,70 @@
+import pytest
+import os
+import json
+from account_config import load_accounts, DEFAULT_ACCOUNT
+
+@pytest.fixture
+def clean_env(mocker):
+    """アカウント関連の環境変数を空にするフィクスチャ"""
+    mocker.patch.dict(os.environ, {
+        "BLUESKY_HANDLE": "user.bsky.social",
+        "BLUESKY_APP_PASSWORD": "password1234",
+        "RSS_URLS": "",
+    })
+    os.environ.pop("ACCOUNTS_FILE", None)
+
+def test_load_single_account_from_env(clean_env, mocker):
+    """ACCOUNTS_FILEが未設定の場合、従来の環境変数から単一アカウントが作られるかのテスト"""
+    mocker.patch.dict(os.environ, {"RSS_URLS": "http://a.com/rss, http://b.com/rss"})
+
+    accounts = load_accounts()
+
+    assert accounts == [{
+        "name": DEFAULT_ACCOUNT,
+        "handle": "user.bsky.social",
+        "app_password": "password1234",
+        "rss_urls": ["http://a.com/rss", "http://b.com/rss"],
+    }]
+
+def test_load_single_account_without_rss_urls(clean_env):
+    """RSS_URLSも未設定の場合は空のリストを返すかのテスト"""
+    assert load_accounts() == []
+
+def test_load_multiple_accounts_from_file(clean_env, mocker, tmp_path):
+    """ACCOUNTS_FILEから複数アカウントを読み込めるかのテスト"""
+    accounts_file = tmp_path / "accounts.json"
+    accounts_file.write_text(json.dumps([
+        {"name": "tech", "bluesky_handle": "tech.bsky.social", "bluesky_app_password": "pw1", "rss_urls": ["http://a.com/rss"]},
+        {"name": "news", "bluesky_handle": "news.bsky.social", "bluesky_app_password": "pw2", "rss_urls": "http://a.com/rss,http://b.com/rss"},
+        {"name": "tech", "rss_urls": ["http://dup.com/rss"]},  # 名前が重複
+        {"name": "empty", "rss_urls": []},  # フィードが未設定
+        {"name": "nocred", "bluesky_handle": "nocred.bsky.social", "rss_urls": ["http://a.com/rss"]},  # パスワードが未設定
+    ]), encoding="utf-8")
+    mocker.patch.dict(os.environ, {"ACCOUNTS_FILE": str(accounts_file)})
+
+    accounts = load_accounts()
+
+    assert [a["name"] for a in accounts] == ["tech", "news"]
+    assert accounts[0]["handle"] == "tech.bsky.social"
+    assert accounts[1]["app_password"] == "pw2"
+    assert accounts[1]["rss_urls"] == ["http://a.com/rss", "http://b.com/rss"]
+
+def test_load_accounts_missing_file(clean_env, mocker, tmp_path):
+    """ACCOUNTS_FILEが存在しない場合は空のリストを返すかのテスト"""
+    mocker.patch.dict(os.environ, {"ACCOUNTS_FILE": str(tmp_path / "missing.json")})
+    assert load_accounts() == []
+
+def test_load_accounts_does_not_use_env_credentials_for_file(clean_env, mocker, tmp_path):
+    """ファイルのアカウントに認証情報がない場合、環境変数の認証情報を使わずにスキップするかのテスト"""
+    accounts_file = tmp_path / "accounts.json"
+    accounts_file.write_text(json.dumps([{"name": "tech", "rss_urls": ["http://a.com/rss"]}]), encoding="utf-8")
+    mocker.patch.dict(os.environ, {"ACCOUNTS_FILE": str(accounts_file)})
+    assert load_accounts() == []
+
+@pytest.mark.parametrize("content", [{"name": "tech"}, ["tech", None]])
+def test_load_accounts_invalid_structure(clean_env, mocker, tmp_path, content):
+    """ファイルの内容がアカウントのオブジェクトのリストでない場合、例外を出さずにスキップするかのテスト"""
+    accounts_file = tmp_path / "accounts.json"
+    accounts_file.write_text(json.dumps(content), encoding="utf-8")
+    mocker.patch.dict(os.environ, {"ACCOUNTS_FILE": str(accounts_file)})
+    assert load_accounts() == []
@@ -0,0 +1,64 @@
+import pytest
+import time
+import json
+from article_record import Article, ContentStore
+
+def test_content_store_roundtrip():
+    """ContentStoreに書き出した本文を参照から読み出せるかのテスト"""
+    store = ContentStore()
+    ref1 = store.put("最初の本文")
+    ref2 = store.put("2番目の本文 with ascii")
+
+    assert store.get(ref2) == "2番目の本文 with ascii"
+    assert store.get(ref1) == "最初の本文"
+    store.close()
+
+def test_article_loads_content_lazily():
+    """Articleは本文をストアに書き出し、アクセス時に読み込むかのテスト"""
+    store = ContentStore()
+    article = Article("タイトル", "http://example.com/1", "概要", "本文" * 1000,
+                      time.gmtime(1704067200), "http://example.com/feed.xml", store)
+
+    # メモリ上には本文ではなく参照だけを持つ
+    assert isinstance(article._content, tuple)
+    assert article.content == "本文" * 1000
+    assert article.published_time == time.gmtime(1704067200)
+
+def test_article_interns_feed_url():
+    """同じフィードURLの文字列が記事間で共有されるかのテスト"""
+    feed_url = "".join(["http://example.com/", "feed.xml"])
+    other = "".join(["http://example.com/", "feed.xml"])
+    a1 = Article("A", "http://example.com/a", "", "", feed_url=feed_url)
+    a2 = Article("B", "http://example.com/b", "", "", feed_url=other)
+
+    assert a1.feed_url is a2.feed_url
+
+def test_article_has_no_instance_dict():
+    """__slots__により属性の追加ができないかのテスト"""
+    article = Article("A", "http://example.com/a", "", "")
+    with pytest.raises(AttributeError):
+        article.extra = 1
+
+def test_article_is_dict_compatible():
+    """従来の辞書形式の記事と同じようにアクセスでき、辞書に変換できるかのテスト"""
+    article = Article("タイトル", "http://example.com/1", "概要", "本文", store=ContentStore())
+
+    assert article["title"] == "タイトル"
+    assert article["content"] == "本文"
+    assert article["published_time"] is None
+    assert article.get("missing", "default") == "default"
+    assert "link" in article
+    with pytest.raises(KeyError):
+        article["missing"]
+
+    as_dict = dict(article)
+    assert as_dict == {
+        "title": "タイトル",
+        "link": "http://example.com/1",
+        "summary": "概要",
+        "content": "本文",
+        "published_time": None,
+        "metadata": None,
+    }
+    # 実行台帳に記録できるようJSONに変換できる
+    json.dumps(as_dict)
@@ -0,0 +1,48 @@
+import pytest
+import time
+import random
+from article_selector import TopKSelector, select_top_k
+
+RUN_TIMESTAMP = 1704500000
+
+def test_select_top_k_keeps_newest_in_ascending_order():
+    """発行日時が新しいK件が昇順で選ばれるかのテスト"""
+    items = [("a", time.gmtime(300)), ("b", time.gmtime(100)), ("c", time.gmtime(500)), ("d", time.gmtime(200))]
+
+    assert select_top_k(items, 2, RUN_TIMESTAMP) == ["a", "c"]
+
+def test_select_top_k_matches_sort_then_slice():
+    """全件をソートして末尾K件を取る従来の方法と同じ結果になるかのテスト（同時刻を含む）"""
+    rng = random.Random(0)
+    items = [(i, time.gmtime(rng.randint(0, 50))) for i in range(500)]
+
+    expected = [item for item, _ in sorted(items, key=lambda x: x[1])][-20:]
+
+    assert select_top_k(items, 20, RUN_TIMESTAMP) == expected
+
+def test_undated_entries_use_run_timestamp():
+    """発行日時のないエントリは実行開始時刻のものとして扱われるかのテスト"""
+    items = [("undated1", None), ("future", time.gmtime(RUN_TIMESTAMP + 10)), ("old", time.gmtime(100)), ("undated2", None)]
+
+    assert select_top_k(items, None, RUN_TIMESTAMP) == ["old", "undated1", "undated2", "future"]
+
+def test_selector_reports_acceptance_and_seen_count():
+    """push が上位K件に入ったかを返し、受け取った件数を数えるかのテスト"""
+    selector = TopKSelector(1, RUN_TIMESTAMP)
+
+    assert selector.push("old", time.gmtime(100)) is True
+    assert selector.push("older", time.gmtime(50)) is False
+    assert selector.push("new", time.gmtime(200)) is True
+
+    assert selector.seen == 3
+    assert len(selector) == 1
+    assert selector.results() == ["new"]
+
+def test_selector_with_zero_k():
+    """K=0の場合は何も選ばれないかのテスト"""
+    assert select_top_k([("a", time.gmtime(100))], 0, RUN_TIMESTAMP) == []
+
+def test_selector_rejects_negative_k():
+    """Kに負の値を指定した場合はエラーになるかのテスト"""
+    with pytest.raises(ValueError):
+        TopKSelector(-1, RUN_TIMESTAMP)
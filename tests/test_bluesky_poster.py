@@ -1,7 +1,7 @@
 import pytest
 import os
 from atproto import models
-from bluesky_poster import post_thread
+from bluesky_poster import post_thread, send_thread
 
 @pytest.fixture
 def mock_atproto_client(mocker):
@@ -101,7 +101,7 @@ def test_post_single_post_success(mock_atproto_client):
     result = post_thread(posts)
 
     mock_atproto_client.login.assert_called_once()
-    mock_atproto_client.send_post.assert_called_once_with(text="Just one post", embed=None)
+    mock_atproto_client.send_post.assert_called_once_with(text="Just one post", embed=None, facets=None)
     assert result is True
 
 def test_post_thread_api_error(mock_atproto_client):
@@ -127,3 +127,23 @@ def test_post_thread_login_error(mock_atproto_client):
 
     mock_atproto_client.send_post.assert_not_called()
     assert result is False
+
+def test_send_thread_returns_refs(mock_atproto_client):
+    """send_threadが投稿した各ポストの参照を返すかのテスト"""
+    mock_refs = [
+        models.ComAtprotoRepoStrongRef.Main(uri=f"at://did:plc:fake/app.bsky.feed.post/post{i}", cid=f"cid{i}")
+        for i in range(2)
+    ]
+    mock_atproto_client.send_post.side_effect = mock_refs
+
+    refs = send_thread([{'text': "Parent post"}, {'text': "Reply 1"}], "other.bsky.social", "otherpass")
+
+    mock_atproto_client.login.assert_called_once_with("other.bsky.social", "otherpass")
+    assert [ref.uri for ref in refs] == [ref.uri for ref in mock_refs]
+
+def test_send_thread_raises_on_error(mock_atproto_client):
+    """send_threadはエラーを例外として送出するかのテスト"""
+    mock_atproto_client.send_post.side_effect = Exception("API Error")
+
+    with pytest.raises(Exception, match="API Error"):
+        send_thread([{'text': "Parent post"}])
@@ -0,0 +1,181 @@
+import pytest
+from catch_up import select_finalists, select_finalists_batched
+from run_control import Deadline
+
+
+def make_entries(n):
+    return [{"title": f"A{i}", "link": f"http://a.com/{i}"} for i in range(n)]
+
+
+class FakeRanker:
+    """リンクの番号が大きいほど重要とみなしてランク付けし、受け取ったバッチを記録する"""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def __call__(self, candidates):
+        self.batches.append(list(candidates))
+        if self.fail_on is not None and len(self.batches) == self.fail_on:
+            return []
+        return sorted(candidates, key=lambda e: int(e["link"].rsplit("/", 1)[1]), reverse=True)
+
+
+def test_select_finalists_picks_top_with_bounded_batches():
+    """大量のエントリから上位の記事を選び、ランク付けに渡す件数がバッチサイズ以下であることを確認するテスト"""
+    ranker = FakeRanker()
+    finalists, eliminated, complete = select_finalists(make_entries(100), ranker, batch_size=10, max_posts=3)
+
+    assert [e["link"] for e in finalists] == ["http://a.com/99", "http://a.com/98", "http://a.com/97"]
+    assert complete
+    assert all(len(batch) <= 10 for batch in ranker.batches)
+    # 読んだエントリは、勝ち残ったもの以外すべて敗退として返る
+    assert len(eliminated) == 97
+    assert set(eliminated) | {e["link"] for e in finalists} == {e["link"] for e in make_entries(100)}
+
+
+def test_select_finalists_with_few_entries():
+    ranker = FakeRanker()
+    finalists, eliminated, complete = select_finalists(make_entries(2), ranker, batch_size=10, max_posts=3)
+
+    assert [e["link"] for e in finalists] == ["http://a.com/1", "http://a.com/0"]
+    assert eliminated == []
+    assert complete
+    assert len(ranker.batches) == 1
+
+
+def test_select_finalists_without_entries():
+    ranker = FakeRanker()
+    assert select_finalists([], ranker) == ([], [], True)
+    assert ranker.batches == []
+
+
+def test_select_finalists_stops_when_ranking_fails():
+    """ランク付けに失敗した場合はその時点の勝者で打ち切り、判定していないエントリを敗退にしないことを確認するテスト"""
+    ranker = FakeRanker(fail_on=2)
+    finalists, eliminated, complete = select_finalists(make_entries(8), ranker, batch_size=4, max_posts=2)
+
+    # 1回目: 0-3 -> 3,2 / 2回目（失敗）: 3,2,4,5 -> 打ち切り
+    assert [e["link"] for e in finalists] == ["http://a.com/3", "http://a.com/2"]
+    assert eliminated == ["http://a.com/0", "http://a.com/1"]
+    assert not complete
+    assert len(ranker.batches) == 2
+
+
+def test_select_finalists_does_not_eliminate_when_ranking_always_fails():
+    ranker = FakeRanker(fail_on=1)
+    assert select_finalists(make_entries(50), ranker, batch_size=10, max_posts=3) == ([], [], False)
+
+
+def test_select_finalists_stops_at_deadline():
+    """締め切りを過ぎた場合、それまでに読んだエントリだけで打ち切り、残りは読まないことを確認するテスト"""
+    clock = [0.0]
+    deadline = Deadline(10, clock=lambda: clock[0])
+    consumed = []
+
+    def entries():
+        for entry in make_entries(50):
+            consumed.append(entry)
+            clock[0] += 1  # 1件読むごとに1秒進む
+            yield entry
+
+    ranker = FakeRanker()
+    finalists, eliminated, complete = select_finalists(entries(), ranker, batch_size=5,
+                                                       max_posts=2, deadline=deadline)
+
+    assert not complete
+    assert len(consumed) == 10
+    # 締め切りの後はランク付けせず、それまでの勝者を返す。ランク付けしていないエントリは未処理のまま残る
+    assert len(ranker.batches) == 2
+    assert [e["link"] for e in finalists] == ["http://a.com/7", "http://a.com/6"]
+    assert len(eliminated) == 6
+    assert "http://a.com/8" not in eliminated and "http://a.com/9" not in eliminated
+
+
+def test_select_finalists_does_not_rank_after_deadline():
+    """最後のバッチを読み終えた時点で締め切りを過ぎていれば、ランク付けを呼び出さないことを確認するテスト"""
+    clock = [0.0]
+    deadline = Deadline(10, clock=lambda: clock[0])
+    ranker = FakeRanker()
+
+    def entries():
+        yield from make_entries(3)
+        clock[0] = 20
+
+    finalists, eliminated, complete = select_finalists(entries(), ranker, batch_size=5,
+                                                       max_posts=2, deadline=deadline)
+
+    assert (finalists, eliminated, complete) == ([], [], False)
+    assert ranker.batches == []
+
+
+def test_select_finalists_rejects_invalid_max_posts():
+    with pytest.raises(ValueError):
+        select_finalists(make_entries(3), FakeRanker(), max_posts=0)
+
+
+class FakeBatchRanker(FakeRanker):
+    """複数の組をまとめてランク付けし、呼び出しごとの組の一覧を記録する"""
+
+    def __init__(self, fail_on=None):
+        super().__init__(fail_on)
+        self.calls = []
+
+    def __call__(self, groups):
+        self.calls.append([len(group) for group in groups])
+        return [FakeRanker.__call__(self, group) for group in groups]
+
+
+def test_select_finalists_batched_uses_few_batch_jobs():
+    """全組を1回の呼び出しでランク付けし、呼び出し回数がエントリ数の対数で済むことを確認するテスト"""
+    ranker = FakeBatchRanker()
+    finalists, eliminated, complete = select_finalists_batched(make_entries(1000), ranker, batch_size=20, max_posts=3)
+
+    assert [e["link"] for e in finalists] == ["http://a.com/999", "http://a.com/998", "http://a.com/997"]
+    assert complete
+    # 1000件 -> 150件 -> 24件 -> 6件 -> 3件
+    assert [len(groups) for groups in ranker.calls] == [50, 8, 2, 1]
+    assert all(size <= 20 for groups in ranker.calls for size in groups)
+    assert len(eliminated) == 997
+    assert set(eliminated) | {e["link"] for e in finalists} == {e["link"] for e in make_entries(1000)}
+
+
+def test_select_finalists_batched_ranks_small_input_once():
+    ranker = FakeBatchRanker()
+    finalists, eliminated, complete = select_finalists_batched(make_entries(2), ranker, batch_size=10, max_posts=3)
+
+    assert [e["link"] for e in finalists] == ["http://a.com/1", "http://a.com/0"]
+    assert eliminated == [] and complete
+    assert ranker.calls == [[2]]
+    assert select_finalists_batched([], FakeBatchRanker()) == ([], [], True)
+
+
+def test_select_finalists_batched_stops_when_ranking_fails():
+    """ランク付けに失敗した組がある場合は打ち切り、判定できた組の敗者だけを敗退にすることを確認するテスト"""
+    def rank_many(groups):
+        return [[] for _ in groups]
+
+    assert select_finalists_batched(make_entries(5), rank_many, batch_size=10, max_posts=2) == ([], [], False)
+
+    # 1段目の2組目（5-9）だけ失敗した場合、1組目（0-4）の敗者だけが敗退になる
+    ranker = FakeBatchRanker(fail_on=2)
+    finalists, eliminated, complete = select_finalists_batched(make_entries(10), ranker, batch_size=5, max_posts=2)
+
+    assert finalists == [] and not complete
+    assert sorted(eliminated) == ["http://a.com/0", "http://a.com/1", "http://a.com/2"]
+
+
+def test_select_finalists_batched_stops_reading_at_deadline():
+    clock = [0.0]
+    deadline = Deadline(10, clock=lambda: clock[0])
+
+    def entries():
+        for entry in make_entries(50):
+            clock[0] += 1
+            yield entry
+
+    finalists, eliminated, complete = select_finalists_batched(entries(), FakeBatchRanker(), batch_size=5,
+                                                               max_posts=2, deadline=deadline)
+
+    assert not complete
+    assert len(finalists) + len(eliminated) == 9
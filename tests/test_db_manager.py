@@ -72,3 +72,48 @@ def test_add_multiple_urls(db_connection):
         assert url_exists(url), f"追加したはずのURL {url} が見つかりません"
 
     assert not url_exists("https://example.com/not-added"), "追加していないURLが存在しています"
+
+def test_urls_are_tracked_per_account(db_connection):
+    """
+    同じURLでもアカウントごとに別々に重複管理されることを確認するテスト。
+    """
+    test_url = "https://example.com/shared-article"
+
+    add_url(test_url, "tech")
+
+    assert url_exists(test_url, "tech")
+    assert not url_exists(test_url, "news")
+    assert not url_exists(test_url)
+
+    # 同じURLを重複して追加してもエラーにならない
+    add_url(test_url, "tech")
+    add_url(test_url, "news")
+    assert url_exists(test_url, "news")
+
+def test_init_db_migrates_legacy_table(monkeypatch):
+    """
+    旧スキーマ（urlのみ）のarticlesテーブルが、デフォルトアカウントのデータとして移行されることを確認するテスト。
+    """
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE articles (url TEXT PRIMARY KEY)")
+    conn.execute("INSERT INTO articles (url) VALUES ('https://example.com/legacy')")
+    conn.commit()
+    monkeypatch.setattr("db_manager.sqlite3.connect", lambda db_name: conn)
+
+    init_db()
+
+    assert url_exists("https://example.com/legacy")
+    assert not url_exists("https://example.com/legacy", "tech")
+    conn.close()
+
+def test_add_urls_and_unseen_urls(db_connection, monkeypatch):
+    """複数のURLを一括で追加し、未処理のURLだけを元の順序で返すことを確認するテスト"""
+    from db_manager import add_urls, unseen_urls
+    monkeypatch.setattr("db_manager.LOOKUP_CHUNK_SIZE", 2)
+    urls = [f"https://example.com/{i}" for i in range(5)]
+
+    add_urls(urls[1:4], "tech")
+
+    assert unseen_urls(urls, "tech") == [urls[0], urls[4]]
+    assert unseen_urls(urls, "news") == urls
+    assert unseen_urls([], "tech") == []
@@ -0,0 +1,120 @@
+import pytest
+import os
+import json
+import extraction_rules
+from rss_fetcher import get_article_content
+
+LONG_TEXT = "本文のテキストです。" * 20
+
+def _html(body):
+    return f"<html><body><header><p>ヘッダー</p></header>{body}</body></html>".encode("utf-8")
+
+@pytest.fixture(autouse=True)
+def rules_db(temp_db):
+    """テスト用の一時データベースを使い、ルールのキャッシュと統計を初期化するフィクスチャ"""
+    extraction_rules.clear_cache()
+    yield
+    extraction_rules.clear_cache()
+
+@pytest.fixture
+def mock_get(mocker):
+    """requests.getをモック化し、URLごとのHTMLを返すフィクスチャ"""
+    pages = {}
+
+    def fake_get(url, timeout=None):
+        response = mocker.MagicMock()
+        response.content = pages[url]
+        return response
+    mocker.patch("rss_fetcher.requests.get", side_effect=fake_get)
+    return pages
+
+def test_learns_selector_and_skips_cascade(mock_get):
+    """本文を取得できたセレクタをドメインごとに学習し、次回からそれを最初に使うかのテスト"""
+    mock_get["http://blog.example.com/1"] = _html(f"<div class='post-content'><p>{LONG_TEXT}</p></div>")
+    mock_get["http://blog.example.com/2"] = _html(f"<div class='post-content'><p>{LONG_TEXT}2</p></div>")
+
+    assert get_article_content("http://blog.example.com/1") == LONG_TEXT
+    assert extraction_rules.learned_selector("http://blog.example.com/x") == ".post-content"
+
+    assert get_article_content("http://blog.example.com/2") == LONG_TEXT + "2"
+    assert extraction_rules.stats["cascade"] == 1
+    assert extraction_rules.stats["rule_hits"] == 1
+
+def test_learned_rules_persist_across_runs(mock_get):
+    """学習したルールがデータベースに保存され、次回の実行でも使われるかのテスト"""
+    mock_get["http://blog.example.com/1"] = _html(f"<main><p>{LONG_TEXT}</p></main>")
+    get_article_content("http://blog.example.com/1")
+
+    extraction_rules.clear_cache()
+
+    assert extraction_rules.learned_selector("http://blog.example.com/2") == "main"
+
+def test_override_selector_from_config(mock_get, mocker):
+    """設定（CONTENT_SELECTORS）のセレクタが最初に使われるかのテスト"""
+    mocker.patch.dict(os.environ, {"CONTENT_SELECTORS": json.dumps({
+        "http://news.example.com/feed.xml": ".entry-body",
+        "other.example.com": "#story",
+    })})
+    mock_get["http://news.example.com/1"] = _html(
+        f"<article><p>関連記事の一覧</p></article><div class='entry-body'><p>{LONG_TEXT}</p></div>"
+    )
+    mock_get["http://other.example.com/1"] = _html(f"<div id='story'><p>{LONG_TEXT}</p></div>")
+
+    assert get_article_content("http://news.example.com/1", "http://news.example.com/feed.xml") == LONG_TEXT
+    assert get_article_content("http://other.example.com/1") == LONG_TEXT
+    assert extraction_rules.stats["rule_hits"] == 2
+    assert extraction_rules.stats["cascade"] == 0
+    # 設定のセレクタは学習の対象にしない
+    assert extraction_rules.learned_selector("http://news.example.com/2") is None
+
+def test_failing_rule_is_invalidated(mock_get):
+    """学習したルールが連続して失敗した場合に破棄され、通常の探索に戻るかのテスト"""
+    mock_get["http://blog.example.com/1"] = _html(f"<article><p>{LONG_TEXT}</p></article>")
+    get_article_content("http://blog.example.com/1")
+
+    # サイトの構造が変わり、articleがなくなった
+    for i in range(extraction_rules.MAX_CONSECUTIVE_FAILURES):
+        url = f"http://blog.example.com/new{i}"
+        mock_get[url] = _html(f"<div id='content'><p>{LONG_TEXT}</p></div>")
+        assert get_article_content(url) == LONG_TEXT
+
+    assert extraction_rules.stats["rule_failures"] == extraction_rules.MAX_CONSECUTIVE_FAILURES
+    # 破棄された後、通常の探索で本文を取得できた新しいセレクタを学習している
+    assert extraction_rules.learned_selector("http://blog.example.com/x") == "#content"
+
+def test_failed_rule_does_not_damage_page_for_cascade(mock_get, mocker):
+    """ルールで本文を取得できなかった場合も、そのとき削除した要素を含めて通常の探索を行うかのテスト"""
+    mocker.patch.dict(os.environ, {"CONTENT_SELECTORS": json.dumps({"blog.example.com": ".wrap"})})
+    mock_get["http://blog.example.com/1"] = _html(
+        f"<div class='wrap'><aside><article><p>{LONG_TEXT}</p></article></aside><p>短い</p></div>"
+    )
+
+    assert get_article_content("http://blog.example.com/1") == LONG_TEXT
+    assert extraction_rules.stats["rule_failures"] == 1
+
+def test_rules_are_cached_per_database(mock_get, mocker, tmp_path):
+    """データベースを切り替えた場合、別のデータベースで学習したルールを使わないかのテスト"""
+    mock_get["http://blog.example.com/1"] = _html(f"<main><p>{LONG_TEXT}</p></main>")
+    get_article_content("http://blog.example.com/1")
+    assert extraction_rules.learned_selector("http://blog.example.com/2") == "main"
+
+    mocker.patch("db_manager.DB_NAME", str(tmp_path / "other.db"))
+    assert extraction_rules.learned_selector("http://blog.example.com/2") is None
+
+def test_fallback_to_all_paragraphs(mock_get):
+    """記事コンテナが見つからない場合は、すべての段落から本文を抽出し、ルールは学習しないかのテスト"""
+    mock_get["http://plain.example.com/1"] = b"<html><body><p>short</p><p>text</p></body></html>"
+
+    assert get_article_content("http://plain.example.com/1") == "short text"
+    assert extraction_rules.learned_selector("http://plain.example.com/1") is None
+
+def test_log_stats_reports_hit_rate(mock_get, caplog):
+    """ヒット率と短縮時間がログに出力されるかのテスト"""
+    for i in range(3):
+        mock_get[f"http://blog.example.com/{i}"] = _html(f"<article><p>{LONG_TEXT}</p></article>")
+        get_article_content(f"http://blog.example.com/{i}")
+
+    with caplog.at_level("INFO"):
+        extraction_rules.log_stats()
+
+    assert "ヒット 2/2件（100%）" in caplog.text
@@ -8,8 +8,11 @@ import importlib
 if "GEMINI_API_KEY" not in os.environ:
     os.environ["GEMINI_API_KEY"] = "dummy_key_for_testing"
 
+import time
+import grapheme
+from google.genai import types
 import gemini_processor
-from gemini_processor import rank_articles, summarize_article
+from gemini_processor import rank_articles, summarize_article, cut_at_sentence_boundary
 
 @pytest.fixture
 def articles():
@@ -20,6 +23,82 @@ def articles():
         {'title': '記事3', 'link': 'http://example.com/3'},
     ]
 
+class FakeStream:
+    """
+    generate_content_streamの代わりに使う、ローカルのストリーミング応答。
+    チャンクごとに生成時間（delay秒）がかかり、送信したチャンク数と出力トークン数を記録する。
+    """
+    def __init__(self, chunks, delay=0.01):
+        self.chunks = chunks
+        self.delay = delay
+        self.sent_chunks = 0
+        self.sent_tokens = 0
+        self.closed = False
+
+    def __iter__(self):
+        for text in self.chunks:
+            if self.closed:
+                return
+            time.sleep(self.delay)
+            self.sent_chunks += 1
+            # 1書記素を1トークンとみなす
+            self.sent_tokens += grapheme.length(text)
+            chunk = MagicMock()
+            chunk.text = text
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def _long_summary_chunks():
+    """上限を大きく超える要約を、10書記素ずつのチャンクに分けて返す"""
+    sentence = "これは要約の一文で、内容を簡潔に説明しています。"  # 24書記素
+    text = sentence * 30
+    return [text[i:i + 10] for i in range(0, len(text), 10)]
+
+
+class FakeBatches:
+    """
+    client.batches の代わりに使う、ローカルのバッチジョブの代役。
+    polls_until_done 回目の get でジョブが完了し、応答は作成時と逆の順序で返す。
+    respond(プロンプト) がNoneを返したリクエストは、エラーの応答になる。
+    """
+    def __init__(self, respond, polls_until_done=1, state=types.JobState.JOB_STATE_SUCCEEDED):
+        self.respond = respond
+        self.polls_until_done = polls_until_done
+        self.final_state = state
+        self.created = []
+        self.polls = 0
+        self.cancelled = []
+
+    def create(self, model, src, config=None):
+        self.created.append({"model": model, "src": src})
+        return types.BatchJob(name=f"batches/{len(self.created)}", state=types.JobState.JOB_STATE_PENDING)
+
+    def get(self, name):
+        self.polls += 1
+        if self.polls < self.polls_until_done:
+            return types.BatchJob(name=name, state=types.JobState.JOB_STATE_RUNNING)
+        responses = []
+        for request in reversed(self.created[-1]["src"]):
+            text = self.respond(request["contents"])
+            if text is None:
+                item = types.InlinedResponse(error=types.JobError(code=500, message="internal"),
+                                             metadata=request["metadata"])
+            else:
+                response = types.GenerateContentResponse(candidates=[types.Candidate(
+                    content=types.Content(role="model", parts=[types.Part(text=text)])
+                )])
+                item = types.InlinedResponse(response=response, metadata=request["metadata"])
+            responses.append(item)
+        return types.BatchJob(name=name, state=self.final_state,
+                              dest=types.BatchJobDestination(inlined_responses=responses))
+
+    def cancel(self, name):
+        self.cancelled.append(name)
+
+
 class TestGeminiProcessor:
 
     @patch('gemini_processor.client.models.generate_content')
@@ -50,6 +129,17 @@ http://example.com/2
         # モデル名がデフォルトまたは設定値であることを確認
         assert mock_generate_content.call_args[1]['model'] == gemini_processor.GEMINI_MODEL
 
+    @patch('gemini_processor.client.models.generate_content')
+    def test_rank_articles_passes_timeout(self, mock_generate_content, articles):
+        """timeoutを指定した場合、リクエストのタイムアウト（ミリ秒）として渡すかのテスト"""
+        mock_generate_content.return_value.text = "1. 記事1\nhttp://example.com/1"
+
+        rank_articles(articles, timeout=2.5)
+        assert mock_generate_content.call_args[1]['config'].http_options.timeout == 2500
+
+        rank_articles(articles)
+        assert mock_generate_content.call_args[1]['config'] is None
+
     @patch('gemini_processor.client.models.generate_content')
     def test_rank_articles_api_error(self, mock_generate_content, articles):
         """rank_articlesでAPIエラーが発生する場合のテスト"""
@@ -133,3 +223,163 @@ http://example.com/2
              del os.environ["GEMINI_MODEL"]
         importlib.reload(gemini_processor)
         assert gemini_processor.GEMINI_MODEL == "gemma-3-27b-it"
+
+    def test_summarize_article_streaming_stops_at_budget(self):
+        """ストリーミング要約が上限に達した時点で打ち切られ、文末で切り詰められるかのテスト"""
+        stream = FakeStream(_long_summary_chunks())
+        with patch('gemini_processor.client.models.generate_content_stream', return_value=stream) as mock_stream:
+            summary = summarize_article("記事内容", max_graphemes=100)
+
+        mock_stream.assert_called_once()
+        assert mock_stream.call_args[1]['model'] == gemini_processor.GEMINI_MODEL
+        # 上限内の最後の文末（24書記素×4文）で切れている
+        assert summary == "これは要約の一文で、内容を簡潔に説明しています。" * 4
+        assert stream.closed
+        # 上限+1書記素を超えた時点で受信をやめている
+        assert stream.sent_chunks == 11
+        assert stream.sent_chunks < len(stream.chunks)
+
+    def test_summarize_article_streaming_reduces_time_and_tokens(self):
+        """打ち切りにより、全文を待つ場合より要約の完了が早く、出力トークンも少ないことを確認するテスト"""
+        full_stream = FakeStream(_long_summary_chunks())
+        start = time.perf_counter()
+        full_text = "".join(chunk.text for chunk in full_stream)
+        full_elapsed = time.perf_counter() - start
+
+        stream = FakeStream(_long_summary_chunks())
+        with patch('gemini_processor.client.models.generate_content_stream', return_value=stream):
+            start = time.perf_counter()
+            summary = summarize_article("記事内容", max_graphemes=100)
+            elapsed = time.perf_counter() - start
+
+        assert grapheme.length(summary) <= 100
+        assert stream.sent_tokens < full_stream.sent_tokens / 5
+        assert elapsed < full_elapsed / 2
+        assert summary and full_text.startswith(summary)
+
+    def test_summarize_article_streaming_short_summary(self):
+        """上限に達しない要約は、そのまま全文が返されるかのテスト"""
+        stream = FakeStream(["短い要約です。", "二文目です。"], delay=0)
+        with patch('gemini_processor.client.models.generate_content_stream', return_value=stream):
+            summary = summarize_article("記事内容", max_graphemes=100)
+
+        assert summary == "短い要約です。二文目です。"
+
+    def test_summarize_article_streaming_api_error(self):
+        """ストリーミング要約でAPIエラーが発生する場合のテスト"""
+        with patch('gemini_processor.client.models.generate_content_stream', side_effect=Exception("API Error")):
+            summary = summarize_article("記事内容", max_graphemes=100)
+
+        assert summary == ""
+
+    def test_cut_at_sentence_boundary(self):
+        """文末で切り詰め、文末がなければ上限で切ることを確認するテスト"""
+        assert cut_at_sentence_boundary("一文目。二文目。三文目", 7) == "一文目。"
+        assert cut_at_sentence_boundary("句点のない長い文章です", 5) == "句点のない"
+        assert cut_at_sentence_boundary("短い。", 10) == "短い。"
+        # 結合文字を含む書記素も1文字として数える
+        assert cut_at_sentence_boundary("👨‍👩‍👧がいます。次の文", 7) == "👨‍👩‍👧がいます。"
+        # 直後が空白でない「.」（モデル名や小数）は文末とみなさない
+        assert cut_at_sentence_boundary("新モデル。GPT-4.5が公開された", 12) == "新モデル。"
+        assert cut_at_sentence_boundary("GPT-4.5が公開された", 6) == "GPT-4."
+
+
+class TestGeminiBatch:
+
+    @pytest.fixture(autouse=True)
+    def no_poll_wait(self, monkeypatch):
+        monkeypatch.setattr(gemini_processor, "BATCH_POLL_INTERVAL", 0)
+
+    def test_generate_batch_maps_responses_by_key(self):
+        """応答の順序に関係なく、出力がプロンプトの位置に対応付けられるかのテスト"""
+        batches = FakeBatches(lambda prompt: f"出力:{prompt}", polls_until_done=3)
+
+        results = gemini_processor.generate_batch(["a", "b", "c"], timeout=10, poll_interval=0, batches=batches)
+
+        assert results == ["出力:a", "出力:b", "出力:c"]
+        assert batches.polls == 3
+        assert batches.created[0]["model"] == gemini_processor.GEMINI_MODEL
+        assert [r["metadata"]["key"] for r in batches.created[0]["src"]] == ["0", "1", "2"]
+
+    def test_generate_batch_cancels_after_timeout(self):
+        """完了しないジョブは時間の上限で取り消し、すべてNoneを返すかのテスト"""
+        batches = FakeBatches(lambda prompt: "出力", polls_until_done=10 ** 9)
+
+        results = gemini_processor.generate_batch(["a", "b"], timeout=0.05, poll_interval=0.01, batches=batches)
+
+        assert results == [None, None]
+        assert batches.cancelled == ["batches/1"]
+
+    def test_generate_batch_create_error(self):
+        batches = MagicMock()
+        batches.create.side_effect = Exception("unsupported model")
+        assert gemini_processor.generate_batch(["a"], timeout=1, batches=batches) == [None]
+
+    def test_supports_batch(self):
+        """GemmaのモデルはBatch APIに対応していないとみなすかのテスト"""
+        assert not gemini_processor.supports_batch("gemma-3-27b-it")
+        assert gemini_processor.supports_batch("gemini-2.5-flash")
+
+    def test_generate_batch_empty(self):
+        batches = MagicMock()
+        assert gemini_processor.generate_batch([], batches=batches) == []
+        batches.create.assert_not_called()
+
+    def test_summarize_articles_batch_falls_back_for_stragglers(self):
+        """バッチで失敗した記事だけを対話的に要約し、上限で文末に切り詰めるかのテスト"""
+        def respond(prompt):
+            if "記事B" in prompt:
+                return None
+            return "一文目です。二文目です。"
+
+        batches = FakeBatches(respond)
+        with patch('gemini_processor.summarize_article', return_value="個別の要約。") as mock_summarize:
+            summaries = gemini_processor.summarize_articles_batch(
+                ["記事A", "記事B", "", "記事C"], [7, 50, 50, None], timeout=10, batches=batches
+            )
+
+        assert summaries == ["一文目です。", "個別の要約。", "", "一文目です。二文目です。"]
+        # 本文が空の記事はバッチに含めない
+        assert len(batches.created[0]["src"]) == 3
+        mock_summarize.assert_called_once_with("記事B", max_graphemes=50, timeout=gemini_processor.REQUEST_TIMEOUT)
+
+    def test_batch_fallback_skipped_after_deadline(self, articles):
+        """締め切りを過ぎた後は、バッチジョブで処理できなかったものを対話的に処理しないかのテスト"""
+        deadline = MagicMock()
+        deadline.expired.return_value = True
+        batches = FakeBatches(lambda prompt: None)
+        with patch('gemini_processor.summarize_article') as mock_summarize, \
+                patch('gemini_processor.rank_articles') as mock_rank:
+            summaries = gemini_processor.summarize_articles_batch(["記事A"], timeout=10, batches=batches,
+                                                                  deadline=deadline)
+            rankings = gemini_processor.rank_articles_batch([articles], timeout=10, batches=batches,
+                                                            deadline=deadline)
+
+        assert summaries == [""]
+        assert rankings == [[]]
+        mock_summarize.assert_not_called()
+        mock_rank.assert_not_called()
+
+    def test_rank_articles_batch(self, articles):
+        """複数の記事リストを1つのジョブでランク付けし、失敗したリストは対話的にランク付けするかのテスト"""
+        other = [{'title': '記事4', 'link': 'http://example.com/4'}]
+
+        def respond(prompt):
+            if "記事4" in prompt:
+                return None
+            return "1. 記事2\nhttp://example.com/2\n2. 記事3\nhttp://example.com/3\n3. 記事1\nhttp://example.com/1"
+
+        batches = FakeBatches(respond)
+        deadline = MagicMock()
+        deadline.expired.return_value = False
+        deadline.timeout.return_value = 42
+        with patch('gemini_processor.rank_articles', return_value=other) as mock_rank:
+            rankings = gemini_processor.rank_articles_batch([articles, [], other], timeout=10, batches=batches,
+                                                            deadline=deadline)
+
+        assert [a['link'] for a in rankings[0]] == ['http://example.com/2', 'http://example.com/3', 'http://example.com/1']
+        assert rankings[1] == []
+        assert rankings[2] == other
+        assert len(batches.created) == 1
+        # 対話的なランク付けには締め切りまでの残り時間に応じたタイムアウトを指定する
+        mock_rank.assert_called_once_with(other, timeout=42)
@@ -1,29 +1,43 @@
 import pytest
 import os
-from main import main
+import json
+import sqlite3
+from atproto import models
+import run_ledger
+import novelty
+import post_outbox
+import run_control
+import db_manager
+from main import main, parse_args, truncate_graphemes, MAX_RESUME_ATTEMPTS, POST_MAX_GRAPHEMES
 
 @pytest.fixture
-def mock_modules(mocker):
+def mock_modules(mocker, temp_db):
     """すべての依存モジュールをモック化するフィクスチャ"""
     # 成功系のテストでは、必要な環境変数が設定されていることを前提とする
     mocker.patch.dict(os.environ, {"RSS_URLS": "http://test.com/rss"})
+    # 実行台帳はテストごとの一時データベース（temp_db）に記録する
 
     mock_db = mocker.patch("main.db_manager")
     mock_rss = mocker.patch("main.rss_fetcher")
     mock_gemini = mocker.patch("main.gemini_processor")
-    mock_bsky = mocker.patch("main.bluesky_poster")
+    # 送信待ちの投稿は実際のアウトボックスを通し、Blueskyへの送信だけをモック化する
+    mock_bsky = mocker.patch("post_outbox.bluesky_poster")
 
     # モックの戻り値を設定
-    mock_rss.fetch_new_articles.return_value = [
+    mock_rss.fetch_new_articles_for_accounts.return_value = {"default": [
         {"title": "Article 1", "link": "http://a1.com", "summary": "Summary 1", "content": "Content 1"},
         {"title": "Article 2", "link": "http://a2.com", "summary": "Summary 2", "content": "Content 2"},
-    ]
+    ]}
     mock_gemini.rank_articles.return_value = [
         {"title": "Article 2", "link": "http://a2.com", "summary": "Summary 2", "content": "Content 2"},
         {"title": "Article 1", "link": "http://a1.com", "summary": "Summary 1", "content": "Content 1"},
     ]
     mock_gemini.summarize_article.return_value = "This is a summary."
-    mock_bsky.post_thread.return_value = True
+    mock_gemini.REQUEST_TIMEOUT = 120
+    mock_gemini.MIN_BATCH_TIMEOUT = 60
+    mock_bsky.send_post.return_value = models.ComAtprotoRepoStrongRef.Main(
+        uri="at://did:plc:fake/app.bsky.feed.post/1", cid="cid1"
+    )
 
     return mock_db, mock_rss, mock_gemini, mock_bsky
 
@@ -35,41 +49,97 @@ def test_main_success_flow(mock_modules):
 
     # 各モジュールが期待通りに呼ばれたか検証
     mock_db.init_db.assert_called_once()
-    mock_rss.fetch_new_articles.assert_called_once()
+    mock_rss.fetch_new_articles_for_accounts.assert_called_once()
     mock_gemini.rank_articles.assert_called_once()
     assert mock_gemini.summarize_article.call_count > 0
-    mock_bsky.post_thread.assert_called_once()
+    mock_bsky.send_post.assert_called_once()
 
     # DBにURLが追加されるのは投稿対象の1件のみ
-    mock_db.add_url.assert_called_once_with("http://a2.com")
+    mock_db.add_url.assert_called_once_with("http://a2.com", "default")
+    # 送信結果はアウトボックスに記録される
+    item = post_outbox.get_item("default", "http://a2.com")
+    assert item["state"] == post_outbox.STATE_SENT
+    assert item["uri"] == "at://did:plc:fake/app.bsky.feed.post/1"
+    assert item["cid"] == "cid1"
+
+
+def test_main_post_failure_is_retried_from_outbox(mock_modules):
+    """送信に失敗した投稿はアウトボックスに残り、次回の実行で要約をやり直さずに送信されるかのテスト"""
+    mock_db, mock_rss, mock_gemini, mock_bsky = mock_modules
+
+    # 送信が失敗するように設定
+    mock_bsky.send_post.side_effect = Exception("API Error")
+    main()
 
+    # 投稿はアウトボックスに追加済みのため、記事は処理済みになり実行台帳も片付く
+    mock_db.add_url.assert_called_once_with("http://a2.com", "default")
+    assert not run_ledger.has_pending_run("default")
+    item = post_outbox.get_item("default", "http://a2.com")
+    assert item["state"] == post_outbox.STATE_PENDING
+    assert item["attempts"] == 1
 
-def test_main_post_failure(mock_modules):
-    """Blueskyへの投稿が失敗した場合のテスト"""
+    # 再試行の時刻を過ぎた状態で次の実行を行う
+    mock_bsky.send_post.side_effect = None
+    mock_rss.fetch_new_articles_for_accounts.return_value = {"default": []}
+    mock_gemini.reset_mock()
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        conn.execute("UPDATE outbox SET next_attempt_at = 0")
+    main()
+
+    mock_gemini.summarize_article.assert_not_called()
+    assert mock_bsky.send_post.call_count == 2
+    assert post_outbox.get_item("default", "http://a2.com")["state"] == post_outbox.STATE_SENT
+
+
+def test_main_resume_does_not_post_twice(mock_modules):
+    """送信待ちに追加済みの記事は、再開時に二重に追加・送信しないかのテスト"""
     mock_db, _, _, mock_bsky = mock_modules
 
-    # 投稿が失敗するように設定
-    mock_bsky.post_thread.return_value = False
+    # 要約の段階まで完了し、投稿をアウトボックスに追加した後、DB登録する前に中断した状態を再現
+    run_ledger.init_ledger()
+    post_outbox.init_outbox()
+    articles = [{"title": "Article 2", "link": "http://a2.com", "summary": "Summary 2", "content": "Content 2"}]
+    run_ledger.save_stage("default", run_ledger.STAGE_CANDIDATES, articles)
+    run_ledger.save_stage("default", run_ledger.STAGE_RANKING, ["http://a2.com"])
+    run_ledger.save_stage("default", run_ledger.STAGE_SUMMARY, "要約")
+    post_outbox.enqueue("default", "http://a2.com", [{"text": "要約"}])
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        conn.execute("UPDATE outbox SET state = ?", (post_outbox.STATE_SENT,))
 
     main()
 
-    # 投稿に失敗しても、DBへの追加は行われる
-    mock_db.add_url.assert_called_once_with("http://a2.com")
+    mock_bsky.send_post.assert_not_called()
+    mock_db.add_url.assert_called_once_with("http://a2.com", "default")
+    assert not run_ledger.has_pending_run("default")
+
+
+def test_main_gives_up_after_repeated_failures(mock_modules):
+    """要約の失敗が上限回数に達した場合、記事を処理済みにして断念するかのテスト"""
+    mock_db, _, mock_gemini, mock_bsky = mock_modules
+    mock_gemini.summarize_article.return_value = ""
+
+    for _ in range(MAX_RESUME_ATTEMPTS):
+        main()
+
+    assert mock_gemini.summarize_article.call_count == MAX_RESUME_ATTEMPTS
+    mock_bsky.send_post.assert_not_called()
+    mock_db.add_url.assert_called_once_with("http://a2.com", "default")
+    assert not run_ledger.has_pending_run("default")
 
 def test_main_no_new_articles(mock_modules):
     """新しい記事がない場合のテスト"""
     _, mock_rss, mock_gemini, mock_bsky = mock_modules
 
     # 新しい記事がないように設定
-    mock_rss.fetch_new_articles.return_value = []
+    mock_rss.fetch_new_articles_for_accounts.return_value = {"default": []}
 
     main()
 
     # 記事がないので、ランク付けや投稿は行われない
     mock_gemini.rank_articles.assert_not_called()
-    mock_bsky.post_thread.assert_not_called()
+    mock_bsky.send_post.assert_not_called()
 
-def test_main_no_rss_urls_env(mocker):
+def test_main_no_rss_urls_env(mocker, temp_db):
     """RSS_URLS環境変数が設定されていない場合のテスト"""
     # RSS_URLSのみ未設定の状態を模倣
     mocker.patch.dict(os.environ, {"RSS_URLS": ""})
@@ -82,4 +152,320 @@ def test_main_no_rss_urls_env(mocker):
 
     # DB初期化は呼ばれるが、RSS_URLSがないため記事取得は呼ばれずに終了する
     mock_db.init_db.assert_called_once()
-    mock_rss.fetch_new_articles.assert_not_called()
\ No newline at end of file
+    mock_rss.fetch_new_articles_for_accounts.assert_not_called()
+
+
+def test_main_multiple_accounts_share_summary(mock_modules, mocker, tmp_path):
+    """複数アカウントで同じ記事を投稿する場合、要約は1回だけ生成されるかのテスト"""
+    mock_db, mock_rss, mock_gemini, mock_bsky = mock_modules
+
+    accounts_file = tmp_path / "accounts.json"
+    accounts_file.write_text(json.dumps([
+        {"name": "tech", "bluesky_handle": "tech.bsky.social", "bluesky_app_password": "pw1", "rss_urls": ["http://test.com/rss"]},
+        {"name": "news", "bluesky_handle": "news.bsky.social", "bluesky_app_password": "pw2", "rss_urls": "http://test.com/rss,http://other.com/rss"},
+    ]), encoding="utf-8")
+    mocker.patch.dict(os.environ, {"ACCOUNTS_FILE": str(accounts_file)})
+
+    articles = mock_rss.fetch_new_articles_for_accounts.return_value["default"]
+    mock_rss.fetch_new_articles_for_accounts.return_value = {"tech": articles, "news": articles}
+
+    main()
+
+    # フィードの取得はまとめて1回、要約は記事ごとに1回だけ
+    mock_rss.fetch_new_articles_for_accounts.assert_called_once()
+    mock_gemini.summarize_article.assert_called_once()
+    assert mock_gemini.summarize_article.call_args.args[0] == "Content 2"
+    # 重複チェックと投稿はアカウントごとに行う
+    mock_db.add_url.assert_any_call("http://a2.com", "tech")
+    mock_db.add_url.assert_any_call("http://a2.com", "news")
+    assert mock_bsky.send_post.call_count == 2
+    assert mock_bsky.create_client.call_args_list[0].args == ("tech.bsky.social", "pw1")
+    assert mock_bsky.create_client.call_args_list[1].args == ("news.bsky.social", "pw2")
+
+
+def test_main_passes_summary_budget(mock_modules):
+    """要約の書記素数の上限として、投稿の上限からタイトル部分を除いた値が渡されるかのテスト"""
+    _, _, mock_gemini, mock_bsky = mock_modules
+
+    main()
+
+    # "【要約】Article 2\n\n" は15書記素
+    assert mock_gemini.summarize_article.call_args.kwargs["max_graphemes"] == POST_MAX_GRAPHEMES - 15
+    assert mock_bsky.send_post.call_args.args[1] == "【要約】Article 2\n\nThis is a summary."
+    embed = mock_bsky.send_post.call_args.args[2]
+    assert embed.external.uri == "http://a2.com"
+    assert embed.external.description == "This is a summary."
+
+
+def test_main_novelty_filter_excludes_similar_articles(mock_modules, mocker):
+    """NOVELTY_FILTERが有効な場合、直近の投稿と類似する記事がランク付けの前に除外されるかのテスト"""
+    mock_db, _, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"NOVELTY_FILTER": "true"})
+    # Article 1 は直近の投稿と同じベクトル、Article 2 は直交するベクトルを返す
+    vectors = {"Article 1": [1.0, 0.0], "Article 2": [0.0, 1.0], "Posted": [1.0, 0.0]}
+    mock_gemini.embed_texts.side_effect = lambda texts: [vectors[t.split("\n")[0]] for t in texts]
+
+    novelty.init_novelty()
+    novelty.record_posted("default", {"title": "Posted", "link": "http://posted.com", "content": ""}, mock_gemini.embed_texts)
+
+    main()
+
+    ranked_input = mock_gemini.rank_articles.call_args.args[0]
+    assert [a["link"] for a in ranked_input] == ["http://a2.com"]
+    mock_db.add_url.assert_any_call("http://a1.com", "default")
+    mock_db.add_url.assert_any_call("http://a2.com", "default")
+    # 投稿した記事は以降の類似度判定の対象になる
+    assert len(novelty.NoveltyIndex.load("default")) == 2
+
+
+def test_main_profile_writes_report(mock_modules, monkeypatch, tmp_path):
+    """--profile を指定した場合、段階ごとのレポートが log/ に書き出されるかのテスト"""
+    monkeypatch.chdir(tmp_path)
+
+    main(profile=True)
+
+    reports = list((tmp_path / "log").glob("profile-*/report.txt"))
+    assert len(reports) == 1
+    report = reports[0].read_text(encoding="utf-8")
+    for stage in ("init", "fetch", "ranking", "summary", "drain"):
+        assert f"===== {stage} =====" in report
+
+
+def test_parse_args():
+    """コマンドライン引数の解析のテスト"""
+    args = parse_args(["--profile", "--profile-sample-interval", "0.01", "--profile-top", "10"])
+    assert args.profile
+    assert args.profile_sample_interval == 0.01
+    assert args.profile_top == 10
+    assert not parse_args([]).profile
+
+
+def test_main_exits_when_another_run_holds_lock(mock_modules):
+    """別の実行が実行ロックを持っている場合、何もせずに終了するかのテスト"""
+    mock_db, mock_rss, _, _ = mock_modules
+    holder = run_control.RunLock()
+    assert holder.acquire()
+    try:
+        main()
+    finally:
+        holder.release()
+
+    mock_db.init_db.assert_not_called()
+    mock_rss.fetch_new_articles_for_accounts.assert_not_called()
+
+    # ロックが解放された後は実行できる
+    main()
+    mock_db.init_db.assert_called_once()
+
+
+def test_main_skips_accounts_after_deadline(mock_modules, mocker):
+    """処理の締め切りを過ぎた場合、残りのアカウントの処理を次回に回すかのテスト"""
+    _, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"RUN_DEADLINE_SECONDS": "60"})
+    mocker.patch("run_control.STAGE_SHARES", {"fetch": 0.5, "process": 0.0, "drain": 1.0})
+
+    main()
+
+    fetch_deadline = mock_rss.fetch_new_articles_for_accounts.call_args.kwargs["deadline"]
+    assert 0 < fetch_deadline.remaining() <= 30
+    mock_gemini.rank_articles.assert_not_called()
+    # 実行が終われば実行ロックは解放されている
+    with run_control.RunLock() as acquired:
+        assert acquired
+
+
+def test_main_passes_deadline_to_gemini_and_resumes_after_expiry(mock_modules, mocker):
+    """ランク付けと要約のタイムアウトを締め切りに合わせ、締め切りを過ぎたら失敗とせずに次回再開するかのテスト"""
+    _, _, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"RUN_DEADLINE_SECONDS": "60", "OUTBOX_DRAIN_SECONDS": "0"})
+    expire = mocker.patch("run_control.Deadline.expired", return_value=False)
+    ranked = mock_gemini.rank_articles.return_value
+
+    def rank_until_deadline(articles, timeout=None):
+        # ランク付けの途中で締め切りを過ぎる
+        expire.return_value = True
+        return ranked
+    mock_gemini.rank_articles.side_effect = rank_until_deadline
+
+    main()
+
+    assert 1.0 <= mock_gemini.rank_articles.call_args.kwargs["timeout"] <= 60
+    mock_gemini.summarize_article.assert_not_called()
+    # 要約の前で打ち切り、失敗とは数えずに実行台帳から再開する
+    assert run_ledger.has_pending_run("default")
+    assert run_ledger.record_failure("default", "test") == 1
+
+    expire.return_value = False
+    mock_gemini.rank_articles.side_effect = None
+    main()
+
+    mock_gemini.rank_articles.assert_called_once()
+    assert 1.0 <= mock_gemini.summarize_article.call_args.kwargs["timeout"] <= 60
+    assert not run_ledger.has_pending_run("default")
+
+
+def test_main_uses_card_metadata_for_embed(mock_modules, mocker):
+    """記事の取得時に読んだOpenGraphの情報を、埋め込みカードのタイトルとサムネイルに使うかのテスト"""
+    _, mock_rss, mock_gemini, _ = mock_modules
+    # 送信（サムネイルの作成）は行わず、アウトボックスに追加された内容だけを確認する
+    mocker.patch.dict(os.environ, {"OUTBOX_DRAIN_SECONDS": "0"})
+    article = {"title": "Article 2", "link": "http://a2.com", "summary": "Summary 2", "content": "Content 2",
+               "metadata": {"title": "OGタイトル", "image": "http://a2.com/og.png"}}
+    mock_rss.fetch_new_articles_for_accounts.return_value = {"default": [article]}
+    mock_gemini.rank_articles.return_value = [article]
+
+    main()
+
+    item = post_outbox.get_item("default", "http://a2.com")
+    embed = json.loads(item["posts"])[0]["embed"]
+    assert embed == {"uri": "http://a2.com", "title": "OGタイトル", "description": "This is a summary.",
+                     "thumb_url": "http://a2.com/og.png"}
+
+
+def test_main_catch_up_posts_only_finalists(mock_modules, mocker):
+    """キャッチアップでは、勝ち残った記事だけ本文を取得して投稿し、残りはまとめて処理済みにするかのテスト"""
+    mock_db, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"CATCHUP_BATCH_SIZE": "5", "CATCHUP_MAX_POSTS": "2", "OUTBOX_DRAIN_SECONDS": "0"})
+    entries = [{"title": f"A{i}", "link": f"http://a.com/{i}", "summary": f"S{i}", "feed_url": "http://test.com/rss"}
+               for i in range(12)]
+    mock_rss.iter_unseen_entries.return_value = iter(entries)
+    mock_rss.fetch_article.return_value = ("本文", {})
+    mock_rss.FETCH_TIMEOUT = 10
+    batches = []
+
+    def rank(candidates, timeout=None):
+        batches.append(len(candidates))
+        return sorted(candidates, key=lambda e: int(e["link"].rsplit("/", 1)[1]), reverse=True)
+
+    mock_gemini.rank_articles.side_effect = rank
+
+    main(catch_up_mode=True)
+
+    mock_rss.fetch_new_articles_for_accounts.assert_not_called()
+    assert max(batches) <= 5
+    # 本文の取得と投稿は勝ち残った記事だけ
+    scraped = [c.args[0] for c in mock_rss.fetch_article.call_args_list]
+    assert scraped == ["http://a.com/11", "http://a.com/10"]
+    assert post_outbox.get_item("default", "http://a.com/11") is not None
+    assert post_outbox.get_item("default", "http://a.com/0") is None
+    # 読んだ記事はすべて1回の書き込みで処理済みになる
+    mock_db.add_urls.assert_called_once()
+    urls, account = mock_db.add_urls.call_args.args
+    assert sorted(urls) == sorted(e["link"] for e in entries)
+    assert account == "default"
+    mock_db.add_url.assert_not_called()
+
+
+def test_main_catch_up_leaves_unsummarized_finalists_unseen(mock_modules, mocker):
+    """キャッチアップで要約できなかった記事は処理済みにせず、WebSubの配信も処理済みにしないかのテスト"""
+    mock_db, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"CATCHUP_BATCH_SIZE": "5", "CATCHUP_MAX_POSTS": "2", "OUTBOX_DRAIN_SECONDS": "0"})
+    entries = [{"title": f"A{i}", "link": f"http://a.com/{i}", "summary": f"S{i}", "feed_url": "http://test.com/rss"}
+               for i in range(4)]
+    mock_rss.iter_unseen_entries.return_value = iter(entries)
+    mock_rss.fetch_article.side_effect = lambda link, feed_url, timeout=None: (f"本文{link[-1]}", {})
+    mock_rss.FETCH_TIMEOUT = 10
+    mock_gemini.rank_articles.side_effect = lambda candidates, timeout=None: list(reversed(candidates))
+    mock_gemini.summarize_article.side_effect = \
+        lambda content, max_graphemes=None, timeout=None: "" if content == "本文3" else "要約です。"
+    mock_mark = mocker.patch("main.websub.mark_processed")
+
+    main(catch_up_mode=True)
+
+    assert post_outbox.get_item("default", "http://a.com/2") is not None
+    assert post_outbox.get_item("default", "http://a.com/3") is None
+    urls, _ = mock_db.add_urls.call_args.args
+    assert sorted(urls) == ["http://a.com/0", "http://a.com/1", "http://a.com/2"]
+    mock_mark.assert_not_called()
+
+
+def test_parse_args_catch_up():
+    assert parse_args(["--catch-up"]).catch_up
+    assert not parse_args([]).catch_up
+
+
+def test_main_catch_up_batch_mode(mock_modules, mocker):
+    """GEMINI_BATCH_MODE では、ランク付けと全アカウント分の要約をバッチジョブでまとめて行うかのテスト"""
+    mock_db, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"GEMINI_BATCH_MODE": "true", "CATCHUP_MAX_POSTS": "2",
+                                   "OUTBOX_DRAIN_SECONDS": "0"})
+    mocker.patch("main.account_config.load_accounts", return_value=[
+        {"name": "tech", "rss_urls": ["http://test.com/rss"]},
+        {"name": "news", "rss_urls": ["http://test.com/rss"]},
+    ])
+    entries = [{"title": f"A{i}", "link": f"http://a.com/{i}", "summary": f"S{i}", "feed_url": "http://test.com/rss"}
+               for i in range(5)]
+    mock_rss.iter_unseen_entries.side_effect = lambda *args: iter(entries)
+    mock_rss.fetch_article.return_value = ("本文", {})
+    mock_rss.FETCH_TIMEOUT = 10
+    mock_gemini.batch_timeout.return_value = 60
+    mock_gemini.rank_articles_batch.side_effect = lambda groups, timeout=None, deadline=None: [list(reversed(g)) for g in groups]
+    mock_gemini.summarize_articles_batch.side_effect = \
+        lambda contents, limits, timeout=None, deadline=None: [f"要約{i}" for i in range(len(contents))]
+
+    main(catch_up_mode=True)
+
+    mock_gemini.rank_articles.assert_not_called()
+    assert mock_gemini.rank_articles_batch.call_count == 2
+    # 両アカウントの勝者は同じ記事のため、要約は1つのジョブで1回ずつだけ生成する
+    mock_gemini.summarize_articles_batch.assert_called_once()
+    contents, limits = mock_gemini.summarize_articles_batch.call_args.args
+    assert len(contents) == 2
+    assert all(0 < limit < POST_MAX_GRAPHEMES for limit in limits)
+    mock_gemini.summarize_article.assert_not_called()
+    assert post_outbox.get_item("tech", "http://a.com/4") is not None
+    assert post_outbox.get_item("news", "http://a.com/3") is not None
+    assert mock_db.add_urls.call_count == 2
+
+
+def test_main_catch_up_batch_mode_stops_ranking_without_batch_time(mock_modules, mocker):
+    """2段目以降でバッチジョブの完了を待つ時間が残っていない場合は、ランク付けを打ち切り記事を処理済みにしないかのテスト"""
+    mock_db, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"GEMINI_BATCH_MODE": "true", "CATCHUP_BATCH_SIZE": "2",
+                                   "CATCHUP_MAX_POSTS": "1", "OUTBOX_DRAIN_SECONDS": "0"})
+    entries = [{"title": f"A{i}", "link": f"http://a.com/{i}", "summary": f"S{i}", "feed_url": "http://test.com/rss"}
+               for i in range(4)]
+    mock_rss.iter_unseen_entries.return_value = iter(entries)
+    mock_rss.FETCH_TIMEOUT = 10
+    # 開始時と1段目の確認・ジョブには時間があり、2段目の確認では残っていない
+    mock_gemini.batch_timeout.side_effect = [600, 600, 600, 10]
+    mock_gemini.rank_articles_batch.side_effect = lambda groups, timeout=None, deadline=None: \
+        [list(reversed(g)) for g in groups]
+
+    main(catch_up_mode=True)
+
+    mock_gemini.rank_articles_batch.assert_called_once()
+    mock_gemini.rank_articles.assert_not_called()
+    mock_rss.fetch_article.assert_not_called()
+    # 1段目の敗者だけを処理済みにする
+    eliminated = [url for call in mock_db.add_urls.call_args_list for url in call.args[0]]
+    assert sorted(eliminated) == ["http://a.com/0", "http://a.com/2"]
+
+
+@pytest.mark.parametrize("supported, batch_seconds", [(False, 600), (True, 10)])
+def test_main_catch_up_batch_mode_falls_back_without_creating_jobs(mock_modules, mocker, supported, batch_seconds):
+    """モデルがBatch APIに対応していない場合や待つ時間がない場合は、ジョブを作成せずに対話的に処理するかのテスト"""
+    _, mock_rss, mock_gemini, _ = mock_modules
+    mocker.patch.dict(os.environ, {"GEMINI_BATCH_MODE": "true", "OUTBOX_DRAIN_SECONDS": "0"})
+    entries = [{"title": f"A{i}", "link": f"http://a.com/{i}", "summary": f"S{i}", "feed_url": "http://test.com/rss"}
+               for i in range(3)]
+    mock_rss.iter_unseen_entries.return_value = iter(entries)
+    mock_rss.fetch_article.return_value = ("本文", {})
+    mock_rss.FETCH_TIMEOUT = 10
+    mock_gemini.supports_batch.return_value = supported
+    mock_gemini.batch_timeout.return_value = batch_seconds
+    mock_gemini.rank_articles.side_effect = lambda candidates, timeout=None: list(reversed(candidates))
+
+    main(catch_up_mode=True)
+
+    mock_gemini.rank_articles_batch.assert_not_called()
+    mock_gemini.summarize_articles_batch.assert_not_called()
+    mock_gemini.rank_articles.assert_called_once()
+    assert mock_gemini.summarize_article.call_count == 3
+
+
+def test_truncate_graphemes_keeps_hard_cut():
+    """main.truncate_graphemes は従来どおり文末を考慮せず、書記素数だけで切ることを確認するテスト"""
+    assert truncate_graphemes("一文目。" + "あ" * 20, 10) == "一文目。あああ..."
+    assert truncate_graphemes("短い", 10) == "短い"
+    assert truncate_graphemes("👨‍👩‍👧👨‍👩‍👧👨‍👩‍👧", 2, placeholder="…") == "👨‍👩‍👧…"
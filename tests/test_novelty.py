@@ -0,0 +1,80 @@
+import pytest
+import zlib
+import numpy as np
+import novelty
+
+def fake_embed(texts):
+    """
+    Gemini APIの代わりに使うローカルの埋め込み関数。
+    タイトル（1行目）の単語ごとに固定の次元を立てたベクトルを返す。
+    """
+    fake_embed.calls.append(list(texts))
+    vectors = []
+    for text in texts:
+        vector = np.zeros(16, dtype=np.float32)
+        for word in text.split("\n")[0].split():
+            vector[zlib.crc32(word.encode()) % 16] += 1.0
+        vectors.append(vector.tolist())
+    return vectors
+
+@pytest.fixture
+def db(temp_db):
+    """テスト用の一時データベースを使うフィクスチャ"""
+    novelty.init_novelty()
+    fake_embed.calls = []
+
+def _article(i, title):
+    return {"title": title, "link": f"http://example.com/{i}", "content": f"本文{i}"}
+
+def test_embeddings_are_cached(db):
+    """埋め込みは記事ごとに1回だけ計算され、以降はデータベースから読み込まれるかのテスト"""
+    articles = [_article(1, "apple release"), _article(2, "rust compiler")]
+
+    first = novelty.get_embeddings(articles, fake_embed)
+    second = novelty.get_embeddings(articles + [_article(3, "python typing")], fake_embed)
+
+    assert len(fake_embed.calls) == 2
+    assert len(fake_embed.calls[1]) == 1  # 未計算の記事だけを計算する
+    np.testing.assert_array_equal(first["http://example.com/1"], second["http://example.com/1"])
+    assert second["http://example.com/1"].dtype == np.float32
+
+def test_filter_novel_excludes_similar_to_recent_posts(db):
+    """直近の投稿と類似する候補が除外されるかのテスト"""
+    novelty.record_posted("tech", _article(1, "apple new iphone release"), fake_embed)
+
+    candidates = [_article(2, "apple new iphone release update"), _article(3, "rust compiler speedup")]
+    novel, excluded = novelty.filter_novel("tech", candidates, fake_embed, threshold=0.8)
+
+    assert [a["link"] for a in novel] == ["http://example.com/3"]
+    assert [a["link"] for a in excluded] == ["http://example.com/2"]
+
+    # 他のアカウントの投稿とは比較しない
+    novel, excluded = novelty.filter_novel("news", candidates, fake_embed, threshold=0.8)
+    assert novel == candidates and excluded == []
+
+def test_filter_novel_uses_only_recent_posts(db):
+    """recent_postsより古い投稿とは比較しないかのテスト"""
+    novelty.record_posted("tech", _article(1, "apple iphone"), fake_embed, posted_at=100)
+    novelty.record_posted("tech", _article(2, "rust compiler"), fake_embed, posted_at=200)
+
+    candidates = [_article(3, "apple iphone")]
+    novel, _ = novelty.filter_novel("tech", candidates, fake_embed, threshold=0.9, recent_posts=1)
+
+    assert novel == candidates
+
+def test_filter_novel_keeps_candidates_when_embedding_fails(db):
+    """埋め込みの計算に失敗した場合は候補を除外しないかのテスト"""
+    novelty.record_posted("tech", _article(1, "apple iphone"), fake_embed)
+
+    candidates = [_article(2, "apple iphone")]
+    novel, excluded = novelty.filter_novel("tech", candidates, lambda texts: [], threshold=0.5)
+
+    assert novel == candidates and excluded == []
+
+def test_novelty_index_max_similarity():
+    """NoveltyIndexが候補ごとの最大コサイン類似度を計算するかのテスト"""
+    index = novelty.NoveltyIndex(np.array([[1, 0], [0, 2]], dtype=np.float32))
+
+    sims = index.max_similarity(np.array([[3, 0], [1, 1], [-1, 0]], dtype=np.float32))
+
+    np.testing.assert_allclose(sims, [1.0, np.sqrt(0.5), 0.0], atol=1e-6)
@@ -0,0 +1,123 @@
+import grapheme
+import post_composer
+from post_composer import build_facets, compose_post, truncate
+
+
+def _slice(text, facet):
+    index = facet["index"]
+    return text.encode("utf-8")[index["byteStart"]:index["byteEnd"]].decode("utf-8")
+
+
+def test_truncate_short_text_unchanged():
+    assert truncate("短い文章です。", 300) == "短い文章です。"
+    assert truncate("", 10) == ""
+
+
+def test_truncate_prefers_sentence_boundary():
+    """上限内の最後の文末で切り、文末で切った場合は省略記号を付けないことを確認するテスト"""
+    sentence = "これは要約の一文で、内容を簡潔に説明しています。"  # 24書記素
+    result = truncate(sentence * 30, 100)
+
+    assert result == sentence * 4
+    assert grapheme.length(result) <= 100
+
+
+def test_truncate_without_boundary_adds_placeholder():
+    result = truncate("あ" * 500, 100)
+    assert result == "あ" * 97 + "..."
+
+
+def test_truncate_ignores_boundary_too_early():
+    """文末が先頭付近にしかない場合は、文の途中で切ることを確認するテスト"""
+    text = "短い。" + "長い文章が続きます" * 50
+    result = truncate(text, 100)
+    assert grapheme.length(result) == 100
+    assert result.endswith("...")
+
+
+def test_truncate_ascii_period_needs_following_space():
+    """URLや小数の中のピリオドは文末とみなさないことを確認するテスト"""
+    text = "Version 3.5 of https://example.com is out now" + " word" * 20
+    result = truncate(text, 40)
+    assert result.endswith("...")
+    assert "3." not in result[-6:]
+
+    text = "First sentence here. Second one" + " word" * 10
+    assert truncate(text, 30) == "First sentence here."
+
+
+def test_truncate_respects_byte_limit():
+    """書記素数が上限内でも、UTF-8のバイト数が上限を超える場合は切り詰めることを確認するテスト"""
+    # 絵文字の家族は1書記素で18バイト
+    text = "👨‍👩‍👧" * 200
+    result = truncate(text, 300, max_bytes=3000)
+    assert len(result.encode("utf-8")) <= 3000
+    assert result == "👨‍👩‍👧" * 166 + "..."
+
+
+def test_truncate_does_not_split_link():
+    """文の途中で切る位置がリンクの途中になる場合は、リンクの前で切ることを確認するテスト"""
+    text = "詳細は https://example.com/articles/very/long/path/to/the/article を参照" + "あ" * 100
+    result = truncate(text, 40)
+    assert result == "詳細は..."
+
+
+def test_truncate_long_leading_link_falls_back_to_grapheme_cut():
+    """リンクの前で切ると何も残らない場合は、リンクの途中で切ることを確認するテスト"""
+    text = "https://example.com/" + "a" * 400
+    result = truncate(text, 300)
+    assert result == text[:297] + "..."
+
+
+def test_truncate_stops_early(mocker):
+    """上限を超えた時点で書記素の走査をやめることを確認するテスト"""
+    seen = []
+    original = grapheme.graphemes
+
+    def counting(text):
+        for g in original(text):
+            seen.append(g)
+            yield g
+
+    mocker.patch("text_truncation.grapheme.graphemes", side_effect=counting)
+    truncate("あ" * 100_000, 300)
+    assert len(seen) == 301
+
+
+def test_build_facets_byte_offsets():
+    """リンクとハッシュタグのファセットが、UTF-8のバイトオフセットで正しい範囲を指すことを確認するテスト"""
+    text = "【要約】新モデル #AI が公開。詳細はhttps://example.com/a(b)。次は https://ex.com/x. です #速報"
+    facets = build_facets(text)
+
+    assert [_slice(text, f) for f in facets] == ["#AI", "https://example.com/a(b)", "https://ex.com/x", "#速報"]
+    assert facets[0]["features"] == [{"$type": post_composer.TAG_FEATURE, "tag": "AI"}]
+    assert facets[1]["features"] == [{"$type": post_composer.LINK_FEATURE, "uri": "https://example.com/a(b)"}]
+
+
+def test_build_facets_link_ends_before_japanese_text():
+    """日本語の文に続くリンクが、URLに使えない直後の文字を含まないことを確認するテスト"""
+    facets = build_facets("詳細はhttps://example.com/a/1を参照。")
+    assert facets[0]["features"] == [{"$type": post_composer.LINK_FEATURE, "uri": "https://example.com/a/1"}]
+
+
+def test_build_facets_skips_invalid_tags():
+    assert build_facets("価格は#100です #123 と見出し#見出し") == []
+    assert build_facets("#" + "あ" * 65) == []
+    facets = build_facets("タグ: ＃全角タグ、")
+    assert facets[0]["features"][0]["tag"] == "全角タグ"
+
+
+def test_compose_post_facets_match_truncated_text():
+    text = "【要約】 #テスト の記事\n\n" + "本文の要約が続きます" * 40 + " https://example.com"
+    post = compose_post(text)
+
+    assert grapheme.length(post["text"]) <= post_composer.MAX_GRAPHEMES
+    assert [_slice(post["text"], f) for f in post["facets"]] == ["#テスト"]
+
+
+def test_facets_are_valid_atproto_models():
+    from atproto import models
+    facets = build_facets("見出し #AI https://example.com")
+    parsed = [models.AppBskyRichtextFacet.Main.model_validate(f) for f in facets]
+    assert parsed[0].features[0].tag == "AI"
+    assert parsed[1].index.byte_start == len("見出し #AI ".encode("utf-8"))
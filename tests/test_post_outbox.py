@@ -0,0 +1,311 @@
+import json
+import sqlite3
+import pytest
+from atproto import models
+import post_outbox
+
+ACCOUNTS = [
+    {"name": "tech", "handle": "tech.bsky.social", "app_password": "pw1"},
+    {"name": "news", "handle": "news.bsky.social", "app_password": "pw2"},
+]
+
+
+@pytest.fixture
+def outbox_db(temp_db):
+    """テストごとの一時データベースにアウトボックスを作成するフィクスチャ"""
+    post_outbox.init_outbox()
+    return temp_db
+
+
+@pytest.fixture
+def mock_bsky(mocker):
+    """Blueskyへの送信をモック化し、呼び出しごとに異なる参照を返すフィクスチャ"""
+    mock = mocker.patch("post_outbox.bluesky_poster")
+    counter = iter(range(1, 1000))
+
+    def send_post(client, text, embed=None, root=None, parent=None, facets=None):
+        i = next(counter)
+        return models.ComAtprotoRepoStrongRef.Main(uri=f"at://did:plc:fake/app.bsky.feed.post/{i}", cid=f"cid{i}")
+
+    mock.send_post.side_effect = send_post
+    return mock
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeRequestError(Exception):
+    """atprotoのリクエストの例外と同じく、responseを持つ例外"""
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+def _set_ready(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE outbox SET next_attempt_at = 0")
+
+
+def test_enqueue_is_idempotent(outbox_db):
+    """同じアカウントと記事の組は1回だけ追加されることを確認するテスト"""
+    assert post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+    assert not post_outbox.enqueue("tech", "http://example.com/1", [{"text": "2"}])
+    assert post_outbox.enqueue("news", "http://example.com/1", [{"text": "3"}])
+
+    item = post_outbox.get_item("tech", "http://example.com/1")
+    assert json.loads(item["posts"]) == [{"text": "1"}]
+    assert item["state"] == post_outbox.STATE_PENDING
+
+
+def test_drain_sends_thread_and_records_refs(outbox_db, mock_bsky):
+    """スレッドを送信し、2件目以降がリプライとして連結され、ルートのURIとCIDが記録されることを確認するテスト"""
+    post_outbox.enqueue("tech", "http://example.com/1", [
+        {"text": "親", "embed": {"uri": "http://example.com/1", "title": "T", "description": "D"}},
+        {"text": "   "},
+        {"text": "リプライ"},
+    ])
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 1
+
+    mock_bsky.create_client.assert_called_once_with("tech.bsky.social", "pw1")
+    first, second = mock_bsky.send_post.call_args_list
+    assert first.args[1] == "親"
+    assert first.args[2].external.uri == "http://example.com/1"
+    assert first.kwargs["parent"] is None
+    assert second.args[1] == "リプライ"
+    assert second.kwargs["root"].uri == "at://did:plc:fake/app.bsky.feed.post/1"
+    assert second.kwargs["parent"].uri == "at://did:plc:fake/app.bsky.feed.post/1"
+
+    item = post_outbox.get_item("tech", "http://example.com/1")
+    assert item["state"] == post_outbox.STATE_SENT
+    assert item["uri"] == "at://did:plc:fake/app.bsky.feed.post/1"
+    assert item["cid"] == "cid1"
+
+
+def test_drain_uses_reply_to_of_first_post(outbox_db, mock_bsky):
+    """最初の投稿に reply_to がある場合、既存の投稿へのリプライとして送信することを確認するテスト"""
+    reply_to = {"root": {"uri": "at://root", "cid": "cidr"}, "parent": {"uri": "at://parent", "cid": "cidp"}}
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "続き", "reply_to": reply_to}])
+
+    post_outbox.drain(ACCOUNTS, min_interval=0)
+
+    call = mock_bsky.send_post.call_args
+    assert call.kwargs["root"].uri == "at://root"
+    assert call.kwargs["parent"].uri == "at://parent"
+
+
+def test_drain_sends_saved_facets(outbox_db, mock_bsky):
+    """保存したリンクとハッシュタグのファセットを、atprotoのモデルにして送信することを確認するテスト"""
+    import post_composer
+    post = post_composer.compose_post("新着 #AI https://example.com/a")
+    post_outbox.enqueue("tech", "http://example.com/1", [post])
+
+    post_outbox.drain(ACCOUNTS, min_interval=0)
+
+    facets = mock_bsky.send_post.call_args.kwargs["facets"]
+    assert [f.features[0].py_type for f in facets] == [post_composer.TAG_FEATURE, post_composer.LINK_FEATURE]
+    assert facets[1].features[0].uri == "https://example.com/a"
+    assert facets[1].index.byte_start == len("新着 #AI ".encode("utf-8"))
+
+    post_outbox.enqueue("tech", "http://example.com/2", [{"text": "ファセットなし"}])
+    post_outbox.drain(ACCOUNTS, min_interval=0)
+    assert mock_bsky.send_post.call_args.kwargs["facets"] is None
+
+
+def test_drain_resumes_partially_sent_thread(outbox_db, mock_bsky):
+    """スレッドの途中で失敗した場合、次回は送信済みのポストを再送せずに続きから送信することを確認するテスト"""
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}, {"text": "2"}])
+    results = [models.ComAtprotoRepoStrongRef.Main(uri="at://post/1", cid="cid1"), FakeRequestError(502)]
+
+    def flaky_send_post(client, text, embed=None, root=None, parent=None, facets=None):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    mock_bsky.send_post.side_effect = flaky_send_post
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 0
+    item = post_outbox.get_item("tech", "http://example.com/1")
+    assert item["state"] == post_outbox.STATE_PENDING
+    assert item["attempts"] == 1
+    assert item["next_attempt_at"] > item["created_at"]
+
+    mock_bsky.send_post.side_effect = lambda client, text, embed=None, root=None, parent=None, facets=None: \
+        models.ComAtprotoRepoStrongRef.Main(uri="at://post/2", cid="cid2")
+    _set_ready(outbox_db)
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 1
+
+    call = mock_bsky.send_post.call_args
+    assert call.args[1] == "2"
+    assert call.kwargs["parent"].uri == "at://post/1"
+    assert post_outbox.get_item("tech", "http://example.com/1")["uri"] == "at://post/1"
+
+
+def test_rate_limit_defers_account_until_retry_after(outbox_db, mock_bsky, mocker):
+    """レート制限の応答を受けた場合、Retry-Afterまでアカウントの投稿を延期し、試行回数は増やさないことを確認するテスト"""
+    mocker.patch("post_outbox.time.time", return_value=1000.0)
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+    post_outbox.enqueue("tech", "http://example.com/2", [{"text": "2"}])
+    post_outbox.enqueue("news", "http://example.com/3", [{"text": "3"}])
+
+    def send_post(client, text, embed=None, root=None, parent=None, facets=None):
+        if text != "3":
+            raise FakeRequestError(429, {"Retry-After": "120"})
+        return models.ComAtprotoRepoStrongRef.Main(uri="at://post/3", cid="cid3")
+
+    mock_bsky.send_post.side_effect = send_post
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 1
+
+    # 制限を受けたアカウントの2件目は送信を試みない
+    assert [call.args[1] for call in mock_bsky.send_post.call_args_list] == ["1", "3"]
+    for url in ("http://example.com/1", "http://example.com/2"):
+        item = post_outbox.get_item("tech", url)
+        assert item["state"] == post_outbox.STATE_PENDING
+        assert item["attempts"] == 0
+        assert item["next_attempt_at"] == 1120.0
+
+
+@pytest.mark.parametrize("headers,expected", [
+    ({"retry-after": "30"}, 30.0),
+    ({"Retry-After": "Thu, 01 Jan 1970 00:20:00 GMT"}, 200.0),
+    ({"ratelimit-reset": "1500"}, 500.0),
+    ({}, post_outbox.DEFAULT_RATE_LIMIT_WAIT),
+])
+def test_rate_limit_delay(headers, expected):
+    """レート制限の応答のヘッダーから待ち時間を求めることを確認するテスト"""
+    assert post_outbox.rate_limit_delay(FakeRequestError(429, headers), now=1000.0) == expected
+
+
+def test_rate_limit_delay_ignores_other_errors():
+    assert post_outbox.rate_limit_delay(FakeRequestError(502), now=1000.0) is None
+    assert post_outbox.rate_limit_delay(Exception("network"), now=1000.0) is None
+
+
+def test_min_interval_smooths_sends(outbox_db, mock_bsky, mocker):
+    """同じアカウントの投稿は最小間隔を空けて送信され、残りは次回に回されることを確認するテスト"""
+    now = mocker.patch("post_outbox.time.time", return_value=1000.0)
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+    post_outbox.enqueue("tech", "http://example.com/2", [{"text": "2"}])
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=60) == 1
+    assert post_outbox.get_item("tech", "http://example.com/2")["next_attempt_at"] == 1060.0
+    assert post_outbox.next_attempt_at() == 1060.0
+
+    now.return_value = 1060.0
+    assert post_outbox.drain(ACCOUNTS, min_interval=60) == 1
+    assert post_outbox.get_item("tech", "http://example.com/2")["state"] == post_outbox.STATE_SENT
+
+
+def test_hourly_limit_defers_until_window_frees(outbox_db, mock_bsky, mocker):
+    """1時間あたりの投稿数の上限に達した場合、最も古い送信が窓から外れるまで延期することを確認するテスト"""
+    mocker.patch("post_outbox.HOURLY_POST_LIMIT", 2)
+    mocker.patch("post_outbox.time.time", return_value=5000.0)
+    with sqlite3.connect(outbox_db) as conn:
+        conn.executemany("INSERT INTO outbox_sends (account, sent_at) VALUES (?, ?)", [("tech", 2000.0), ("tech", 3000.0)])
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 0
+    mock_bsky.send_post.assert_not_called()
+    assert post_outbox.get_item("tech", "http://example.com/1")["next_attempt_at"] == 5600.0
+
+
+def test_failures_back_off_and_give_up(outbox_db, mock_bsky, mocker):
+    """失敗するたびに待ち時間が倍になり、上限回数に達したら failed になることを確認するテスト"""
+    mocker.patch("post_outbox.time.time", return_value=1000.0)
+    mock_bsky.send_post.side_effect = FakeRequestError(502)
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+
+    waits = []
+    for _ in range(post_outbox.MAX_ATTEMPTS):
+        _set_ready(outbox_db)
+        post_outbox.drain(ACCOUNTS, min_interval=0)
+        waits.append(post_outbox.get_item("tech", "http://example.com/1")["next_attempt_at"] - 1000.0)
+
+    assert waits[:3] == [post_outbox.BACKOFF_BASE, post_outbox.BACKOFF_BASE * 2, post_outbox.BACKOFF_BASE * 4]
+    item = post_outbox.get_item("tech", "http://example.com/1")
+    assert item["state"] == post_outbox.STATE_FAILED
+    assert item["attempts"] == post_outbox.MAX_ATTEMPTS
+    assert "502" in item["last_error"]
+
+
+def test_bad_request_fails_immediately(outbox_db, mock_bsky):
+    """リクエストの内容が不正（HTTP 400）な場合は再試行せずに断念することを確認するテスト"""
+    mock_bsky.send_post.side_effect = FakeRequestError(400)
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+
+    post_outbox.drain(ACCOUNTS, min_interval=0)
+
+    item = post_outbox.get_item("tech", "http://example.com/1")
+    assert item["state"] == post_outbox.STATE_FAILED
+    assert item["attempts"] == 1
+
+
+def test_drain_stops_at_deadline(outbox_db, mock_bsky):
+    """時間の上限を過ぎている場合は送信しないことを確認するテスト"""
+    post_outbox.enqueue("tech", "http://example.com/1", [{"text": "1"}])
+
+    assert post_outbox.drain(ACCOUNTS, deadline=0, min_interval=0) == 0
+    mock_bsky.send_post.assert_not_called()
+    assert post_outbox.get_item("tech", "http://example.com/1")["state"] == post_outbox.STATE_PENDING
+
+
+def test_drain_skips_unknown_accounts(outbox_db, mock_bsky):
+    """認証情報のないアカウントの投稿は送信しないことを確認するテスト"""
+    post_outbox.enqueue("removed", "http://example.com/1", [{"text": "1"}])
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 0
+    mock_bsky.create_client.assert_not_called()
+
+
+def test_drain_attaches_thumbnail(outbox_db, mock_bsky, mocker):
+    """埋め込みにサムネイルの画像URLがある場合、アップロードしたblobを添付するかのテスト"""
+    from atproto_client.models.blob_ref import BlobRef, IpldLink
+    blob = BlobRef(mime_type="image/jpeg", size=100, ref=IpldLink(link="bafkreithumb"))
+    mock_thumb = mocker.patch("post_outbox.thumbnails.get_thumb_blob", return_value=blob)
+    mock_remember = mocker.patch("post_outbox.thumbnails.remember_blob")
+    post_outbox.enqueue("tech", "http://example.com/1", [
+        {"text": "1", "embed": {"uri": "http://example.com/1", "title": "T", "description": "D",
+                                "thumb_url": "http://example.com/og.png"}},
+        {"text": "2", "embed": {"uri": "http://example.com/2", "title": "T2", "description": "D2"}},
+    ])
+
+    post_outbox.drain(ACCOUNTS, min_interval=0)
+
+    client = mock_bsky.create_client.return_value
+    mock_thumb.assert_called_once_with(client, "tech", "http://example.com/og.png")
+    first, second = mock_bsky.send_post.call_args_list
+    assert first.args[2].external.thumb == blob
+    assert second.args[2].external.thumb is None
+    # 投稿に成功したblobだけをキャッシュする
+    mock_remember.assert_called_once_with("tech", "http://example.com/og.png", blob)
+
+
+def test_drain_resends_without_rejected_thumbnail(outbox_db, mock_bsky, mocker):
+    """添付したblobが見つからずに拒否された場合、キャッシュを破棄してサムネイルなしで再送するかのテスト"""
+    from atproto_client.models.blob_ref import BlobRef, IpldLink
+    blob = BlobRef(mime_type="image/jpeg", size=100, ref=IpldLink(link="bafkreigone"))
+    mocker.patch("post_outbox.thumbnails.get_thumb_blob", return_value=blob)
+    mock_forget = mocker.patch("post_outbox.thumbnails.forget_blob")
+    send_post = mock_bsky.send_post.side_effect
+    blob_error = FakeRequestError(400)
+    blob_error.args = ("400 InvalidRequest - Could not find blob: bafkreigone",)
+
+    def reject_thumb(client, text, embed=None, root=None, parent=None, facets=None):
+        if embed.external.thumb is not None:
+            raise blob_error
+        return send_post(client, text, embed, root, parent, facets)
+    mock_bsky.send_post.side_effect = reject_thumb
+    post_outbox.enqueue("tech", "http://example.com/1", [
+        {"text": "1", "embed": {"uri": "http://example.com/1", "title": "T", "description": "D",
+                                "thumb_url": "http://example.com/og.png"}},
+    ])
+
+    assert post_outbox.drain(ACCOUNTS, min_interval=0) == 1
+
+    mock_forget.assert_called_once_with("tech", "http://example.com/og.png")
+    assert mock_bsky.send_post.call_args.args[2].external.thumb is None
+    assert post_outbox.get_item("tech", "http://example.com/1")["state"] == post_outbox.STATE_SENT
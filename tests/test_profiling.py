@@ -0,0 +1,86 @@
+import os
+import time
+import pstats
+import profiling
+
+
+def busy_parse():
+    return sorted(str(i) for i in range(20000))
+
+
+def busy_summary():
+    return [bytearray(1024) for _ in range(200)]
+
+
+def test_stage_is_noop_when_inactive():
+    """プロファイルモードでない場合、stageは何もしないことを確認するテスト"""
+    profiling.activate(None)
+    with profiling.stage("fetch"):
+        value = busy_parse()
+    assert len(value) == 20000
+
+
+def test_profiler_records_stages_and_writes_report(tmp_path):
+    """段階ごとの統計・メモリのピーク・成果物とレポートが書き出されることを確認するテスト"""
+    profiler = profiling.Profiler(output_dir=str(tmp_path), top_n=5)
+    profiling.activate(profiler)
+    try:
+        with profiling.stage("fetch"):
+            busy_parse()
+        with profiling.stage("summary"):
+            busy_summary()
+        with profiling.stage("summary"):
+            busy_summary()
+    finally:
+        profiling.activate(None)
+
+    assert profiler.stages["fetch"].calls == 1
+    assert profiler.stages["summary"].calls == 2
+    assert profiler.stages["summary"].peak_bytes >= 200 * 1024
+
+    report_path = profiler.write_report()
+    run_dir = os.path.dirname(report_path)
+    assert os.path.dirname(run_dir) == str(tmp_path)
+    report = open(report_path, encoding="utf-8").read()
+    assert "===== fetch =====" in report
+    assert "busy_parse" in report
+    assert "busy_summary" in report
+
+    stats = pstats.Stats(os.path.join(run_dir, "fetch.prof"))
+    assert any(func[2] == "busy_parse" for func in stats.stats)
+
+
+def test_nested_stage_pauses_outer_stage(tmp_path):
+    """入れ子の段階を実行している間は、外側の段階の統計に含めないことを確認するテスト"""
+    profiler = profiling.Profiler(output_dir=str(tmp_path))
+    profiling.activate(profiler)
+    try:
+        with profiling.stage("account"):
+            with profiling.stage("ranking"):
+                busy_parse()
+            busy_summary()
+    finally:
+        profiling.activate(None)
+
+    outer = {func[2] for func in profiler.stages["account"].stats.stats}
+    inner = {func[2] for func in profiler.stages["ranking"].stats.stats}
+    assert "busy_summary" in outer and "busy_parse" not in outer
+    assert "busy_parse" in inner
+
+
+def test_sampling_writes_folded_stacks(tmp_path):
+    """サンプリングを有効にした場合、段階ごとのfolded形式のスタックが書き出されることを確認するテスト"""
+    profiler = profiling.Profiler(output_dir=str(tmp_path), sample_interval=0.001)
+    profiling.activate(profiler)
+    try:
+        with profiling.stage("fetch"):
+            deadline = time.perf_counter() + 0.2
+            while time.perf_counter() < deadline:
+                busy_parse()
+    finally:
+        profiling.activate(None)
+
+    assert profiler.stages["fetch"].samples
+    run_dir = os.path.dirname(profiler.write_report())
+    folded = open(os.path.join(run_dir, "fetch.folded"), encoding="utf-8").read()
+    assert "busy_parse" in folded
@@ -1,8 +1,7 @@
-import pytest
 import time
-from rss_fetcher import fetch_new_articles
+from rss_fetcher import fetch_new_articles, fetch_new_articles_for_accounts
 
-# feedparser.parseの結果を模倣するためのヘルパー
+# fetch_feed（feedparser.parse）の結果を模倣するためのヘルパー
 class MockFeed:
     def __init__(self, entries):
         self.entries = entries
@@ -34,7 +33,7 @@ def test_fetch_new_articles_and_sort(mocker):
         MockEntry("Middle Article", "http://example.com/new2", "S2", time.gmtime(1704153600)), # 2024-01-02
     ]
 
-    mocker.patch("rss_fetcher.feedparser.parse", return_value=MockFeed(mock_entries))
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(mock_entries))
     mocker.patch("rss_fetcher.db_manager.url_exists", return_value=False)
 
     rss_urls = ["http://example.com/feed.xml"]
@@ -55,10 +54,10 @@ def test_fetch_new_articles_with_new_and_old_entries(mocker):
         MockEntry("New Article 2", "http://example.com/new2", "Summary 3"),
     ]
 
-    # feedparser.parseとdb_manager.url_existsをモック化
-    mocker.patch("rss_fetcher.feedparser.parse", return_value=MockFeed(mock_entries))
+    # fetch_feedとdb_manager.url_existsをモック化
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(mock_entries))
 
-    def mock_url_exists(url):
+    def mock_url_exists(url, account=None):
         return "old" in url  # URLに"old"が含まれていればTrueを返す
     mocker.patch("rss_fetcher.db_manager.url_exists", side_effect=mock_url_exists)
 
@@ -80,7 +79,7 @@ def test_fetch_new_articles_with_only_old_entries(mocker):
         MockEntry("Old Article 1", "http://example.com/old1", "Summary 1"),
         MockEntry("Old Article 2", "http://example.com/old2", "Summary 2"),
     ]
-    mocker.patch("rss_fetcher.feedparser.parse", return_value=MockFeed(mock_entries))
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(mock_entries))
     mocker.patch("rss_fetcher.db_manager.url_exists", return_value=True)
 
     rss_urls = ["http://example.com/feed.xml"]
@@ -94,7 +93,7 @@ def test_fetch_new_articles_with_only_new_entries(mocker):
         MockEntry("New Article 1", "http://example.com/new1", "Summary 1", time.gmtime(100)),
         MockEntry("New Article 2", "http://example.com/new2", "Summary 2", time.gmtime(200)),
     ]
-    mocker.patch("rss_fetcher.feedparser.parse", return_value=MockFeed(mock_entries))
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(mock_entries))
     mocker.patch("rss_fetcher.db_manager.url_exists", return_value=False)
 
     rss_urls = ["http://example.com/feed.xml"]
@@ -106,7 +105,7 @@ def test_fetch_new_articles_with_only_new_entries(mocker):
 
 def test_fetch_new_articles_with_empty_feed(mocker):
     """RSSフィードが空の場合のテスト"""
-    mocker.patch("rss_fetcher.feedparser.parse", return_value=MockFeed([]))
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed([]))
     db_mock = mocker.patch("rss_fetcher.db_manager.url_exists")
 
     rss_urls = ["http://example.com/empty_feed.xml"]
@@ -127,7 +126,7 @@ def test_fetch_from_multiple_feeds(mocker):
     feed2_entries = [MockEntry("Feed 2 Article", "http://f2.com/a2", "S2", time.gmtime(100))]
 
     # parseが呼ばれるたびに異なる値を返すように設定
-    mocker.patch("rss_fetcher.feedparser.parse", side_effect=[
+    mocker.patch("rss_fetcher.fetch_feed", side_effect=[
         MockFeed(feed1_entries),
         MockFeed(feed2_entries)
     ])
@@ -140,3 +139,178 @@ def test_fetch_from_multiple_feeds(mocker):
     # ソート後の順序をチェック
     assert new_articles[0]["link"] == "http://f2.com/a2" # f2が古いはず
     assert new_articles[1]["link"] == "http://f1.com/a1"
+
+def test_fetch_for_accounts_shares_feeds_and_content(mocker):
+    """複数アカウントで同じフィード・記事を取得する場合、取得とスクレイピングが1回だけ行われるかのテスト"""
+    shared_entries = [MockEntry("Shared Article", "http://shared.com/a1", "S1", time.gmtime(100))]
+    other_entries = [MockEntry("Other Article", "http://other.com/a2", "S2", time.gmtime(200))]
+
+    feeds = {"http://shared.com/feed.xml": MockFeed(shared_entries), "http://other.com/feed.xml": MockFeed(other_entries)}
+    mock_fetch_feed = mocker.patch("rss_fetcher.fetch_feed", side_effect=lambda url, timeout: feeds[url])
+    mock_content = mocker.patch("rss_fetcher.fetch_article", return_value=("本文", {}))
+
+    # "news"アカウントでは共有記事が投稿済み
+    def mock_url_exists(url, account=None):
+        return account == "news" and url == "http://shared.com/a1"
+    mocker.patch("rss_fetcher.db_manager.url_exists", side_effect=mock_url_exists)
+
+    accounts = [
+        {"name": "tech", "rss_urls": ["http://shared.com/feed.xml"]},
+        {"name": "news", "rss_urls": ["http://shared.com/feed.xml", "http://other.com/feed.xml"]},
+        {"name": "misc", "rss_urls": ["http://shared.com/feed.xml"]},
+    ]
+    result = fetch_new_articles_for_accounts(accounts)
+
+    assert [a["link"] for a in result["tech"]] == ["http://shared.com/a1"]
+    assert [a["link"] for a in result["news"]] == ["http://other.com/a2"]
+    assert [a["link"] for a in result["misc"]] == ["http://shared.com/a1"]
+    assert mock_fetch_feed.call_count == 2
+    assert mock_content.call_count == 2
+
+def test_fetch_new_articles_limits_to_newest_and_scrapes_only_selected(mocker):
+    """max_articlesを指定した場合、最新の記事だけが選ばれ、その本文だけを取得するかのテスト"""
+    feed1_entries = [MockEntry(f"F1-{i}", f"http://f1.com/a{i}", "S", time.gmtime(i * 10)) for i in range(5)]
+    feed2_entries = [MockEntry(f"F2-{i}", f"http://f2.com/a{i}", "S", time.gmtime(i * 10 + 5)) for i in range(5)]
+    mocker.patch("rss_fetcher.fetch_feed", side_effect=[MockFeed(feed1_entries), MockFeed(feed2_entries)])
+    mocker.patch("rss_fetcher.db_manager.url_exists", return_value=False)
+    mock_content = mocker.patch("rss_fetcher.fetch_article", return_value=("本文", {}))
+
+    new_articles = fetch_new_articles(["http://f1.com/feed.xml", "http://f2.com/feed.xml"], max_articles=3)
+
+    assert [a["title"] for a in new_articles] == ["F2-3", "F1-4", "F2-4"]
+    assert mock_content.call_count == 3
+
+def test_fetch_stops_scraping_at_deadline(mocker):
+    """締め切りを過ぎた場合、それまでに本文を取得できた記事だけを返し、残りのフィードは取得しないかのテスト"""
+    from run_control import Deadline
+    entries = [MockEntry(f"A{i}", f"http://f1.com/a{i}", "S", time.gmtime(i * 10)) for i in range(3)]
+    mock_fetch_feed = mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(entries))
+    mocker.patch("rss_fetcher.db_manager.url_exists", return_value=False)
+    mock_mark = mocker.patch("rss_fetcher.websub.mark_processed")
+
+    clock = [0.0]
+    deadline = Deadline(30, clock=lambda: clock[0])
+
+    def slow_content(url, feed_url=None, timeout=None):
+        clock[0] += 20  # 1件の取得に20秒かかる
+        return "本文", {}
+
+    mock_content = mocker.patch("rss_fetcher.fetch_article", side_effect=slow_content)
+
+    accounts = [
+        {"name": "tech", "rss_urls": ["http://f1.com/feed.xml"]},
+        {"name": "news", "rss_urls": ["http://f2.com/feed.xml"]},
+    ]
+    result = fetch_new_articles_for_accounts(accounts, deadline=deadline)
+
+    # 2件目の取得で締め切りを過ぎ、3件目以降と次のフィードは取得しない
+    assert [a["link"] for a in result["tech"]] == ["http://f1.com/a0", "http://f1.com/a1"]
+    assert result["news"] == []
+    mock_fetch_feed.assert_called_once_with("http://f1.com/feed.xml", 10)
+    # タイムアウトは残り時間に合わせて短くなる
+    assert mock_content.call_args_list[0].kwargs["timeout"] == 10
+    assert mock_content.call_args_list[1].kwargs["timeout"] == 10
+    # 打ち切った場合、WebSubの配信キューは次回も読み直す
+    mock_mark.assert_not_called()
+
+
+def test_fetch_keeps_card_metadata(mocker):
+    """記事ページから取り出した埋め込みカードのメタデータが記事に保持されるかのテスト"""
+    entries = [MockEntry("A", "http://f1.com/a", "S", time.gmtime(10))]
+    mocker.patch("rss_fetcher.fetch_feed", return_value=MockFeed(entries))
+    mocker.patch("rss_fetcher.db_manager.url_exists", return_value=False)
+    mocker.patch("rss_fetcher.fetch_article", return_value=("本文", {"image": "http://f1.com/og.png"}))
+
+    article = fetch_new_articles(["http://f1.com/feed.xml"])[0]
+
+    assert article["metadata"] == {"image": "http://f1.com/og.png"}
+
+
+def test_extract_card_metadata_prefers_opengraph():
+    """OpenGraphを優先し、ない項目はTwitterカードから取り、画像URLは絶対URLにするかのテスト"""
+    from bs4 import BeautifulSoup
+    from rss_fetcher import extract_card_metadata
+    html = """
+    <html><head>
+      <meta property="og:title" content="OGタイトル">
+      <meta name="twitter:title" content="Twitterタイトル">
+      <meta name="twitter:description" content="Twitterの説明">
+      <meta property="og:image" content="/images/card.png">
+    </head><body></body></html>
+    """
+    metadata = extract_card_metadata(BeautifulSoup(html, "html.parser"), "https://blog.example.com/posts/1")
+
+    assert metadata == {
+        "title": "OGタイトル",
+        "description": "Twitterの説明",
+        "image": "https://blog.example.com/images/card.png",
+    }
+    assert extract_card_metadata(BeautifulSoup("<p>x</p>", "html.parser"), "https://example.com") == {}
+
+
+def test_fetch_article_reads_metadata_from_same_response(mocker):
+    """本文と埋め込みカードのメタデータを、1回の取得結果から取り出すかのテスト"""
+    from rss_fetcher import fetch_article
+    html = f"""<html><head><meta property="og:image" content="https://cdn.example.com/a.jpg"></head>
+    <body><article><p>{"本文です。" * 30}</p></article></body></html>"""
+    response = mocker.MagicMock()
+    response.content = html.encode("utf-8")
+    mock_get = mocker.patch("rss_fetcher.requests.get", return_value=response)
+    mocker.patch("rss_fetcher.extraction_rules.record_cascade")
+    mocker.patch("rss_fetcher.extraction_rules.learned_selector", return_value=None)
+
+    content, metadata = fetch_article("https://blog.example.com/1", timeout=5)
+
+    assert content == "本文です。" * 30
+    assert metadata == {"image": "https://cdn.example.com/a.jpg"}
+    mock_get.assert_called_once_with("https://blog.example.com/1", timeout=5)
+
+
+def test_fetch_feed_downloads_with_timeout(mocker):
+    """フィードをタイムアウトを指定して取得し、取得した内容を解析するかのテスト"""
+    import requests
+    from rss_fetcher import fetch_feed
+    xml = """<rss version="2.0"><channel><title>T</title>
+    <item><title>A</title><link>/posts/1</link></item></channel></rss>"""
+    response = mocker.MagicMock()
+    response.content = xml.encode("utf-8")
+    response.headers = {"Content-Type": "application/rss+xml"}
+    response.url = "http://f1.com/feed.xml"
+    mock_get = mocker.patch("rss_fetcher.requests.get", return_value=response)
+
+    feed = fetch_feed("http://f1.com/feed.xml", timeout=3)
+
+    mock_get.assert_called_once_with("http://f1.com/feed.xml", timeout=3)
+    # 相対URLは取得したフィードのURLをもとに解決する
+    assert [entry.link for entry in feed.entries] == ["http://f1.com/posts/1"]
+
+    # 取得に失敗した場合は、エントリのない結果を返す
+    mock_get.side_effect = requests.exceptions.Timeout("timed out")
+    assert fetch_feed("http://f1.com/feed.xml", timeout=3).entries == []
+
+
+def test_iter_unseen_entries_skips_seen_and_duplicates(mocker):
+    """未処理のエントリだけを本文を取得せずに返し、フィード間の重複を除くかのテスト"""
+    from rss_fetcher import iter_unseen_entries
+    feeds_by_url = {
+        "http://f1.com/feed.xml": MockFeed([MockEntry("A", "http://a.com/1", "S1"), MockEntry("B", "http://a.com/2", "S2")]),
+        "http://f2.com/feed.xml": MockFeed([MockEntry("B", "http://a.com/2", "S2"), MockEntry("C", "http://a.com/3", "S3")]),
+    }
+    mock_fetch_feed = mocker.patch("rss_fetcher.fetch_feed", side_effect=lambda url, timeout: feeds_by_url[url])
+    mock_unseen = mocker.patch("rss_fetcher.db_manager.unseen_urls",
+                               side_effect=lambda urls, account: [u for u in urls if u != "http://a.com/1"])
+    mock_content = mocker.patch("rss_fetcher.fetch_article")
+
+    account = {"name": "tech", "rss_urls": list(feeds_by_url)}
+    feeds = {}
+    entries = list(iter_unseen_entries(account, feeds, []))
+
+    assert [e["link"] for e in entries] == ["http://a.com/2", "http://a.com/3"]
+    assert entries[0]["feed_url"] == "http://f1.com/feed.xml"
+    assert entries[0]["summary"] == "S2"
+    # 処理済みかどうかはフィードごとに1回でまとめて問い合わせる
+    assert mock_unseen.call_count == 2
+    mock_content.assert_not_called()
+    # 取得したフィードは共有され、次のアカウントでは再取得しない
+    list(iter_unseen_entries({"name": "news", "rss_urls": ["http://f1.com/feed.xml"]}, feeds, []))
+    assert mock_fetch_feed.call_count == 2
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import pytest
+import run_control
+from run_control import Deadline, RunLock
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline_remaining_and_expired():
+    """残り時間が時計に従って減り、0になると期限切れになることを確認するテスト"""
+    clock = FakeClock()
+    deadline = Deadline(10, clock)
+
+    assert deadline.remaining() == 10
+    clock.now = 4
+    assert deadline.remaining() == 6
+    assert not deadline.expired()
+    clock.now = 12
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+
+
+def test_deadline_without_limit():
+    """締め切りなしの場合は期限切れにならず、タイムアウトはlimitのままであることを確認するテスト"""
+    deadline = Deadline(None)
+
+    assert deadline.remaining() == float("inf")
+    assert not deadline.expired()
+    assert deadline.timeout(10) == 10
+    assert deadline.split(0.5).remaining() == float("inf")
+
+
+def test_deadline_timeout_is_capped_by_remaining():
+    """リクエストのタイムアウトが残り時間で短くなり、最小値を下回らないことを確認するテスト"""
+    clock = FakeClock()
+    deadline = Deadline(30, clock)
+
+    assert deadline.timeout(10) == 10
+    clock.now = 25
+    assert deadline.timeout(10) == 5
+    clock.now = 30
+    assert deadline.timeout(10) == run_control.MIN_TIMEOUT
+
+
+def test_deadline_split_across_stages():
+    """段階の締め切りは、その時点の残り時間の割合で決まり、全体の締め切りを超えないことを確認するテスト"""
+    clock = FakeClock()
+    deadline = Deadline(100, clock)
+
+    fetch = deadline.for_stage("fetch")
+    assert fetch.remaining() == 100 * run_control.STAGE_SHARES["fetch"]
+
+    # 取得が早く終われば、残りの時間は後の段階で使える
+    clock.now = 10
+    process = deadline.for_stage("process")
+    assert process.remaining() == pytest.approx(90 * run_control.STAGE_SHARES["process"])
+    clock.now = 100
+    assert deadline.for_stage("drain").expired()
+
+
+def test_run_deadline_from_env(monkeypatch):
+    monkeypatch.setenv("RUN_DEADLINE_SECONDS", "0")
+    assert run_control.run_deadline().expires_at is None
+    monkeypatch.setenv("RUN_DEADLINE_SECONDS", "60")
+    assert 59 < run_control.run_deadline().remaining() <= 60
+
+
+def test_run_lock_is_exclusive(tmp_path):
+    """ロックを持っている間は他のロックを取得できず、解放後は取得できることを確認するテスト"""
+    path = str(tmp_path / "test.db.lock")
+    first = RunLock(path)
+    assert first.acquire()
+    assert open(path).read().strip() == str(os.getpid())
+
+    started = time.monotonic()
+    assert not RunLock(path).acquire()
+    assert time.monotonic() - started < 0.5
+
+    first.release()
+    with RunLock(path) as acquired:
+        assert acquired
+
+
+def test_run_lock_waits_bounded_time(tmp_path, monkeypatch):
+    """wait_seconds の間に他の実行がロックを解放すれば取得でき、解放されなければ諦めることを確認するテスト"""
+    monkeypatch.setattr(run_control, "LOCK_POLL_INTERVAL", 0.02)
+    path = str(tmp_path / "test.db.lock")
+    holder = RunLock(path)
+    assert holder.acquire()
+
+    started = time.monotonic()
+    assert not RunLock(path, wait_seconds=0.2).acquire()
+    assert 0.2 <= time.monotonic() - started < 1.0
+
+    timer = threading.Timer(0.1, holder.release)
+    timer.start()
+    waiter = RunLock(path, wait_seconds=2)
+    assert waiter.acquire()
+    timer.join()
+    waiter.release()
+
+
+def test_lock_path_follows_db_name(temp_db):
+    assert run_control.lock_path() == f"{temp_db}.lock"
@@ -0,0 +1,45 @@
+import pytest
+import sqlite3
+import run_ledger
+
+@pytest.fixture
+def db_connection(monkeypatch):
+    """
+    テスト用のインメモリSQLiteデータベース接続を作成し、
+    sqlite3.connectが常にこの接続を返すようにモンキーパッチする。
+    """
+    conn = sqlite3.connect(":memory:")
+    monkeypatch.setattr("run_ledger.sqlite3.connect", lambda db_name: conn)
+    run_ledger.init_ledger()
+    yield conn
+    conn.close()
+
+def test_save_and_load_stages(db_connection):
+    """段階の出力を記録し、読み出せることを確認するテスト"""
+    assert run_ledger.load_stages("tech") == {}
+    assert not run_ledger.has_pending_run("tech")
+
+    candidates = [{"title": "記事1", "link": "http://example.com/1"}]
+    run_ledger.save_stage("tech", run_ledger.STAGE_CANDIDATES, candidates)
+    run_ledger.save_stage("tech", run_ledger.STAGE_RANKING, ["http://example.com/1"])
+
+    stages = run_ledger.load_stages("tech")
+    assert stages == {
+        run_ledger.STAGE_CANDIDATES: candidates,
+        run_ledger.STAGE_RANKING: ["http://example.com/1"],
+    }
+    assert run_ledger.has_pending_run("tech")
+    # 他のアカウントには影響しない
+    assert not run_ledger.has_pending_run("news")
+
+def test_record_failure_counts_and_clear(db_connection):
+    """失敗回数が加算され、clearで台帳と失敗回数が消えることを確認するテスト"""
+    run_ledger.save_stage("tech", run_ledger.STAGE_CANDIDATES, [])
+
+    assert run_ledger.record_failure("tech", "ranking") == 1
+    assert run_ledger.record_failure("tech", "ranking") == 2
+
+    run_ledger.clear("tech")
+
+    assert run_ledger.load_stages("tech") == {}
+    assert run_ledger.record_failure("tech", "ranking") == 1
@@ -0,0 +1,153 @@
+import io
+import hashlib
+import random
+import pytest
+from PIL import Image
+from atproto_client.models.blob_ref import BlobRef, IpldLink
+import thumbnails
+
+
+def _image_bytes(size=(64, 48), color=(200, 30, 30), fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _noise_image(size):
+    rng = random.Random(0)
+    return Image.frombytes("RGB", size, bytes(rng.getrandbits(8) for _ in range(size[0] * size[1] * 3)))
+
+
+class FakeResponse:
+    """requests.get(stream=True) の応答を模倣し、チャンクに分けて本文を返す"""
+
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.headers = headers or {}
+        self.chunks_read = 0
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            self.chunks_read += 1
+            yield self.data[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def thumbs_db(temp_db):
+    thumbnails.init_thumbnails()
+
+
+@pytest.fixture
+def fake_client(mocker):
+    """アップロードのたびに異なるblobを返すクライアント"""
+    client = mocker.MagicMock()
+    counter = iter(range(1, 1000))
+
+    def upload_blob(data):
+        i = next(counter)
+        response = mocker.MagicMock()
+        response.blob = BlobRef(mime_type="image/jpeg", size=len(data), ref=IpldLink(link=f"bafkrei{i}"))
+        return response
+
+    client.upload_blob.side_effect = upload_blob
+    return client
+
+
+def test_download_image_streams_and_hashes(mocker):
+    """チャンクごとにデコードし、元の画像のハッシュを返すかのテスト"""
+    data = _image_bytes(fmt="JPEG")
+    response = FakeResponse(data)
+    mocker.patch("thumbnails.requests.get", return_value=response)
+    mocker.patch("thumbnails.CHUNK_SIZE", 100)
+
+    digest, image = thumbnails.download_image("http://example.com/a.jpg")
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert image.size == (64, 48)
+    assert response.chunks_read > 1
+
+
+def test_download_image_rejects_large_images(mocker):
+    """上限を超える画像は、宣言されたサイズでも受信中のサイズでも拒否するかのテスト"""
+    mocker.patch("thumbnails.MAX_DOWNLOAD_BYTES", 50)
+    data = _image_bytes()
+
+    mocker.patch("thumbnails.requests.get", return_value=FakeResponse(data, {"Content-Length": str(len(data))}))
+    with pytest.raises(ValueError):
+        thumbnails.download_image("http://example.com/a.png")
+
+    mocker.patch("thumbnails.requests.get", return_value=FakeResponse(data))
+    with pytest.raises(ValueError):
+        thumbnails.download_image("http://example.com/a.png")
+
+
+def test_make_thumbnail_fits_size_and_byte_limit():
+    """縮小・再エンコードしたサムネイルが、大きさとバイト数の上限に収まるかのテスト"""
+    image = Image.new("RGBA", (3000, 1500), (10, 20, 30, 128))
+    data = thumbnails.make_thumbnail(image)
+    thumb = Image.open(io.BytesIO(data))
+    assert thumb.format == "JPEG"
+    assert thumb.size == (1000, 500)
+    assert len(data) <= thumbnails.MAX_BLOB_BYTES
+
+    # ノイズの多い画像は、品質を下げてもさらに縮小して上限に収める
+    data = thumbnails.make_thumbnail(_noise_image((400, 400)), max_bytes=20_000)
+    assert len(data) <= 20_000
+    assert Image.open(io.BytesIO(data)).size[0] < 400
+
+
+def test_get_thumb_blob_uploads_each_image_once(thumbs_db, fake_client, mocker):
+    """同じ画像はURLが違っても1回だけアップロードし、同じURLは再ダウンロードしないかのテスト"""
+    logo = _image_bytes()
+    mock_get = mocker.patch("thumbnails.requests.get", side_effect=lambda *a, **k: FakeResponse(logo))
+
+    first = thumbnails.get_thumb_blob(fake_client, "tech", "http://example.com/logo.png")
+    thumbnails.remember_blob("tech", "http://example.com/logo.png", first)
+    second = thumbnails.get_thumb_blob(fake_client, "tech", "http://example.com/logo.png?v=2")
+    third = thumbnails.get_thumb_blob(fake_client, "tech", "http://example.com/logo.png")
+
+    assert first == second == third
+    assert fake_client.upload_blob.call_count == 1
+    # 3回目は画像URLのキャッシュにより、ダウンロードも行わない
+    assert mock_get.call_count == 2
+
+    # blobはアカウントのリポジトリに属するため、別のアカウントでは改めてアップロードする
+    other = thumbnails.get_thumb_blob(fake_client, "news", "http://example.com/logo.png")
+    assert other != first
+    assert fake_client.upload_blob.call_count == 2
+
+
+def test_get_thumb_blob_caches_only_posted_blobs(thumbs_db, fake_client, mocker):
+    """投稿に使われていないblobはキャッシュせず、破棄したblobはアップロードし直すかのテスト"""
+    mocker.patch("thumbnails.requests.get", side_effect=lambda *a, **k: FakeResponse(_image_bytes()))
+    url = "http://example.com/og.png"
+
+    # アップロードしただけのblobはPDSに削除されうるため、次の投稿ではアップロードし直す
+    first = thumbnails.get_thumb_blob(fake_client, "tech", url)
+    second = thumbnails.get_thumb_blob(fake_client, "tech", url)
+    assert fake_client.upload_blob.call_count == 2
+
+    thumbnails.remember_blob("tech", url, second)
+    assert thumbnails.get_thumb_blob(fake_client, "tech", url) == second
+    assert fake_client.upload_blob.call_count == 2
+
+    thumbnails.forget_blob("tech", url)
+    assert thumbnails.get_thumb_blob(fake_client, "tech", url) != first
+    assert fake_client.upload_blob.call_count == 3
+
+
+def test_get_thumb_blob_returns_none_on_failure(thumbs_db, fake_client, mocker):
+    """画像を取得・デコードできない場合はNoneを返し、アップロードしないかのテスト"""
+    mocker.patch("thumbnails.requests.get", return_value=FakeResponse(b"not an image"))
+
+    assert thumbnails.get_thumb_blob(fake_client, "tech", "http://example.com/broken.png") is None
+    fake_client.upload_blob.assert_not_called()
@@ -0,0 +1,297 @@
+import pytest
+import os
+import hmac
+import http.client
+import time
+import hashlib
+import sqlite3
+import threading
+import feedparser
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import db_manager
+import websub
+from rss_fetcher import fetch_new_articles, fetch_new_articles_for_accounts
+
+FEED_URL = "http://example.com/feed.xml"
+
+def _feed_xml(hub_url, entries):
+    """ハブへのリンクを含むAtomフィードを作成する"""
+    items = "".join(
+        f"<entry><title>{title}</title><link href='{link}'/><id>{link}</id>"
+        f"<updated>2024-01-0{i + 1}T00:00:00Z</updated><summary>{title}の概要</summary></entry>"
+        for i, (title, link) in enumerate(entries)
+    )
+    return (
+        "<?xml version='1.0' encoding='utf-8'?>"
+        "<feed xmlns='http://www.w3.org/2005/Atom'><title>Test</title>"
+        f"<link rel='hub' href='{hub_url}'/><link rel='self' href='{FEED_URL}'/>"
+        f"{items}</feed>"
+    )
+
+
+class StandInHub:
+    """
+    テスト用のローカルなWebSubハブ。
+    購読要求を受けると、コールバックに確認要求（GET）を送ってチャレンジの応答を確かめ、
+    publishで購読者に署名付きの内容を配信する。
+    """
+    def __init__(self):
+        self.subscribers = {}  # topic -> (callback, secret)
+        self.requests = []
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                hub.requests.append(params)
+                challenge = "challenge-123"
+                response = requests.get(params["hub.callback"], params={
+                    "hub.mode": params["hub.mode"],
+                    "hub.topic": params["hub.topic"],
+                    "hub.challenge": challenge,
+                    "hub.lease_seconds": params["hub.lease_seconds"],
+                }, timeout=5)
+                if response.status_code == 200 and response.text == challenge:
+                    hub.subscribers[params["hub.topic"]] = (params["hub.callback"], params["hub.secret"])
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hub"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def publish(self, topic, body, secret=None):
+        callback, subscriber_secret = self.subscribers[topic]
+        data = body.encode("utf-8")
+        signature = hmac.new((secret or subscriber_secret).encode(), data, hashlib.sha256).hexdigest()
+        return requests.post(callback, data=data, headers={
+            "Content-Type": "application/atom+xml",
+            "X-Hub-Signature": f"sha256={signature}",
+        }, timeout=5)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def callback_url(temp_db):
+    """一時データベースを使うコールバックサーバーを起動し、そのURLを返すフィクスチャ"""
+    db_manager.init_db()
+    server = websub.make_callback_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/websub"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def hub():
+    hub = StandInHub()
+    yield hub
+    hub.close()
+
+def _queued_rows():
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        return conn.execute("SELECT feed_url, processed_at FROM websub_queue").fetchall()
+
+def test_discover_hub():
+    """フィードのrel="hub"とrel="self"のリンクからハブとトピックを見つけられるかのテスト"""
+    feed = feedparser.parse(_feed_xml("http://hub.example.com/", []))
+
+    assert websub.discover_hub(feed, FEED_URL) == ("http://hub.example.com/", FEED_URL)
+    assert websub.discover_hub(feedparser.parse("<rss><channel></channel></rss>"), FEED_URL) is None
+
+def test_subscribe_is_verified_by_hub(callback_url, hub):
+    """購読要求がハブの確認要求によって有効になるかのテスト"""
+    assert not websub.is_active(FEED_URL)
+
+    assert websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url, lease_seconds=3600)
+
+    assert FEED_URL in hub.subscribers
+    assert websub.is_active(FEED_URL)
+
+def test_push_with_valid_signature_is_queued(callback_url, hub):
+    """正しい署名の配信がキューに保存され、解析して処理済みにできるかのテスト"""
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url)
+
+    response = hub.publish(FEED_URL, _feed_xml(hub.url, [("Pushed", "http://example.com/pushed")]))
+    assert response.status_code == 202
+
+    ids, feed = websub.take_pushed(FEED_URL)
+    assert [entry.link for entry in feed.entries] == ["http://example.com/pushed"]
+
+    websub.mark_processed(ids)
+    ids, feed = websub.take_pushed(FEED_URL)
+    assert ids == [] and feed.entries == []
+
+def test_push_with_invalid_signature_is_ignored(callback_url, hub):
+    """署名が一致しない配信は無視されるかのテスト"""
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url)
+
+    response = hub.publish(FEED_URL, _feed_xml(hub.url, []), secret="wrong-secret")
+
+    assert response.status_code == 202
+    assert _queued_rows() == []
+
+def test_verification_for_unknown_feed_is_rejected(callback_url):
+    """購読していないフィードの確認要求には404を返すかのテスト"""
+    response = requests.get(callback_url, params={
+        "feed": FEED_URL, "hub.mode": "subscribe", "hub.topic": FEED_URL, "hub.challenge": "x",
+    }, timeout=5)
+
+    assert response.status_code == 404
+
+def _verify(callback_url, mode, **params):
+    return requests.get(callback_url, params={
+        "feed": FEED_URL, "hub.mode": mode, "hub.topic": FEED_URL, "hub.challenge": "x", **params,
+    }, timeout=5)
+
+def _lease_expires():
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        return conn.execute("SELECT lease_expires FROM websub_subscriptions WHERE feed_url = ?", (FEED_URL,)).fetchone()[0]
+
+def test_unsolicited_verification_is_rejected(callback_url, hub):
+    """要求していない購読の確認や、購読の解除の確認要求には応答しないかのテスト"""
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url, lease_seconds=3600)
+
+    # 確認が済んだ購読への、再度の確認要求（期間の書き換え）を拒否する
+    response = _verify(callback_url, "subscribe", **{"hub.lease_seconds": "999999"})
+    assert response.status_code == 404 and response.text == ""
+    assert _lease_expires() < time.time() + 3600 + 60
+
+    response = _verify(callback_url, "unsubscribe")
+    assert response.status_code == 404
+    assert websub.is_active(FEED_URL)
+
+def test_verification_validates_lease_seconds(callback_url, hub, mocker):
+    """確認要求の購読期間が整数でなければ400を返し、長すぎる期間は制限されるかのテスト"""
+    # ハブが確認要求を送らないようにして、購読を確認待ちのままにする
+    mocker.patch("websub.requests.post")
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url)
+
+    assert _verify(callback_url, "subscribe", **{"hub.lease_seconds": "abc"}).status_code == 400
+    assert _verify(callback_url, "subscribe", **{"hub.lease_seconds": "-1"}).status_code == 400
+    assert not websub.is_active(FEED_URL)
+
+    response = _verify(callback_url, "subscribe", **{"hub.lease_seconds": str(10 ** 9)})
+    assert response.status_code == 200 and response.text == "x"
+    assert _lease_expires() <= time.time() + websub.MAX_LEASE_SECONDS
+
+def test_push_without_valid_content_length_is_rejected(callback_url, hub):
+    """Content-Lengthがない・負の配信は、本文を読まずに拒否するかのテスト"""
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url)
+    host, port = urlparse(callback_url).netloc.split(":")
+    path = f"/websub?{urlencode({'feed': FEED_URL})}"
+
+    for headers, status in (({}, 411), ({"Content-Length": "-1"}, 400)):
+        conn = http.client.HTTPConnection(host, int(port), timeout=5)
+        conn.putrequest("POST", path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.endheaders()
+        assert conn.getresponse().status == status
+        conn.close()
+    assert _queued_rows() == []
+
+def test_renew_expiring_resubscribes_with_same_secret(callback_url, hub):
+    """期限切れが近い購読が、同じシークレットで更新されるかのテスト"""
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url, lease_seconds=60)
+    first_secret = hub.requests[0]["hub.secret"]
+
+    assert websub.renew_expiring(callback_url, margin=3600) == 1
+
+    assert len(hub.requests) == 2
+    assert hub.requests[1]["hub.secret"] == first_secret
+    assert websub.is_active(FEED_URL)
+
+def test_verify_signature():
+    """X-Hub-Signatureの検証のテスト"""
+    body = b"payload"
+    sha1 = hmac.new(b"secret", body, hashlib.sha1).hexdigest()
+
+    assert websub.verify_signature("secret", body, f"sha1={sha1}")
+    assert not websub.verify_signature("other", body, f"sha1={sha1}")
+    assert not websub.verify_signature("secret", body, f"md5={sha1}")
+    assert not websub.verify_signature("secret", body, None)
+
+def test_fetcher_subscribes_then_reads_pushed_content(callback_url, hub, mocker):
+    """ハブに対応したフィードは購読され、以降はポーリングせずに配信キューから読まれるかのテスト"""
+    mocker.patch.dict(os.environ, {"WEBSUB_CALLBACK_URL": callback_url})
+    mocker.patch("rss_fetcher.get_article_content", return_value="本文")
+    polled_xml = _feed_xml(hub.url, [("Polled", "http://example.com/polled")])
+    polled_urls = []
+
+    def fake_fetch_feed(url, timeout):
+        polled_urls.append(url)
+        return feedparser.parse(polled_xml)
+    mocker.patch("rss_fetcher.fetch_feed", side_effect=fake_fetch_feed)
+
+    # 1回目: ポーリングで取得し、ハブを見つけて購読する
+    articles = fetch_new_articles([FEED_URL])
+    assert [a["link"] for a in articles] == ["http://example.com/polled"]
+    assert polled_urls == [FEED_URL]
+    assert websub.is_active(FEED_URL)
+
+    # 2回目: 配信された内容だけを読み、ポーリングしない
+    hub.publish(FEED_URL, _feed_xml(hub.url, [("Pushed", "http://example.com/pushed")]))
+    accounts = [{"name": db_manager.DEFAULT_ACCOUNT, "rss_urls": [FEED_URL]}]
+    handled = {}
+    articles = fetch_new_articles_for_accounts(accounts, handled=handled)[db_manager.DEFAULT_ACCOUNT]
+    assert [a["link"] for a in articles] == ["http://example.com/pushed"]
+    assert polled_urls == [FEED_URL]
+    # 記事を永続化するまでは処理済みにしない
+    assert all(processed_at is None for _, processed_at in _queued_rows())
+
+    websub.mark_handled(db_manager.DEFAULT_ACCOUNT, handled[db_manager.DEFAULT_ACCOUNT])
+    assert websub.release_handled(accounts) == 1
+    assert all(processed_at is not None for _, processed_at in _queued_rows())
+
+def test_pushed_entries_outside_top_k_are_kept(callback_url, hub, mocker):
+    """上位K件に入らなかった配信のエントリは失われず、次回の取得で読まれるかのテスト"""
+    mocker.patch.dict(os.environ, {"WEBSUB_CALLBACK_URL": callback_url})
+    mocker.patch("rss_fetcher.get_article_content", return_value="本文")
+    websub.subscribe(FEED_URL, hub.url, FEED_URL, callback_url)
+    links = [f"http://example.com/pushed{i}" for i in range(3)]
+    hub.publish(FEED_URL, _feed_xml(hub.url, [(f"Pushed{i}", link) for i, link in enumerate(links)]))
+    account = db_manager.DEFAULT_ACCOUNT
+    accounts = [{"name": account, "rss_urls": [FEED_URL]}]
+
+    fetched = []
+    for _ in range(len(links)):
+        handled = {}
+        articles = fetch_new_articles_for_accounts(accounts, max_articles=1, handled=handled)[account]
+        assert len(articles) == 1
+        fetched.append(articles[0]["link"])
+        db_manager.add_url(articles[0]["link"], account)
+        websub.mark_handled(account, handled[account])
+        websub.release_handled(accounts)
+        if len(fetched) < len(links):
+            assert all(processed_at is None for _, processed_at in _queued_rows())
+
+    # 新しいものから順に、すべてのエントリが読まれてから処理済みになる
+    assert fetched == list(reversed(links))
+    assert all(processed_at is not None for _, processed_at in _queued_rows())
+
+def test_release_waits_for_every_subscribing_account(callback_url):
+    """フィードを購読する全アカウントが処理し終えるまで配信を処理済みにしないかのテスト"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        queue_id = conn.execute(
+            "INSERT INTO websub_queue (feed_url, body, received_at) VALUES (?, ?, ?)",
+            (FEED_URL, "<feed/>", time.time())
+        ).lastrowid
+    accounts = [
+        {"name": "a", "rss_urls": [FEED_URL]},
+        {"name": "b", "rss_urls": [FEED_URL]},
+        {"name": "c", "rss_urls": ["http://example.com/other.xml"]},
+    ]
+
+    websub.mark_handled("a", [queue_id])
+    assert websub.release_handled(accounts) == 0
+    websub.mark_handled("b", [queue_id])
+    assert websub.release_handled(accounts) == 1
@@ -0,0 +1,71 @@
+import re
+from typing import Optional
+import grapheme
+
+# 切り詰める際に文末とみなす文字
+SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", ".")
+# 直後が空白または末尾の場合だけ文末とみなす文字（URLや小数、「GPT-4.5」などの途中で切らないようにする）
+ASCII_SENTENCE_ENDINGS = ("!", "?", ".")
+
+
+def fits(text: str, max_graphemes: int, max_bytes: Optional[int]) -> bool:
+    """書記素数はコードポイント数以下のため、書記素を数えずに上限内に収まると分かる場合はTrueを返す"""
+    if len(text) > max_graphemes:
+        return False
+    return max_bytes is None or len(text) * 4 <= max_bytes or len(text.encode("utf-8")) <= max_bytes
+
+
+def truncate(text: str, max_graphemes: int, max_bytes: Optional[int] = None, placeholder: str = "",
+             prefer_sentence: bool = True, min_sentence_share: float = 0.0,
+             unbreakable: Optional[re.Pattern] = None) -> str:
+    """
+    テキストを max_graphemes 書記素以内かつ max_bytes バイト（UTF-8）以内に収める。
+    書記素を先頭から1回だけ数え、上限を超えた時点で数えるのをやめるため、長いテキストでも上限分しか走査しない。
+    上限を超える場合は、上限内の最後の文末で切る（prefer_sentence）。文末で切った結果が、文の途中で切る場合に
+    残る書記素数に対して min_sentence_share の割合を下回る場合は文の途中で切る。
+    文の途中で切る場合は placeholder を付けて収まる位置で切り、unbreakable に一致する部分（リンクなど）の
+    途中では切らない（その前で切ると何も残らない場合を除く）。
+    max_bytes にNoneを指定した場合は、バイト数を制限しない。
+    """
+    if fits(text, max_graphemes, max_bytes):
+        return text
+
+    keep_graphemes = max(max_graphemes - grapheme.length(placeholder), 0)
+    keep_bytes = None if max_bytes is None else max(max_bytes - len(placeholder.encode("utf-8")), 0)
+
+    count = size = offset = 0       # 走査済みの書記素数・バイト数・文字数
+    cut = cut_count = 0             # placeholder を付けて収まる最後の位置とその書記素数
+    boundary = boundary_count = 0   # 上限内の最後の文末の位置とその書記素数
+    pending = pending_count = 0     # 直後の文字を確認中のASCIIの文末の位置
+    for g in grapheme.graphemes(text):
+        if pending and g.isspace():
+            boundary, boundary_count = pending, pending_count
+        pending = 0
+        count += 1
+        size += len(g.encode("utf-8"))
+        offset += len(g)
+        if count > max_graphemes or (max_bytes is not None and size > max_bytes):
+            break
+        if count <= keep_graphemes and (keep_bytes is None or size <= keep_bytes):
+            cut, cut_count = offset, count
+        if g in ASCII_SENTENCE_ENDINGS:
+            pending, pending_count = offset, count
+        elif g in SENTENCE_ENDINGS:
+            boundary, boundary_count = offset, count
+    else:
+        return text
+
+    if prefer_sentence and boundary and boundary_count >= cut_count * min_sentence_share:
+        return text[:boundary].rstrip()
+
+    if unbreakable is not None:
+        # 切る位置がリンクなどの途中になる場合は、その前で切る
+        for match in unbreakable.finditer(text, 0, offset):
+            if match.start() >= cut:
+                break
+            if cut < match.end():
+                # 前に何も残らない場合は、途中でも書記素の境界で切る
+                if text[:match.start()].strip():
+                    cut = match.start()
+                break
+    return text[:cut].rstrip() + placeholder
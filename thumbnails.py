@@ -0,0 +1,174 @@
+import io
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Any, Optional, Tuple
+import requests
+from PIL import Image, ImageFile
+from atproto_client.models.blob_ref import BlobRef
+import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Blueskyの外部リンクカードのサムネイル（blob）の最大サイズ（バイト）
+MAX_BLOB_BYTES = 1_000_000
+# ダウンロードする画像の最大サイズ（バイト）。これを超える画像は使わない
+MAX_DOWNLOAD_BYTES = 10_000_000
+# サムネイルの最大の幅と高さ（ピクセル）
+THUMB_MAX_SIZE = (1000, 1000)
+# JPEGに再エンコードする際に順に試す品質
+JPEG_QUALITIES = (85, 75, 60, 45)
+# 画像の取得のタイムアウト（秒）
+IMAGE_TIMEOUT = 10
+# ダウンロードのチャンクサイズ（バイト）
+CHUNK_SIZE = 64 * 1024
+
+
+def init_thumbnails():
+    """画像URLと画像のハッシュの対応、およびアカウントごとにアップロードしたblobのキャッシュのテーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnail_images (
+                image_url TEXT PRIMARY KEY,
+                image_hash TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        # blobはアップロードしたアカウントのリポジトリに属するため、アカウントごとにキャッシュする
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnail_blobs (
+                account TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                blob TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (account, image_hash)
+            )
+        """)
+        conn.commit()
+
+
+def _cached_hash(image_url: str) -> Optional[str]:
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT image_hash FROM thumbnail_images WHERE image_url = ?", (image_url,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def _cached_blob(account: str, image_hash: str) -> Optional[BlobRef]:
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT blob FROM thumbnail_blobs WHERE account = ? AND image_hash = ?",
+            (account, image_hash)
+        )
+        row = cursor.fetchone()
+        return BlobRef.model_validate(json.loads(row[0])) if row else None
+
+
+def _save(account: str, image_url: str, image_hash: str, blob: Optional[BlobRef] = None):
+    now = time.time()
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO thumbnail_images (image_url, image_hash, created_at) VALUES (?, ?, ?)",
+            (image_url, image_hash, now)
+        )
+        if blob is not None:
+            cursor.execute(
+                "INSERT OR REPLACE INTO thumbnail_blobs (account, image_hash, blob, created_at) VALUES (?, ?, ?, ?)",
+                (account, image_hash, json.dumps(blob.model_dump(mode="json", by_alias=True)), now)
+            )
+        conn.commit()
+
+
+def download_image(image_url: str, timeout: float = IMAGE_TIMEOUT) -> Tuple[str, Image.Image]:
+    """
+    画像をストリーミングでダウンロードしながらデコードし、(元の画像のSHA-256, 画像) を返す。
+    受信したチャンクを順にデコーダーに渡すため、画像のバイト列全体をメモリに保持しない。
+    MAX_DOWNLOAD_BYTES を超える画像や、デコードできない画像の場合は例外を送出する。
+    """
+    digest = hashlib.sha256()
+    parser = ImageFile.Parser()
+    received = 0
+    with requests.get(image_url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > MAX_DOWNLOAD_BYTES:
+            raise ValueError(f"画像が大きすぎます（{declared}バイト）")
+        for chunk in response.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            if received > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"画像が大きすぎます（{MAX_DOWNLOAD_BYTES}バイト超）")
+            digest.update(chunk)
+            parser.feed(chunk)
+    return digest.hexdigest(), parser.close()
+
+
+def make_thumbnail(image: Image.Image, max_bytes: int = MAX_BLOB_BYTES) -> bytes:
+    """
+    画像を THUMB_MAX_SIZE に収まるよう縮小してJPEGに再エンコードし、max_bytes 以下のバイト列を返す。
+    品質を下げても収まらない場合は、さらに縮小して繰り返す。
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail(THUMB_MAX_SIZE)
+    while True:
+        for quality in JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                return buffer.getvalue()
+        if min(image.size) <= 16:
+            raise ValueError("サムネイルをサイズの上限内に収められません")
+        image = image.resize((max(image.width // 2, 1), max(image.height // 2, 1)))
+
+
+def get_thumb_blob(client: Any, account: str, image_url: str) -> Optional[BlobRef]:
+    """
+    og:image などの画像URLに対応するサムネイルのblobを返す。
+    画像URLごとに画像のハッシュを、アカウントと画像のハッシュごとに投稿で使ったblobをキャッシュするため、
+    サイトのロゴのように同じ画像が繰り返し使われても、ダウンロードとアップロードは1回だけ行う。
+    どの投稿からも参照されないblobはPDSに削除されるため、アップロードしたblobは投稿に成功してから
+    remember_blob でキャッシュする。
+    取得やアップロードに失敗した場合はNoneを返す（サムネイルなしで投稿する）。
+    """
+    try:
+        image_hash = _cached_hash(image_url)
+        if image_hash:
+            blob = _cached_blob(account, image_hash)
+            if blob is not None:
+                return blob
+
+        image_hash, image = download_image(image_url)
+        _save(account, image_url, image_hash)
+        blob = _cached_blob(account, image_hash)
+        if blob is None:
+            data = make_thumbnail(image)
+            blob = client.upload_blob(data).blob
+            logger.info(f"[{account}] サムネイルをアップロードしました（{len(data)}バイト）: {image_url}")
+        return blob
+    except Exception as e:
+        logger.warning(f"[{account}] サムネイルを作成できませんでした ({image_url}): {e}")
+        return None
+
+
+def remember_blob(account: str, image_url: str, blob: BlobRef):
+    """投稿に添付して送信できたblobを、以降の投稿で使い回せるようにキャッシュする"""
+    image_hash = _cached_hash(image_url)
+    if image_hash:
+        _save(account, image_url, image_hash, blob)
+
+
+def forget_blob(account: str, image_url: str):
+    """PDSで見つからなかったblobのキャッシュを破棄し、次に使う際にアップロードし直す"""
+    image_hash = _cached_hash(image_url)
+    if not image_hash:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM thumbnail_blobs WHERE account = ? AND image_hash = ?", (account, image_hash))
+        conn.commit()
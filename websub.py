@@ -0,0 +1,411 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import secrets
+import sqlite3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode, urlparse, parse_qs
+import feedparser
+import requests
+from dotenv import load_dotenv
+import db_manager
+from logger_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# ハブに要求する購読期間（秒）
+DEFAULT_LEASE_SECONDS = 10 * 24 * 60 * 60
+# 期限までの残りがこの秒数を切った購読を更新する
+DEFAULT_RENEW_MARGIN = 24 * 60 * 60
+# 確認されないまま残っている購読要求を、この秒数が経過したら再送する
+PENDING_RETRY_SECONDS = 60 * 60
+# ハブが確認要求で指定した購読期間を、この秒数までに制限する
+MAX_LEASE_SECONDS = 30 * 24 * 60 * 60
+# 受け付ける配信本文の最大サイズ（バイト）
+MAX_BODY_SIZE = 5 * 1024 * 1024
+# 全アカウントで処理されないまま残った配信を、この秒数が経過したら処理済みにする
+# （ポーリングでも、古いエントリはいずれフィードから消えて候補にならなくなるのと同様）
+PUSH_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+STATE_PENDING = "pending"
+STATE_ACTIVE = "active"
+STATE_DENIED = "denied"
+
+
+def init_websub():
+    """WebSubの購読状態と、配信された内容のキューのテーブルを作成する"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS websub_subscriptions (
+                feed_url TEXT PRIMARY KEY,
+                hub TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                secret TEXT NOT NULL,
+                state TEXT NOT NULL,
+                lease_expires REAL,
+                updated_at REAL NOT NULL,
+                requested_at REAL
+            )
+        """)
+        cursor.execute("PRAGMA table_info(websub_subscriptions)")
+        if "requested_at" not in [row[1] for row in cursor.fetchall()]:
+            # 購読要求の時刻を持たない旧スキーマのテーブルに列を追加する
+            cursor.execute("ALTER TABLE websub_subscriptions ADD COLUMN requested_at REAL")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS websub_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                feed_url TEXT NOT NULL,
+                body BLOB NOT NULL,
+                received_at REAL NOT NULL,
+                processed_at REAL
+            )
+        """)
+        # 配信をどのアカウントが処理し終えたか。フィードを購読する全アカウントが処理した配信を処理済みにする
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS websub_handled (
+                queue_id INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                PRIMARY KEY (queue_id, account)
+            )
+        """)
+        conn.commit()
+
+
+def discover_hub(feed: Any, feed_url: str) -> Optional[Tuple[str, str]]:
+    """
+    フィードの rel="hub" と rel="self" のリンクから、(ハブのURL, 購読するトピックのURL) を返す。
+    ハブがない場合はNoneを返す。
+    """
+    links = getattr(feed, "feed", {}).get("links", [])
+    hub = next((link.get("href") for link in links if link.get("rel") == "hub"), None)
+    if not hub:
+        return None
+    topic = next((link.get("href") for link in links if link.get("rel") == "self"), None)
+    return hub, topic or feed_url
+
+
+def _callback_for(callback_url: str, feed_url: str) -> str:
+    """購読ごとのコールバックURL（どのフィードの配信かをクエリで識別する）を作成する"""
+    separator = "&" if "?" in callback_url else "?"
+    return f"{callback_url}{separator}{urlencode({'feed': feed_url})}"
+
+
+def subscribe(feed_url: str, hub: str, topic: str, callback_url: str,
+              lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+    """
+    ハブに購読を要求する。購読は、ハブからの確認要求（GET）にコールバックが応答した時点で有効になる。
+    更新時は既存のシークレットを使い回し、配信中の内容の署名検証が失敗しないようにする。
+    要求した時刻を requested_at に記録し、確認要求はこの要求に対するものだけに応答する。
+    """
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT secret, state FROM websub_subscriptions WHERE feed_url = ?", (feed_url,))
+        row = cursor.fetchone()
+        secret = row[0] if row else secrets.token_hex(32)
+        state = row[1] if row and row[1] == STATE_ACTIVE else STATE_PENDING
+        cursor.execute("""
+            INSERT OR REPLACE INTO websub_subscriptions
+                (feed_url, hub, topic, secret, state, lease_expires, updated_at, requested_at)
+            VALUES (?, ?, ?, ?, ?, (SELECT lease_expires FROM websub_subscriptions WHERE feed_url = ?), ?, ?)
+        """, (feed_url, hub, topic, secret, state, feed_url, time.time(), time.time()))
+        conn.commit()
+
+    try:
+        response = requests.post(hub, data={
+            "hub.mode": "subscribe",
+            "hub.topic": topic,
+            "hub.callback": _callback_for(callback_url, feed_url),
+            "hub.secret": secret,
+            "hub.lease_seconds": str(lease_seconds),
+        }, timeout=10)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"WebSubの購読要求に失敗しました ({feed_url}): {e}")
+        return False
+
+    logger.info(f"WebSubの購読を要求しました: {topic} (hub: {hub})")
+    return True
+
+
+def is_active(feed_url: str) -> bool:
+    """フィードの購読が有効（確認済みで期限内）かどうかを返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM websub_subscriptions WHERE feed_url = ? AND state = ? AND lease_expires > ?",
+            (feed_url, STATE_ACTIVE, time.time())
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_subscribed(feed: Any, feed_url: str, callback_url: str):
+    """ポーリングで取得したフィードがハブに対応していれば、未購読の場合に購読を要求する"""
+    found = discover_hub(feed, feed_url)
+    if not found:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT state, updated_at FROM websub_subscriptions WHERE feed_url = ?", (feed_url,))
+        row = cursor.fetchone()
+    if row:
+        state, updated_at = row
+        if state == STATE_DENIED or state == STATE_ACTIVE:
+            # 有効な購読の期限切れは renew_expiring で更新する
+            return
+        if state == STATE_PENDING and time.time() - updated_at < PENDING_RETRY_SECONDS:
+            return
+    hub, topic = found
+    subscribe(feed_url, hub, topic, callback_url)
+
+
+def renew_expiring(callback_url: str, margin: int = DEFAULT_RENEW_MARGIN) -> int:
+    """期限切れが近い（または切れた）購読を更新し、更新を要求した件数を返す"""
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT feed_url, hub, topic FROM websub_subscriptions WHERE state = ? AND lease_expires < ?",
+            (STATE_ACTIVE, time.time() + margin)
+        )
+        rows = cursor.fetchall()
+    renewed = 0
+    for feed_url, hub, topic in rows:
+        if subscribe(feed_url, hub, topic, callback_url):
+            renewed += 1
+    return renewed
+
+
+def take_pushed(feed_url: str) -> Tuple[List[int], Any]:
+    """
+    フィードに配信された未処理の内容をまとめて解析し、(キューのID, 解析結果) を返す。
+    解析結果は feedparser.parse と同様に entries を持ち、各エントリの websub_queue_id に配信のIDを持つ。
+    処理が終わったら mark_handled と release_handled（またはまとめて mark_processed）でIDを処理済みにする。
+    """
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, body FROM websub_queue WHERE feed_url = ? AND processed_at IS NULL ORDER BY id",
+            (feed_url,)
+        )
+        rows = cursor.fetchall()
+
+    entries = []
+    for queue_id, body in rows:
+        for entry in feedparser.parse(body).entries:
+            entry["websub_queue_id"] = queue_id
+            entries.append(entry)
+    return [row[0] for row in rows], feedparser.FeedParserDict(entries=entries, feed={})
+
+
+def mark_processed(ids: List[int]):
+    """配信された内容を処理済みにする"""
+    if not ids:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE websub_queue SET processed_at = ? WHERE id = ?",
+            [(time.time(), queue_id) for queue_id in ids]
+        )
+        conn.commit()
+
+
+def mark_handled(account: str, ids: List[int]):
+    """アカウントが配信の全エントリを処理し終えた（処理済みとして登録した、または実行台帳に記録した）ことを記録する"""
+    if not ids:
+        return
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO websub_handled (queue_id, account) VALUES (?, ?)",
+            [(queue_id, account) for queue_id in ids]
+        )
+        conn.commit()
+
+
+def release_handled(accounts: List[Dict[str, Any]]) -> int:
+    """
+    フィードを購読する全アカウントが処理し終えた配信を処理済みにし、その件数を返す。
+    一部のアカウントが処理していない配信（上位K件に入らなかった記事、前回の実行を再開中のアカウント、
+    締め切りで処理しなかったアカウントなど）は、次回の実行でも読み直す。
+    PUSH_RETENTION_SECONDS を過ぎても処理されない配信は、処理済みにする。
+    """
+    now = time.time()
+    with sqlite3.connect(db_manager.DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, feed_url, received_at FROM websub_queue WHERE processed_at IS NULL")
+        rows = cursor.fetchall()
+        cursor.execute(
+            "SELECT queue_id, account FROM websub_handled WHERE queue_id IN "
+            "(SELECT id FROM websub_queue WHERE processed_at IS NULL)"
+        )
+        handled: Dict[int, Set[str]] = {}
+        for queue_id, account in cursor.fetchall():
+            handled.setdefault(queue_id, set()).add(account)
+
+        released = []
+        for queue_id, feed_url, received_at in rows:
+            subscribers = {account["name"] for account in accounts if feed_url in account["rss_urls"]}
+            if subscribers <= handled.get(queue_id, set()):
+                released.append(queue_id)
+            elif received_at < now - PUSH_RETENTION_SECONDS:
+                logger.warning(f"WebSubの配信が{PUSH_RETENTION_SECONDS}秒以内に処理されなかったため破棄します: {feed_url}")
+                released.append(queue_id)
+        cursor.executemany("UPDATE websub_queue SET processed_at = ? WHERE id = ?", [(now, i) for i in released])
+        cursor.executemany("DELETE FROM websub_handled WHERE queue_id = ?", [(i,) for i in released])
+        conn.commit()
+    return len(released)
+
+
+def verify_signature(secret: str, body: bytes, signature_header: Optional[str]) -> bool:
+    """X-Hub-Signature ヘッダー（"sha256=..." など）がシークレットによるHMACと一致するかを確認する"""
+    if not signature_header or "=" not in signature_header:
+        return False
+    method, signature = signature_header.split("=", 1)
+    if method not in ("sha1", "sha256", "sha384", "sha512"):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    """ハブからの購読確認（GET）と内容の配信（POST）を受け付けるハンドラー"""
+
+    def _feed_url(self) -> Optional[str]:
+        values = parse_qs(urlparse(self.path).query).get("feed")
+        return values[0] if values else None
+
+    def _load_subscription(self, feed_url: str) -> Optional[Tuple[str, str, str, Optional[float]]]:
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT topic, secret, state, requested_at FROM websub_subscriptions WHERE feed_url = ?",
+                (feed_url,)
+            )
+            return cursor.fetchone()
+
+    def _respond(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        feed_url = params.get("feed")
+        subscription = self._load_subscription(feed_url) if feed_url else None
+        mode = params.get("hub.mode")
+        if not subscription or params.get("hub.topic") != subscription[0]:
+            self._respond(404)
+            return
+        # 購読の解除は要求しないため、解除の確認要求には応答しない。
+        # 購読の確認・拒否も、確認待ちまたは更新中の購読要求に対するものだけを受け付ける
+        requested_at = subscription[3]
+        if mode == "unsubscribe" or (mode in ("subscribe", "denied") and requested_at is None):
+            logger.warning(f"要求していないWebSubの確認要求を拒否しました: {feed_url} (mode: {mode})")
+            self._respond(404)
+            return
+
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            if mode == "subscribe":
+                try:
+                    lease_seconds = int(params.get("hub.lease_seconds", DEFAULT_LEASE_SECONDS))
+                except ValueError:
+                    self._respond(400)
+                    return
+                if lease_seconds < 0:
+                    self._respond(400)
+                    return
+                lease_seconds = min(lease_seconds, MAX_LEASE_SECONDS)
+                cursor.execute(
+                    "UPDATE websub_subscriptions SET state = ?, lease_expires = ?, updated_at = ?, requested_at = NULL "
+                    "WHERE feed_url = ?",
+                    (STATE_ACTIVE, time.time() + lease_seconds, time.time(), feed_url)
+                )
+                logger.info(f"WebSubの購読が確認されました: {feed_url} (期間: {lease_seconds}秒)")
+            elif mode == "denied":
+                cursor.execute(
+                    "UPDATE websub_subscriptions SET state = ?, updated_at = ?, requested_at = NULL WHERE feed_url = ?",
+                    (STATE_DENIED, time.time(), feed_url)
+                )
+                logger.warning(f"WebSubの購読が拒否されました: {feed_url} ({params.get('hub.reason')})")
+                conn.commit()
+                self._respond(200)
+                return
+            else:
+                self._respond(400)
+                return
+            conn.commit()
+        self._respond(200, params.get("hub.challenge", "").encode("utf-8"))
+
+    def do_POST(self):
+        feed_url = self._feed_url()
+        subscription = self._load_subscription(feed_url) if feed_url else None
+        if not subscription:
+            self._respond(404)
+            return
+
+        # 本文の長さが分からない要求は、読み込む前に拒否する
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._respond(411)
+            return
+        if length < 0:
+            self._respond(400)
+            return
+        if length > MAX_BODY_SIZE:
+            self._respond(413)
+            return
+        body = self.rfile.read(length)
+
+        # 署名が一致しない配信は無視する（仕様上、ハブには2xxを返す）
+        if not verify_signature(subscription[1], body, self.headers.get("X-Hub-Signature")):
+            logger.warning(f"WebSubの配信の署名が一致しないため無視します: {feed_url}")
+            self._respond(202)
+            return
+
+        with sqlite3.connect(db_manager.DB_NAME) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO websub_queue (feed_url, body, received_at) VALUES (?, ?, ?)",
+                (feed_url, body, time.time())
+            )
+            conn.commit()
+        logger.info(f"WebSubの配信を受信しました: {feed_url} ({length}バイト)")
+        self._respond(202)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_callback_server(host: str, port: int) -> ThreadingHTTPServer:
+    """WebSubのコールバックを受け付けるHTTPサーバーを作成する"""
+    init_websub()
+    return ThreadingHTTPServer((host, port), CallbackHandler)
+
+
+def main():
+    """コールバックサーバーを起動する（python websub.py）"""
+    load_dotenv()
+    setup_logging()
+
+    host = os.getenv("WEBSUB_LISTEN_HOST", "0.0.0.0")
+    port = int(os.getenv("WEBSUB_LISTEN_PORT", "8080"))
+    server = make_callback_server(host, port)
+    logger.info(f"WebSubのコールバックサーバーを起動しました: {host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()